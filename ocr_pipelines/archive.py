@@ -0,0 +1,108 @@
+import logging
+import os
+import shutil
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+from ocr_pipelines.result_writer import get_tmp_fn, is_tmp_fn
+
+ARCHIVE_SUFFIX = ".zip"
+OCR_OUTPUT_SUFFIX = ".json.gz"
+
+logger = logging.getLogger(__name__)
+
+
+def get_archive_fn(ocr_output_dir: Path) -> Path:
+    """Returns the path of the archive packing the ocr outputs of `ocr_output_dir`"""
+    return ocr_output_dir.with_name(f"{ocr_output_dir.name}{ARCHIVE_SUFFIX}")
+
+
+def is_archive_fn(fn: Path) -> bool:
+    return fn.suffix == ARCHIVE_SUFFIX and not is_tmp_fn(fn)
+
+
+def get_archived_ocr_output_fns(archive_fn: Path) -> set[str]:
+    """Returns the file names of the ocr outputs packed in `archive_fn`"""
+    if not archive_fn.is_file():
+        return set()
+    with zipfile.ZipFile(archive_fn) as archive:
+        return set(archive.namelist())
+
+
+def pack_ocr_output_dir(ocr_output_dir: Path) -> Path:
+    """Pack the ocr outputs of an image group in a single zip archive.
+
+    The `.json.gz` ocr outputs are stored without compression, the zip central
+    directory gives random access to any page. The ocr outputs of a resumed run
+    are added to the existing archive. `ocr_output_dir` is removed once packed.
+
+    Args:
+        ocr_output_dir (Path): directory of the ocr outputs of an image group
+
+    Returns:
+        Path: path to the archive
+    """
+    archive_fn = get_archive_fn(ocr_output_dir)
+    tmp_archive_fn = get_tmp_fn(archive_fn)
+    # left over by an interrupted packing
+    tmp_archive_fn.unlink(missing_ok=True)
+    if archive_fn.is_file():
+        shutil.copyfile(archive_fn, tmp_archive_fn)
+    packed_fns = get_archived_ocr_output_fns(tmp_archive_fn)
+
+    ocr_output_fns = sorted(
+        fn
+        for fn in ocr_output_dir.glob(f"*{OCR_OUTPUT_SUFFIX}")
+        if fn.name not in packed_fns
+    )
+    with zipfile.ZipFile(
+        tmp_archive_fn, "a", compression=zipfile.ZIP_STORED
+    ) as archive:
+        for ocr_output_fn in ocr_output_fns:
+            archive.write(ocr_output_fn, arcname=ocr_output_fn.name)
+    os.replace(tmp_archive_fn, archive_fn)
+    shutil.rmtree(ocr_output_dir)
+    logger.info(f"packed {len(ocr_output_fns)} ocr outputs in {archive_fn}")
+    return archive_fn
+
+
+class OcrOutputArchiveReader:
+    """Random access to the ocr outputs packed in image group archives.
+
+    The archives are opened once and kept open.
+
+    Args:
+        ocr_outputs_path (Path): directory of the image group archives of a scan
+    """
+
+    def __init__(self, ocr_outputs_path: Path) -> None:
+        self.ocr_outputs_path = Path(ocr_outputs_path)
+        self._archives: dict[str, Optional[zipfile.ZipFile]] = {}
+
+    def get_archive(self, img_grp_folder_name: str) -> Optional[zipfile.ZipFile]:
+        if img_grp_folder_name not in self._archives:
+            archive_fn = (
+                self.ocr_outputs_path / f"{img_grp_folder_name}{ARCHIVE_SUFFIX}"
+            )
+            archive = zipfile.ZipFile(archive_fn) if archive_fn.is_file() else None
+            self._archives[img_grp_folder_name] = archive
+        return self._archives[img_grp_folder_name]
+
+    def read(self, img_grp_folder_name: str, ocr_output_fn: str) -> Optional[bytes]:
+        """Returns the gzipped ocr output `ocr_output_fn` of an image group,
+        None if the image group isn't packed or has no such ocr output.
+        """
+        archive = self.get_archive(img_grp_folder_name)
+        if archive is None:
+            return None
+        try:
+            return archive.read(ocr_output_fn)
+        except KeyError:
+            return None
+
+    def close(self):
+        for archive in self._archives.values():
+            if archive is not None:
+                archive.close()
+        self._archives.clear()
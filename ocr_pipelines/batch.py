@@ -0,0 +1,91 @@
+import logging
+import threading
+from typing import NamedTuple, Optional, Sequence
+
+from openpecha.buda import api as buda_api
+
+from ocr_pipelines.engines.hedging import HedgingPolicy
+
+
+def estimate_page_count(bdrc_scan_id: str) -> int:
+    """Returns the number of pages of the image groups of `bdrc_scan_id` listed
+    on BUDA, 0 if the scan info can't be fetched.
+    """
+    scan_info = buda_api.get_buda_scan_info(bdrc_scan_id)
+    if not scan_info:
+        return 0
+    return sum(
+        img_group.get("total_pages", 0)
+        for img_group in scan_info["image_groups"].values()
+    )
+
+
+class ScanImportResult(NamedTuple):
+    """Result of the import of a scan of a multi-scan run.
+
+    Args:
+        bdrc_scan_id (str): bdrc scan id
+        estimated_pages (int): number of pages the scan was scheduled with
+        elapsed (float): duration of the import in seconds
+        pecha (dict, optional): pecha id and pecha url of the imported scan
+        error (str, optional): error of the failed import
+    """
+
+    bdrc_scan_id: str
+    estimated_pages: int
+    elapsed: float
+    pecha: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class BatchImportReport:
+    """Results and failures of the imports of a multi-scan run.
+
+    Args:
+        n_scans (int): number of scans to import
+    """
+
+    def __init__(self, n_scans: int) -> None:
+        self.n_scans = n_scans
+        self.results: dict[str, ScanImportResult] = {}
+        # stats of the hedging policies of the shared ocr engine
+        self.hedging_stats: list[str] = []
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._lock = threading.Lock()
+
+    @property
+    def failed(self) -> dict[str, ScanImportResult]:
+        return {
+            scan_id: result
+            for scan_id, result in self.results.items()
+            if result.error is not None
+        }
+
+    def add(self, result: ScanImportResult):
+        if result.error is None:
+            self.logger.info(
+                f"imported {result.bdrc_scan_id} in {result.elapsed:.0f}s: "
+                f"{result.pecha}"
+            )
+        else:
+            self.logger.error(f"failed to import {result.bdrc_scan_id}: {result.error}")
+        with self._lock:
+            self.results[result.bdrc_scan_id] = result
+            self.logger.info(self.summary())
+
+    def add_hedging_stats(self, hedging_policies: Sequence[HedgingPolicy]):
+        for hedging in hedging_policies:
+            stats = hedging.get_stats()
+            self.logger.info(f"hedging: {stats}")
+            self.hedging_stats.append(stats)
+
+    def summary(self) -> str:
+        n_failed = len(self.failed)
+        return (
+            f"imported {len(self.results) - n_failed}/{self.n_scans} scans, "
+            f"{n_failed} failed"
+        )
+
+    def to_dict(self) -> dict:
+        """Serialize the results to a dictionary which is JSON serializable."""
+        return {scan_id: result._asdict() for scan_id, result in self.results.items()}
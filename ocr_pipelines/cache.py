@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class OcrResultCache:
+    """Content-addressed cache of gzipped ocr outputs stored on local disk.
+
+    An entry is keyed by the hash of the image bytes and the ocr settings which
+    change the output, so the same image ocred with the same settings is only
+    sent once to the ocr engine, whatever its scan or output dir.
+
+    The total size of the entries is bounded by `max_bytes`, the least recently
+    used entries are evicted first. The recency is kept in the modification time
+    of the entries so it survives restarts.
+
+    Args:
+        cache_dir (Path): directory of the cache entries
+        max_bytes (int): maximum total size of the entries
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._load_entries()
+
+    def _load_entries(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for entry_fn in self.cache_dir.glob("*/*.json.gz"):
+            stat = entry_fn.stat()
+            entries.append(
+                (stat.st_mtime, entry_fn.name[: -len(".json.gz")], stat.st_size)
+            )
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def get_key(
+        image_bytes: bytes,
+        ocr_engine: str,
+        model_type: str,
+        lang_hint: str,
+        *settings: str,
+    ) -> str:
+        """Returns the cache key of `image_bytes` ocred with the given settings.
+
+        `settings` are the other settings changing the ocr output, such as the
+        pruning of the response.
+        """
+        key = hashlib.sha256(image_bytes)
+        for setting in (ocr_engine, model_type, lang_hint, *settings):
+            key.update(b"\0" + (setting or "").encode())
+        return key.hexdigest()
+
+    def get_entry_fn(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the gzipped ocr output cached at `key`, None if not cached."""
+        entry_fn = self.get_entry_fn(key)
+        with self._lock:
+            # the entry may have been added or evicted by another process
+            # sharing the cache dir, so the disk is the source of truth
+            try:
+                data = entry_fn.read_bytes()
+            except FileNotFoundError:
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._total_bytes += len(data)
+            self._entries.move_to_end(key)
+            os.utime(entry_fn)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        """Cache the gzipped ocr output `data` at `key` and evict the least
+        recently used entries above `max_bytes`.
+        """
+        entry_fn = self.get_entry_fn(key)
+        entry_fn.parent.mkdir(exist_ok=True)
+        tmp_fn = entry_fn.with_name(f".{entry_fn.name}.{threading.get_ident()}.tmp")
+        tmp_fn.write_bytes(data)
+        os.replace(tmp_fn, entry_fn)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.get_entry_fn(key).unlink(missing_ok=True)
+            self._total_bytes -= size
+            self.logger.debug(f"evicted {key} from the ocr cache")
@@ -15,6 +15,16 @@ GOOGLE_VISION_PARSER_LINK = ""
 GOOGLE_HOCR_PARSER_LINK = ""
 NAMSEL_PARSER_LINK = ""
 BATCH_PREFIX = "batch"
+# maximum size of the images sent in a single ocr request
+OCR_BATCH_MAX_BYTES = 10 * 1000 * 1000
+# formats of the ocr outputs: one file per page or one archive per image group
+OCR_OUTPUT_FORMAT_FILES = "files"
+OCR_OUTPUT_FORMAT_ZIP = "zip"
+# maximum size of the ocr result cache
+OCR_CACHE_MAX_BYTES = 10 * 1000 * 1000 * 1000
+# size above which files are uploaded in parts, and size of the parts
+UPLOAD_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+UPLOAD_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
 
 # types
 Credentials = Union[dict, str]
@@ -31,9 +41,41 @@ class ImportConfig:
         *,
         model_type: str = "",
         lang_hint: str = "",
-        credentials: Optional[Credentials] = None,
+        credentials: Optional[Union[Credentials, list[Credentials]]] = None,
         images_path: Path = IMAGES_PATH,
         ocr_outputs_path: Path = OCR_OUTPUTS_PATH,
+        download_workers: int = 1,
+        conversion_processes: Optional[int] = 0,
+        streaming: bool = False,
+        in_memory_images: bool = False,
+        max_pages_in_flight: int = 32,
+        ocr_workers: int = 1,
+        ocr_batch_size: int = 1,
+        ocr_batch_max_bytes: int = OCR_BATCH_MAX_BYTES,
+        ocr_tiles_per_request: int = 1,
+        ocr_async: bool = False,
+        requests_per_minute: Optional[int] = None,
+        ocr_max_retries: int = 5,
+        ocr_credentials_cooldown: float = 60.0,
+        ocr_request_timeout: Optional[float] = None,
+        ocr_hedge_percentile: Optional[float] = None,
+        ocr_hedge_max_ratio: float = 0.05,
+        ocr_max_image_pixels: Optional[int] = None,
+        ocr_max_image_bytes: Optional[int] = None,
+        skip_blank_pages: bool = False,
+        skip_duplicate_pages: bool = False,
+        ocr_cache_path: Optional[Path] = None,
+        ocr_cache_max_bytes: int = OCR_CACHE_MAX_BYTES,
+        job_ledger_path: Optional[Path] = None,
+        job_lease_seconds: float = 600.0,
+        gzip_compresslevel: int = 9,
+        ocr_output_format: str = OCR_OUTPUT_FORMAT_FILES,
+        ocr_response_profile: str = "full",
+        upload_workers: int = 1,
+        upload_multipart_threshold: int = UPLOAD_MULTIPART_THRESHOLD,
+        upload_multipart_chunksize: int = UPLOAD_MULTIPART_CHUNKSIZE,
+        upload_sync: bool = False,
+        reserve_batch: bool = False,
     ) -> None:
         self.ocr_engine = ocr_engine
         self.model_type = model_type
@@ -41,6 +83,38 @@ class ImportConfig:
         self.credentials = credentials
         self.images_path = Path(images_path)
         self.ocr_outputs_path = Path(ocr_outputs_path)
+        self.download_workers = download_workers
+        self.conversion_processes = conversion_processes
+        self.streaming = streaming
+        self.in_memory_images = in_memory_images
+        self.max_pages_in_flight = max_pages_in_flight
+        self.ocr_workers = ocr_workers
+        self.ocr_batch_size = ocr_batch_size
+        self.ocr_batch_max_bytes = ocr_batch_max_bytes
+        self.ocr_tiles_per_request = ocr_tiles_per_request
+        self.ocr_async = ocr_async
+        self.requests_per_minute = requests_per_minute
+        self.ocr_max_retries = ocr_max_retries
+        self.ocr_credentials_cooldown = ocr_credentials_cooldown
+        self.ocr_request_timeout = ocr_request_timeout
+        self.ocr_hedge_percentile = ocr_hedge_percentile
+        self.ocr_hedge_max_ratio = ocr_hedge_max_ratio
+        self.ocr_max_image_pixels = ocr_max_image_pixels
+        self.ocr_max_image_bytes = ocr_max_image_bytes
+        self.skip_blank_pages = skip_blank_pages
+        self.skip_duplicate_pages = skip_duplicate_pages
+        self.ocr_cache_path = Path(ocr_cache_path) if ocr_cache_path else None
+        self.ocr_cache_max_bytes = ocr_cache_max_bytes
+        self.job_ledger_path = Path(job_ledger_path) if job_ledger_path else None
+        self.job_lease_seconds = job_lease_seconds
+        self.gzip_compresslevel = gzip_compresslevel
+        self.ocr_output_format = ocr_output_format
+        self.ocr_response_profile = ocr_response_profile
+        self.upload_workers = upload_workers
+        self.upload_multipart_threshold = upload_multipart_threshold
+        self.upload_multipart_chunksize = upload_multipart_chunksize
+        self.upload_sync = upload_sync
+        self.reserve_batch = reserve_batch
         self.version = ocr_pipelines_version
 
     def create_paths(self):
@@ -61,6 +135,40 @@ class ImportConfig:
             "credentials": self.credentials,
             "images_path": str(self.images_path),
             "ocr_outputs_path": str(self.ocr_outputs_path),
+            "download_workers": self.download_workers,
+            "conversion_processes": self.conversion_processes,
+            "streaming": self.streaming,
+            "in_memory_images": self.in_memory_images,
+            "max_pages_in_flight": self.max_pages_in_flight,
+            "ocr_workers": self.ocr_workers,
+            "ocr_batch_size": self.ocr_batch_size,
+            "ocr_batch_max_bytes": self.ocr_batch_max_bytes,
+            "ocr_tiles_per_request": self.ocr_tiles_per_request,
+            "ocr_async": self.ocr_async,
+            "requests_per_minute": self.requests_per_minute,
+            "ocr_max_retries": self.ocr_max_retries,
+            "ocr_credentials_cooldown": self.ocr_credentials_cooldown,
+            "ocr_request_timeout": self.ocr_request_timeout,
+            "ocr_hedge_percentile": self.ocr_hedge_percentile,
+            "ocr_hedge_max_ratio": self.ocr_hedge_max_ratio,
+            "ocr_max_image_pixels": self.ocr_max_image_pixels,
+            "ocr_max_image_bytes": self.ocr_max_image_bytes,
+            "skip_blank_pages": self.skip_blank_pages,
+            "skip_duplicate_pages": self.skip_duplicate_pages,
+            "ocr_cache_path": str(self.ocr_cache_path) if self.ocr_cache_path else None,
+            "ocr_cache_max_bytes": self.ocr_cache_max_bytes,
+            "job_ledger_path": (
+                str(self.job_ledger_path) if self.job_ledger_path else None
+            ),
+            "job_lease_seconds": self.job_lease_seconds,
+            "gzip_compresslevel": self.gzip_compresslevel,
+            "ocr_output_format": self.ocr_output_format,
+            "ocr_response_profile": self.ocr_response_profile,
+            "upload_workers": self.upload_workers,
+            "upload_multipart_threshold": self.upload_multipart_threshold,
+            "upload_multipart_chunksize": self.upload_multipart_chunksize,
+            "upload_sync": self.upload_sync,
+            "reserve_batch": self.reserve_batch,
         }
 
 
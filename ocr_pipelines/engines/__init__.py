@@ -3,3 +3,7 @@ from ocr_pipelines.engines.engine import register as register  # noqa: F401
 from ocr_pipelines.engines.google_vision import (  # noqa: F401
     GoogleVisionEngine as GoogleVisionEngine,
 )
+from ocr_pipelines.engines.tiling import (  # noqa: F401
+    TilingEngine as TilingEngine,
+)
+from ocr_pipelines.engines.pool import EnginePool as EnginePool  # noqa: F401
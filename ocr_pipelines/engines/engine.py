@@ -1,10 +1,14 @@
+import asyncio
+import json
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Union
+from typing import Sequence, Union
 
 ImagePath = Union[str, Path]
 ImageBytes = bytes
 ImageType = Union[ImagePath, ImageBytes]
+OcrBatchResult = list[Union[dict, Exception]]
+OcrBatchJsonResult = list[Union[str, Exception]]
 
 
 register = {}
@@ -21,3 +25,61 @@ class OcrEngine(ABC):
     @abstractmethod
     def ocr(self, image: ImageType) -> dict:
         raise NotImplementedError
+
+    async def aocr(self, image: ImageType) -> dict:
+        """Async counterpart of `ocr`.
+
+        Engines with an async client should override this method, by default
+        `ocr` runs in the default executor of the event loop.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: ocr response in dict
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.ocr, image)
+
+    def ocr_batch(self, images: Sequence[ImageType]) -> OcrBatchResult:
+        """Run OCR on several images.
+
+        Engines which support batched requests should override this method, by
+        default the images are ocred one by one.
+
+        Args:
+            images: file_paths or image bytes
+        Returns:
+            results: ocr response in dict for each image, in the same order. The
+                exception is returned in place of the response of a failed image.
+        """
+        results: OcrBatchResult = []
+        for image in images:
+            try:
+                results.append(self.ocr(image))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def ocr_json(self, image: ImageType) -> str:
+        """Run OCR on a single image and return the response serialized to JSON.
+
+        Engines which get JSON responses should override this method to skip
+        building the response dict, by default `ocr` response is serialized.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: ocr response in JSON
+        """
+        return json.dumps(self.ocr(image))
+
+    async def aocr_json(self, image: ImageType) -> str:
+        """Async counterpart of `ocr_json`."""
+        return json.dumps(await self.aocr(image))
+
+    def ocr_batch_json(self, images: Sequence[ImageType]) -> OcrBatchJsonResult:
+        """Counterpart of `ocr_batch` returning the responses serialized to JSON."""
+        return [
+            result if isinstance(result, Exception) else json.dumps(result)
+            for result in self.ocr_batch(images)
+        ]
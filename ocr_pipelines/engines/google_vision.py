@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 from pathlib import Path
+from typing import Awaitable, Callable, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 from google.api_core import exceptions as gcloud_exceptions
 from google.cloud import vision
@@ -8,15 +10,35 @@ from google.cloud.vision import AnnotateImageResponse
 from google.oauth2.service_account import Credentials
 
 from ocr_pipelines.engines import OcrEngine
-from ocr_pipelines.engines.engine import ImageBytes, ImageType
-from ocr_pipelines.exceptions import GoogleVisionCredentialsError
+from ocr_pipelines.engines.engine import (
+    ImageBytes,
+    ImageType,
+    OcrBatchJsonResult,
+    OcrBatchResult,
+)
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+from ocr_pipelines.exceptions import (
+    GoogleVisionCredentialsError,
+    GoogleVisionEngineError,
+)
 
 GoogleVisionFeatures = list[dict]
+AnnotateBatchResult = list[Union[AnnotateImageResponse, Exception]]
+R = TypeVar("R")
 
 
 class GoogleVisionEngine(OcrEngine):
     # TODO: remove dirs
 
+    # maximum number of images in a `batch_annotate_images` request
+    MAX_BATCH_SIZE = 16
+    # errors raised when the quota of the project is exceeded
+    QUOTA_ERRORS: Tuple[Type[Exception], ...] = (
+        gcloud_exceptions.ResourceExhausted,
+        gcloud_exceptions.TooManyRequests,
+    )
+
     def __init__(
         self,
         credentials: dict,
@@ -24,16 +46,101 @@ class GoogleVisionEngine(OcrEngine):
         lang_hint: str = None,
         image_download_dir: Path = Path.home(),
         ocr_outputs_path: Path = Path.home(),
+        rate_limiter: Optional[RateLimiter] = None,
+        request_timeout: Optional[float] = None,
+        hedging: Optional[HedgingPolicy] = None,
     ) -> None:
         self.model_type = model_type
         self.lang_hint = lang_hint
         self.image_download_dir = image_download_dir
         self.ocr_outputs_path = ocr_outputs_path
+        self.rate_limiter = rate_limiter
+        self.request_timeout = request_timeout
+        self.hedging = hedging
 
         self.credentials = Credentials.from_service_account_info(credentials)
         self.vision_client = vision.ImageAnnotatorClient(credentials=self.credentials)
+        self._async_vision_client: Optional[vision.ImageAnnotatorAsyncClient] = None
+        self._async_vision_client_loop: Optional[asyncio.AbstractEventLoop] = None
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
+    @property
+    def async_vision_client(self) -> vision.ImageAnnotatorAsyncClient:
+        """Async vision client bound to the running event loop.
+
+        grpc.aio channels can't be shared between event loops, a new client is
+        created when the engine is used from another loop.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._async_vision_client is None
+            or self._async_vision_client_loop is not loop
+        ):
+            self._async_vision_client = vision.ImageAnnotatorAsyncClient(
+                credentials=self.credentials
+            )
+            self._async_vision_client_loop = loop
+        return self._async_vision_client
+
+    def call_with_rate_limit(
+        self, fn: Callable[..., R], *args, cost: int = 1, **kwargs
+    ) -> R:
+        """Call the vision client method `fn` through `rate_limiter`, if any.
+
+        The request is cancelled after `request_timeout` seconds and hedged by
+        `hedging`, if set. A hedge doesn't wait for a slot of `rate_limiter`, it
+        is only sent if the quota allows it right away.
+
+        Args:
+            fn: vision client method sending the request
+            cost (int): number of images in the request
+        """
+        if self.request_timeout is not None:
+            kwargs["timeout"] = self.request_timeout
+
+        def request() -> R:
+            return fn(*args, **kwargs)
+
+        if self.rate_limiter is None:
+            if self.hedging is None:
+                return request()
+            return self.hedging.call(request)
+        rate_limiter = self.rate_limiter
+        if self.hedging is None:
+            return rate_limiter.call(request, cost=cost)
+
+        def send(timed_request: Callable[[], R]) -> R:
+            return rate_limiter.call(timed_request, cost=cost)
+
+        return self.hedging.call(
+            request, send=send, can_hedge=lambda: rate_limiter.try_reserve(cost)
+        )
+
+    async def acall_with_rate_limit(
+        self, fn: Callable[..., Awaitable[R]], *args, cost: int = 1, **kwargs
+    ) -> R:
+        """Async counterpart of `call_with_rate_limit`."""
+        if self.request_timeout is not None:
+            kwargs["timeout"] = self.request_timeout
+
+        async def request() -> R:
+            return await fn(*args, **kwargs)
+
+        if self.rate_limiter is None:
+            if self.hedging is None:
+                return await request()
+            return await self.hedging.acall(request)
+        rate_limiter = self.rate_limiter
+        if self.hedging is None:
+            return await rate_limiter.acall(request, cost=cost)
+
+        async def asend(timed_request: Callable[[], Awaitable[R]]) -> R:
+            return await rate_limiter.acall(timed_request, cost=cost)
+
+        return await self.hedging.acall(
+            request, send=asend, can_hedge=lambda: rate_limiter.try_reserve(cost)
+        )
+
     @staticmethod
     def load_image_bytes(image: ImageType) -> ImageBytes:
         """Load image bytes from image path or image bytes.
@@ -78,6 +185,51 @@ class GoogleVisionEngine(OcrEngine):
         response_json = AnnotateImageResponse.to_json(response)
         return json.loads(response_json)
 
+    @staticmethod
+    def response_to_json(response: AnnotateImageResponse) -> str:
+        """Serialize `response` to compact JSON.
+
+        The output is the same as `json.dumps(response_to_dict(response))`
+        without building the response dict and serializing it twice.
+        """
+        return AnnotateImageResponse.to_json(response, indent=None)
+
+    def get_request(self, image_bytes: ImageBytes) -> vision.AnnotateImageRequest:
+        return vision.AnnotateImageRequest(
+            image=vision.Image(content=image_bytes),
+            features=self.features,
+            image_context=self.image_context,
+        )
+
+    def annotate(self, image: ImageType) -> AnnotateImageResponse:
+        """Send a single image to Google Vision.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: Google Vision response
+        """
+
+        image_bytes = self.load_image_bytes(image)
+
+        try:
+            response = self.call_with_rate_limit(
+                self.vision_client.annotate_image, self.get_request(image_bytes)
+            )
+        except gcloud_exceptions.PermissionDenied as e:
+            raise GoogleVisionCredentialsError(
+                "Cannot access Google OCR. "
+                "Please check your credentials, make sure both Google Vision API and Billing are enabled"
+            ) from e
+        except gcloud_exceptions.ClientError as e:
+            self.logger.exception(e)
+            raise e
+        except Exception as e:
+            self.logger.exception(e)
+            raise e
+
+        return response
+
     def ocr(self, image: ImageType) -> dict:
         """Run OCR on a single image.
 
@@ -86,30 +238,156 @@ class GoogleVisionEngine(OcrEngine):
         Returns:
             response: ocr response in dict
         """
+        return self.response_to_dict(self.annotate(image))
+
+    def ocr_json(self, image: ImageType) -> str:
+        """Run OCR on a single image.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: ocr response in JSON
+        """
+        return self.response_to_json(self.annotate(image))
 
+    async def aannotate(self, image: ImageType) -> AnnotateImageResponse:
+        """Send a single image to Google Vision with the async vision client.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: Google Vision response
+        """
         image_bytes = self.load_image_bytes(image)
-        ocr_image = vision.Image(content=image_bytes)
 
         try:
-            response = self.vision_client.annotate_image(
-                {
-                    "image": ocr_image,
-                    "features": self.features,
-                    "image_context": self.image_context,
-                }
+            batch_response = await self.acall_with_rate_limit(
+                self.async_vision_client.batch_annotate_images,
+                requests=[self.get_request(image_bytes)],
             )
         except gcloud_exceptions.PermissionDenied as e:
             raise GoogleVisionCredentialsError(
                 "Cannot access Google OCR. "
                 "Please check your credentials, make sure both Google Vision API and Billing are enabled"
             ) from e
-        except gcloud_exceptions.ClientError as e:
+        except Exception as e:
             self.logger.exception(e)
             raise e
+
+        response = batch_response.responses[0]
+        if response.error.code:
+            raise GoogleVisionEngineError(
+                f"Google Vision failed to ocr the image: {response.error.message}"
+            )
+        return response
+
+    async def aocr(self, image: ImageType) -> dict:
+        """Run OCR on a single image with the async vision client.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: ocr response in dict
+        """
+        return self.response_to_dict(await self.aannotate(image))
+
+    async def aocr_json(self, image: ImageType) -> str:
+        """Run OCR on a single image with the async vision client.
+
+        Args:
+            image: file_path or image bytes
+        Returns:
+            response: ocr response in JSON
+        """
+        return self.response_to_json(await self.aannotate(image))
+
+    def annotate_batch(self, images: Sequence[ImageType]) -> AnnotateBatchResult:
+        """Send several images to Google Vision with `batch_annotate_images`.
+
+        Images are sent by requests of at most `MAX_BATCH_SIZE` images.
+
+        Args:
+            images: file_paths or image bytes
+        Returns:
+            results: Google Vision response for each image, in the same order.
+                The exception is returned in place of the response of a failed
+                image.
+        """
+        results: AnnotateBatchResult = []
+        for batch_start in range(0, len(images), self.MAX_BATCH_SIZE):
+            batch_end = batch_start + self.MAX_BATCH_SIZE
+            results.extend(self._annotate_batch(images[batch_start:batch_end]))
+        return results
+
+    def _annotate_batch(self, images: Sequence[ImageType]) -> AnnotateBatchResult:
+        results: AnnotateBatchResult = []
+        requests = []
+        request_idxs = []
+        for image in images:
+            try:
+                image_bytes = self.load_image_bytes(image)
+            except Exception as e:
+                self.logger.exception(e)
+                results.append(e)
+                continue
+            request_idxs.append(len(results))
+            requests.append(self.get_request(image_bytes))
+            results.append(AnnotateImageResponse())
+
+        if not requests:
+            return results
+
+        try:
+            batch_response = self.call_with_rate_limit(
+                self.vision_client.batch_annotate_images,
+                requests=requests,
+                cost=len(requests),
+            )
+        except gcloud_exceptions.PermissionDenied as e:
+            raise GoogleVisionCredentialsError(
+                "Cannot access Google OCR. "
+                "Please check your credentials, make sure both Google Vision API and Billing are enabled"
+            ) from e
         except Exception as e:
             self.logger.exception(e)
             raise e
 
-        response_dict = self.response_to_dict(response)
+        for idx, response in zip(request_idxs, batch_response.responses):
+            if response.error.code:
+                error = GoogleVisionEngineError(
+                    f"Google Vision failed to ocr image {idx} of the batch: "
+                    f"{response.error.message}"
+                )
+                self.logger.error(error)
+                results[idx] = error
+            else:
+                results[idx] = response
+        return results
 
-        return response_dict
+    def ocr_batch(self, images: Sequence[ImageType]) -> OcrBatchResult:
+        """Run OCR on several images with `batch_annotate_images`.
+
+        Args:
+            images: file_paths or image bytes
+        Returns:
+            results: ocr response in dict for each image, in the same order. The
+                exception is returned in place of the response of a failed image.
+        """
+        return [
+            result if isinstance(result, Exception) else self.response_to_dict(result)
+            for result in self.annotate_batch(images)
+        ]
+
+    def ocr_batch_json(self, images: Sequence[ImageType]) -> OcrBatchJsonResult:
+        """Run OCR on several images with `batch_annotate_images`.
+
+        Args:
+            images: file_paths or image bytes
+        Returns:
+            results: ocr response in JSON for each image, in the same order. The
+                exception is returned in place of the response of a failed image.
+        """
+        return [
+            result if isinstance(result, Exception) else self.response_to_json(result)
+            for result in self.annotate_batch(images)
+        ]
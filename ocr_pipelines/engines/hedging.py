@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Optional, TypeVar
+
+R = TypeVar("R")
+
+
+Send = Callable[[Callable[[], R]], R]
+ASend = Callable[[Callable[[], Awaitable[R]]], Awaitable[R]]
+
+
+class HedgingPolicy:
+    """Send a duplicate of the requests which are slower than usual.
+
+    A request still running after the `percentile` latency of the last `window`
+    requests is sent again, and the first response is used. At most
+    `max_extra_ratio` extra requests are sent per request, at most `max_hedges`
+    are in flight, and none before `min_samples` latencies are known.
+
+    A request is usually sent through a rate limiter, its latency and hedging
+    delay are measured from the moment it leaves the limiter. The duplicate
+    request isn't sent through the limiter, it would wait for the slot held by
+    the slow request, it is only sent if `can_hedge` takes its quota at once.
+
+    Args:
+        percentile (float): latency percentile after which a request is hedged,
+            between 0 and 1.
+        max_extra_ratio (float): maximum ratio of hedged requests
+        window (int): number of latest latencies the percentile is taken from
+        min_samples (int): number of latencies known before hedging
+        max_workers (int): maximum number of requests in flight, hedges included
+        max_hedges (int): maximum number of hedges in flight
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_extra_ratio: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20,
+        max_workers: int = 8,
+        max_hedges: int = 2,
+    ) -> None:
+        if not 0 < percentile < 1:
+            raise ValueError(f"hedging percentile must be in ]0, 1[, got {percentile}")
+        self.percentile = percentile
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.max_hedges = max_hedges
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self.n_requests = 0
+        self.n_hedged = 0
+        self.n_hedge_wins = 0
+        self._hedges_in_flight = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="ocr-hedging"
+                )
+            return self._executor
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def get_delay(self) -> Optional[float]:
+        """Returns the seconds after which a request is hedged, None until
+        `min_samples` latencies are known.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[math.ceil(self.percentile * len(latencies)) - 1]
+
+    def start_request(self) -> Optional[float]:
+        """Count a new request and returns its hedging delay."""
+        delay = self.get_delay()
+        with self._lock:
+            self.n_requests += 1
+        return delay
+
+    def try_hedge(self, can_hedge: Optional[Callable[[], bool]] = None) -> bool:
+        """Take an extra request from the budget, False if it is spent, too many
+        hedges are in flight or `can_hedge` returns False.
+        """
+        with self._lock:
+            if self.n_hedged + 1 > self.max_extra_ratio * self.n_requests:
+                return False
+            if self._hedges_in_flight >= self.max_hedges:
+                return False
+            if can_hedge is not None and not can_hedge():
+                return False
+            self.n_hedged += 1
+            self._hedges_in_flight += 1
+            return True
+
+    def finish_hedge(self):
+        with self._lock:
+            self._hedges_in_flight -= 1
+
+    def count_win(self, hedge_won: bool):
+        if hedge_won:
+            with self._lock:
+                self.n_hedge_wins += 1
+
+    def timed(
+        self, request: Callable[[], R], sent: Optional[threading.Event] = None
+    ) -> Callable[[], R]:
+        """Wrap `request` to set `sent` when it starts and record its latency
+        when it succeeds.
+        """
+
+        def timed_request() -> R:
+            if sent is not None:
+                sent.set()
+            start = time.monotonic()
+            result = request()
+            self.record(time.monotonic() - start)
+            return result
+
+        return timed_request
+
+    def call(
+        self,
+        request: Callable[[], R],
+        send: Optional[Send[R]] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> R:
+        """Send `request` with `send`, and send it again directly if it is slower
+        than the hedging delay.
+
+        The slower request isn't cancelled once it is sent, its response is
+        dropped. A hedge which isn't sent yet when the request succeeds is
+        dropped.
+
+        Args:
+            request: sends the request
+            send: sends `request` through the rate limiter, `request` is called
+                directly if None.
+            can_hedge: takes the quota of a hedge, False if there is none left
+
+        Returns:
+            the result of the first successful request
+        """
+        if send is None:
+            send = call_request
+        delay = self.start_request()
+        if delay is None:
+            return send(self.timed(request))
+
+        executor = self.get_executor()
+        sent = threading.Event()
+        primary = executor.submit(send, self.timed(request, sent))
+        primary.add_done_callback(lambda _: sent.set())
+        # the hedging delay starts once the request leaves the rate limiter
+        sent.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.try_hedge(can_hedge):
+            return primary.result()
+
+        self.logger.debug(f"hedging a request slower than {delay:.2f}s")
+        timed_request = self.timed(request)
+
+        def send_hedge() -> Optional[R]:
+            if primary.done() and primary.exception() is None:
+                return None
+            return timed_request()
+
+        hedge: Future = executor.submit(send_hedge)
+        hedge.add_done_callback(lambda _: self.finish_hedge())
+        pending: set[Future] = {primary, hedge}
+        try:
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # the primary first, a dropped hedge returns None
+                succeeded = [
+                    future
+                    for future in (primary, hedge)
+                    if future in done and future.exception() is None
+                ]
+                if succeeded or not pending:
+                    # the error of a request is raised once both requests failed
+                    future = succeeded[0] if succeeded else done.pop()
+                    self.count_win(future is hedge and bool(succeeded))
+                    return future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def acall(
+        self,
+        request: Callable[[], Awaitable[R]],
+        send: Optional[ASend[R]] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> R:
+        """Async counterpart of `call`, the slower request is cancelled."""
+        if send is None:
+            send = acall_request
+        delay = self.start_request()
+        sent = asyncio.Event()
+
+        def timed_request(set_sent: bool) -> Callable[[], Awaitable[R]]:
+            async def send_request() -> R:
+                if set_sent:
+                    sent.set()
+                start = time.monotonic()
+                result = await request()
+                self.record(time.monotonic() - start)
+                return result
+
+            return send_request
+
+        if delay is None:
+            return await send(timed_request(True))
+        primary: asyncio.Future = asyncio.ensure_future(send(timed_request(True)))
+        sent_waiter = asyncio.ensure_future(sent.wait())
+        # the hedging delay starts once the request leaves the rate limiter
+        await asyncio.wait([primary, sent_waiter], return_when=asyncio.FIRST_COMPLETED)
+        sent_waiter.cancel()
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not self.try_hedge(can_hedge):
+            return await primary
+
+        self.logger.debug(f"hedging a request slower than {delay:.2f}s")
+        hedge: asyncio.Future = asyncio.ensure_future(timed_request(False)())
+        hedge.add_done_callback(lambda _: self.finish_hedge())
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [
+                    task
+                    for task in (primary, hedge)
+                    if task in done and task.exception() is None
+                ]
+                if succeeded or not pending:
+                    task = succeeded[0] if succeeded else done.pop()
+                    self.count_win(task is hedge and bool(succeeded))
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> str:
+        return (
+            f"{self.n_hedged} of {self.n_requests} requests hedged, "
+            f"{self.n_hedge_wins} hedges answered first"
+        )
+
+
+def call_request(request: Callable[[], R]) -> R:
+    return request()
+
+
+async def acall_request(request: Callable[[], Awaitable[R]]) -> R:
+    return await request()
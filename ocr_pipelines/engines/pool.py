@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Optional, Sequence
+
+from ocr_pipelines.engines.engine import (
+    ImageType,
+    OcrBatchJsonResult,
+    OcrBatchResult,
+    OcrEngine,
+)
+from ocr_pipelines.engines.google_vision import GoogleVisionEngine
+from ocr_pipelines.exceptions import GoogleVisionCredentialsError
+
+# weight of the latest request in the latency average of an engine
+LATENCY_SMOOTHING = 0.2
+
+
+class PooledEngine:
+    """State of an engine of an `EnginePool`."""
+
+    def __init__(self, engine: OcrEngine, name: str) -> None:
+        self.engine = engine
+        self.name = name
+        self.latency = 0.0
+        self.in_flight = 0
+        self.available_at = 0.0
+        self.denied = False
+
+    def get_expected_delay(self, cost: int) -> float:
+        """Returns the expected seconds until a request of `cost` images sent to
+        the engine now completes.
+        """
+        rate_limiter = getattr(self.engine, "rate_limiter", None)
+        wait = rate_limiter.get_wait(cost) if rate_limiter is not None else 0.0
+        concurrency = rate_limiter.concurrency_limit if rate_limiter else 1.0
+        return wait + self.latency * (1 + self.in_flight / max(1.0, concurrency))
+
+
+class EnginePool(OcrEngine):
+    """Spread the requests over several engines, each with its own quota.
+
+    Each request goes to the engine expected to complete it first, from the
+    tokens left in its rate limiter, its requests in flight and its average
+    latency. An engine exceeding its quota or whose credentials are denied is
+    dropped for `cooldown` seconds and the request is retried on another
+    engine, at most `max_retries` times. The engines should not retry the quota
+    errors themselves.
+
+    Args:
+        engines (list[OcrEngine]): engines of different credentials
+        cooldown (float): seconds an engine is dropped for after a quota error
+        max_retries (int): number of retries of a request on other engines
+    """
+
+    # errors after which an engine is dropped for a while
+    COOLDOWN_ERRORS = GoogleVisionEngine.QUOTA_ERRORS + (GoogleVisionCredentialsError,)
+
+    def __init__(
+        self, engines: Sequence[OcrEngine], cooldown: float = 60.0, max_retries: int = 5
+    ) -> None:
+        if not engines:
+            raise ValueError("an engine pool needs at least one engine")
+        self.engines = [
+            PooledEngine(engine, name=f"engine {idx}")
+            for idx, engine in enumerate(engines)
+        ]
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self._next_idx = 0
+        self._lock = threading.Lock()
+
+    def pick_engine(self, cost: int) -> tuple[Optional[PooledEngine], float]:
+        """Take the available engine expected to complete a request of `cost`
+        images first, engines of equal delay are taken in turn.
+
+        Returns:
+            tuple: the engine, None if all the engines are dropped, and the
+                seconds until the first dropped engine is back.
+
+        Raises:
+            GoogleVisionCredentialsError: if the credentials of all the engines
+                are denied
+        """
+        with self._lock:
+            if all(pooled.denied for pooled in self.engines):
+                raise GoogleVisionCredentialsError(
+                    "the credentials of all the engines of the pool are denied"
+                )
+            now = time.monotonic()
+            n_engines = len(self.engines)
+            engines = [
+                self.engines[(self._next_idx + offset) % n_engines]
+                for offset in range(n_engines)
+            ]
+            available = [pooled for pooled in engines if pooled.available_at <= now]
+            if not available:
+                return None, min(pooled.available_at for pooled in engines) - now
+            pooled = min(available, key=lambda pooled: pooled.get_expected_delay(cost))
+            pooled.in_flight += 1
+            self._next_idx = (self.engines.index(pooled) + 1) % n_engines
+            return pooled, 0.0
+
+    def release_engine(
+        self,
+        pooled: PooledEngine,
+        latency: Optional[float] = None,
+        error: Optional[Exception] = None,
+    ):
+        """Release `pooled` after a request of `latency` seconds, or drop it for
+        `cooldown` seconds if the request failed with `error`.
+        """
+        with self._lock:
+            pooled.in_flight -= 1
+            if error is not None:
+                pooled.available_at = time.monotonic() + self.cooldown
+                pooled.denied = isinstance(error, GoogleVisionCredentialsError)
+                self.logger.warning(
+                    f"{pooled.name} dropped for {self.cooldown}s: {error!r}"
+                )
+            elif latency is not None:
+                pooled.denied = False
+                pooled.latency += LATENCY_SMOOTHING * (latency - pooled.latency)
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            self.logger.error(
+                f"no engine of the pool succeeded after {attempt + 1} attempts"
+            )
+            return False
+        return True
+
+    def call(self, method: str, *args, cost: int = 1) -> Any:
+        """Call `method` of the engines of the pool until one succeeds.
+
+        Args:
+            method (str): name of the engine method
+            cost (int): number of images of the request
+        """
+        attempt = 0
+        while True:
+            pooled, wait = self.pick_engine(cost)
+            if pooled is None:
+                time.sleep(wait)
+                continue
+            start = time.monotonic()
+            try:
+                result = getattr(pooled.engine, method)(*args)
+            except self.COOLDOWN_ERRORS as e:
+                self.release_engine(pooled, error=e)
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                self.release_engine(pooled)
+                raise
+            self.release_engine(pooled, latency=time.monotonic() - start)
+            return result
+
+    async def acall(self, method: str, *args, cost: int = 1) -> Any:
+        """Async counterpart of `call`."""
+        attempt = 0
+        while True:
+            pooled, wait = self.pick_engine(cost)
+            if pooled is None:
+                await asyncio.sleep(wait)
+                continue
+            start = time.monotonic()
+            try:
+                result = await getattr(pooled.engine, method)(*args)
+            except self.COOLDOWN_ERRORS as e:
+                self.release_engine(pooled, error=e)
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                self.release_engine(pooled)
+                raise
+            self.release_engine(pooled, latency=time.monotonic() - start)
+            return result
+
+    def ocr(self, image: ImageType) -> dict:
+        return self.call("ocr", image)
+
+    async def aocr(self, image: ImageType) -> dict:
+        return await self.acall("aocr", image)
+
+    def ocr_json(self, image: ImageType) -> str:
+        return self.call("ocr_json", image)
+
+    async def aocr_json(self, image: ImageType) -> str:
+        return await self.acall("aocr_json", image)
+
+    def ocr_batch(self, images: Sequence[ImageType]) -> OcrBatchResult:
+        return self.call("ocr_batch", images, cost=len(images))
+
+    def ocr_batch_json(self, images: Sequence[ImageType]) -> OcrBatchJsonResult:
+        return self.call("ocr_batch_json", images, cost=len(images))
@@ -0,0 +1,199 @@
+import json
+import unicodedata
+from typing import Any, Callable, Optional, Sequence
+
+from openpecha.formatters.ocr.ocr import UNICODE_CHARCAT_FOR_WIDTH
+
+from ocr_pipelines.engines.engine import ImageType, OcrBatchResult, OcrEngine
+
+# the response as returned by google vision
+RESPONSE_PROFILE_FULL = "full"
+# the word level: the words and the blocks and paragraphs with their boxes and
+# confidences, the symbols only keep the boxes the parser measures, see
+# `prune_symbol`
+RESPONSE_PROFILE_WORD = "word"
+# only what the parser reads: the text, the word boxes and confidences, and the
+# boxes of the symbols whose width is measured, see `prune_symbol`
+RESPONSE_PROFILE_TEXT = "text"
+RESPONSE_PROFILES = (
+    RESPONSE_PROFILE_FULL,
+    RESPONSE_PROFILE_WORD,
+    RESPONSE_PROFILE_TEXT,
+)
+
+Fields = dict[str, Optional[Callable[[Any], Any]]]
+
+
+def check_profile(profile: str):
+    if profile not in RESPONSE_PROFILES:
+        raise ValueError(
+            f"unknown response profile `{profile}`, expected one of {RESPONSE_PROFILES}"
+        )
+
+
+def prune_box(box: Optional[dict]) -> Optional[dict]:
+    if not box or not box.get("vertices"):
+        return None
+    return {"vertices": box["vertices"]}
+
+
+def prune_fields(annotation: dict, fields: Fields) -> dict:
+    """Returns the non-empty `fields` of `annotation`, pruned by their function."""
+    pruned = {}
+    for field, prune_fn in fields.items():
+        value = annotation.get(field)
+        if prune_fn is not None and value is not None:
+            value = prune_fn(value)
+        if value not in (None, [], {}, ""):
+            pruned[field] = value
+    return pruned
+
+
+def prune_property(symbol_property: Optional[dict]) -> Optional[dict]:
+    """Keep the detected break of a symbol, the parser reads its spaces."""
+    if not symbol_property or not symbol_property.get("detectedBreak"):
+        return None
+    return {"detectedBreak": symbol_property["detectedBreak"]}
+
+
+def is_width_measured(symbol: dict) -> bool:
+    """True if the parser measures the width of `symbol` to find the spaces."""
+    text = symbol.get("text")
+    if not text:
+        return False
+    return unicodedata.category(text[0]) in UNICODE_CHARCAT_FOR_WIDTH
+
+
+def prune_symbol(symbol: dict) -> dict:
+    """Keep the text and the break of `symbol`, and its box if the parser
+    measures its width.
+
+    The measured symbols are the ones in `UNICODE_CHARCAT_FOR_WIDTH`, which
+    includes the Tibetan letters ('Lo'), so nearly every Tibetan symbol keeps
+    its box.
+    """
+    pruned = prune_fields(symbol, {"text": None, "property": prune_property})
+    if is_width_measured(symbol):
+        box = prune_box(symbol.get("boundingBox"))
+        if box is not None:
+            pruned["boundingBox"] = box
+    return pruned
+
+
+def prune_word(word: dict) -> dict:
+    return prune_fields(
+        word,
+        {
+            "boundingBox": prune_box,
+            "symbols": lambda symbols: [prune_symbol(symbol) for symbol in symbols],
+            "confidence": None,
+        },
+    )
+
+
+def prune_paragraph(paragraph: dict, profile: str) -> dict:
+    fields: Fields = {
+        "words": lambda words: [prune_word(word) for word in words],
+    }
+    if profile == RESPONSE_PROFILE_WORD:
+        fields = {"boundingBox": prune_box, **fields, "confidence": None}
+    return prune_fields(paragraph, fields)
+
+
+def prune_block(block: dict, profile: str) -> dict:
+    fields: Fields = {
+        "paragraphs": lambda paragraphs: [
+            prune_paragraph(paragraph, profile) for paragraph in paragraphs
+        ],
+    }
+    if profile == RESPONSE_PROFILE_WORD:
+        fields = {
+            "boundingBox": prune_box,
+            **fields,
+            "blockType": None,
+            "confidence": None,
+        }
+    return prune_fields(block, fields)
+
+
+def prune_page(page: dict, profile: str) -> dict:
+    return prune_fields(
+        page,
+        {
+            "width": None,
+            "height": None,
+            "blocks": lambda blocks: [prune_block(block, profile) for block in blocks],
+        },
+    )
+
+
+def prune_response(response: dict, profile: str) -> dict:
+    """Drop the fields of the google vision `response` not kept by `profile`.
+
+    The pruned response is still read by the parser: the per-page text
+    annotation is kept with the words of the full text annotation, their boxes
+    and their symbols.
+
+    Raises:
+        ValueError: if `profile` isn't one of `RESPONSE_PROFILES`
+    """
+    check_profile(profile)
+    if profile == RESPONSE_PROFILE_FULL:
+        return response
+
+    pruned: dict = {}
+    text_annotations = response.get("textAnnotations")
+    if text_annotations:
+        pruned["textAnnotations"] = [
+            prune_fields(
+                text_annotations[0],
+                {"locale": None, "description": None, "boundingPoly": prune_box},
+            )
+        ]
+    full_text_annotation = response.get("fullTextAnnotation")
+    if full_text_annotation:
+        pruned["fullTextAnnotation"] = {
+            "pages": [
+                prune_page(page, profile)
+                for page in full_text_annotation.get("pages", [])
+            ],
+            "text": full_text_annotation.get("text", ""),
+        }
+    return pruned
+
+
+class ResponsePruningEngine(OcrEngine):
+    """Prune the google vision responses of `engine` to `profile` before they
+    are serialized.
+
+    Args:
+        engine (OcrEngine): engine of google vision responses
+        profile (str): one of `RESPONSE_PROFILES`
+    """
+
+    def __init__(self, engine: OcrEngine, profile: str) -> None:
+        check_profile(profile)
+        self.engine = engine
+        self.profile = profile
+
+    def ocr(self, image: ImageType) -> dict:
+        return prune_response(self.engine.ocr(image), self.profile)
+
+    async def aocr(self, image: ImageType) -> dict:
+        return prune_response(await self.engine.aocr(image), self.profile)
+
+    def ocr_json(self, image: ImageType) -> str:
+        return json.dumps(self.ocr(image))
+
+    async def aocr_json(self, image: ImageType) -> str:
+        return json.dumps(await self.aocr(image))
+
+    def ocr_batch(self, images: Sequence[ImageType]) -> OcrBatchResult:
+        return [
+            (
+                result
+                if isinstance(result, Exception)
+                else prune_response(result, self.profile)
+            )
+            for result in self.engine.ocr_batch(images)
+        ]
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+R = TypeVar("R")
+
+
+class RateLimiter:
+    """Rate limiter shared by the requests of an ocr engine.
+
+    It combines:
+        - a token bucket refilled continuously at `requests_per_minute`, holding
+          at most a second worth of tokens. A request waits until it gets its
+          tokens.
+        - an AIMD concurrency limit: the number of requests in flight grows by
+          one every `limit` successful requests up to `max_concurrency` and is
+          halved when the quota is exceeded.
+        - retries of the quota errors with jittered exponential backoff.
+
+    Args:
+        requests_per_minute (float, optional): quota of the engine, no token
+            bucket if None.
+        max_concurrency (int): upper bound of the concurrency limit.
+        max_retries (int): number of retries of a request exceeding the quota, 0
+            to leave them to the caller.
+        backoff_base (float): backoff of the first retry in seconds.
+        backoff_max (float): maximum backoff in seconds.
+        retry_on (tuple): exceptions raised when the quota is exceeded.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        max_concurrency: int = 1,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        retry_on: tuple[type[Exception], ...] = (),
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_on = retry_on
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self.concurrency_limit = float(max_concurrency)
+        self.n_throttled = 0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._capacity = max(1.0, (requests_per_minute or 0) / 60)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._slot_released = threading.Condition(self._lock)
+
+    def reserve(self, cost: int = 1) -> float:
+        """Take `cost` tokens from the bucket.
+
+        The tokens are reserved even if the bucket is empty, the caller must
+        then wait before sending its request.
+
+        Returns:
+            float: seconds to wait before sending the request
+        """
+        if not self.requests_per_minute:
+            return 0.0
+        rate = self.requests_per_minute / 60
+        with self._lock:
+            self._refill(rate)
+            self._tokens -= cost
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / rate
+
+    def try_reserve(self, cost: int = 1) -> bool:
+        """Take `cost` tokens from the bucket only if they are available now.
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        if not self.requests_per_minute:
+            return True
+        with self._lock:
+            self._refill(self.requests_per_minute / 60)
+            if self._tokens < cost:
+                return False
+            self._tokens -= cost
+            return True
+
+    def get_wait(self, cost: int = 1) -> float:
+        """Returns the seconds a request of `cost` tokens would wait if it was
+        sent now, without taking the tokens.
+        """
+        if not self.requests_per_minute:
+            return 0.0
+        rate = self.requests_per_minute / 60
+        with self._lock:
+            self._refill(rate)
+            return max(0.0, cost - self._tokens) / rate
+
+    def _refill(self, rate: float):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._last_refill) * rate
+        )
+        self._last_refill = now
+
+    def _try_acquire_slot(self) -> bool:
+        if self._in_flight < max(1, int(self.concurrency_limit)):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self, cost: int = 1):
+        """Block until a request of `cost` tokens can be sent."""
+        with self._slot_released:
+            while not self._try_acquire_slot():
+                self._slot_released.wait()
+        time.sleep(self.reserve(cost))
+
+    async def aacquire(self, cost: int = 1):
+        """Async counterpart of `acquire`."""
+        while True:
+            with self._lock:
+                if self._try_acquire_slot():
+                    break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(self.reserve(cost))
+
+    def release(self, throttled: bool = False, failed: bool = False):
+        """Release the slot of a finished request and adapt the concurrency limit.
+
+        Args:
+            throttled (bool): True if the request exceeded the quota
+            failed (bool): True if the request failed for another reason, the
+                concurrency limit is left unchanged.
+        """
+        with self._slot_released:
+            self._in_flight -= 1
+            if throttled:
+                self.n_throttled += 1
+                now = time.monotonic()
+                # a burst of quota errors from concurrent requests is one signal
+                if now - self._last_decrease > self.backoff_base:
+                    self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                    self._last_decrease = now
+            elif not failed:
+                self.concurrency_limit = min(
+                    float(self.max_concurrency),
+                    self.concurrency_limit + 1 / self.concurrency_limit,
+                )
+            self._slot_released.notify_all()
+
+    def get_backoff(self, attempt: int) -> float:
+        """Returns the jittered backoff in seconds before retry `attempt`."""
+        backoff = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, backoff)
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            if self.max_retries:
+                self.logger.error(f"quota exceeded after {attempt + 1} attempts")
+            return False
+        self.logger.warning(f"quota exceeded, retrying ({attempt + 1}): {error}")
+        return True
+
+    def call(self, fn: Callable[..., R], *args, cost: int = 1, **kwargs) -> R:
+        """Call `fn` within the rate limit, retrying the quota errors.
+
+        Args:
+            fn: function sending the request
+            cost (int): number of tokens used by the request
+        """
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            try:
+                result = fn(*args, **kwargs)
+            except self.retry_on as e:
+                self.release(throttled=True)
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self.get_backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self.release(failed=True)
+                raise
+            self.release()
+            return result
+
+    async def acall(
+        self, fn: Callable[..., Awaitable[R]], *args, cost: int = 1, **kwargs
+    ) -> R:
+        """Async counterpart of `call`."""
+        attempt = 0
+        while True:
+            await self.aacquire(cost)
+            try:
+                result = await fn(*args, **kwargs)
+            except self.retry_on as e:
+                self.release(throttled=True)
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.get_backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                self.release(failed=True)
+                raise
+            self.release()
+            return result
@@ -0,0 +1,390 @@
+import io
+import logging
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, NamedTuple, Optional, Sequence
+
+from PIL import Image as PillowImage
+
+from ocr_pipelines.engines.engine import (
+    ImageBytes,
+    ImageType,
+    OcrBatchResult,
+    OcrEngine,
+)
+
+# white gap between the pages of a mosaic, relative to the mosaic width
+TILE_GAP_RATIO = 0.05
+MIN_TILE_GAP = 32
+# maximum number of pixels of a mosaic, larger images are downscaled by the
+# ocr engine which hurts the accuracy
+MAX_MOSAIC_PIXELS = 20 * 1000 * 1000
+# quality of the mosaics of jpeg pages
+JPEG_QUALITY = 90
+# text of the symbol breaks, by google vision break type
+BREAK_TEXTS = {
+    1: " ",
+    2: " ",
+    3: "\n",
+    4: "-\n",
+    5: "\n",
+    "SPACE": " ",
+    "SURE_SPACE": " ",
+    "EOL_SURE_SPACE": "\n",
+    "HYPHEN": "-\n",
+    "LINE_BREAK": "\n",
+}
+
+
+class Tile(NamedTuple):
+    """Position of a page in a mosaic."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+def get_mosaic_layout(
+    sizes: Sequence[tuple[int, int]],
+) -> tuple[tuple[int, int], list[Tile]]:
+    """Stack pages of `sizes` vertically, separated by white gaps.
+
+    Returns:
+        tuple: the size of the mosaic and the tile of each page
+    """
+    width = max(page_width for page_width, _ in sizes)
+    gap = max(MIN_TILE_GAP, int(width * TILE_GAP_RATIO))
+    tiles = []
+    y = 0
+    for page_width, page_height in sizes:
+        tiles.append(Tile(0, y, page_width, page_height))
+        y += page_height + gap
+    return (width, y - gap), tiles
+
+
+def compose_mosaic(imgs: Sequence[PillowImage.Image]) -> tuple[bytes, list[Tile]]:
+    """Paste `imgs` in a single image.
+
+    The mosaic is 1-bit if all the pages are, and jpeg encoded if any page is.
+
+    Returns:
+        tuple: the encoded mosaic and the tile of each page
+    """
+    size, tiles = get_mosaic_layout([img.size for img in imgs])
+    if all(img.mode == "1" for img in imgs):
+        mode = "1"
+    elif all(img.mode in ("1", "L") for img in imgs):
+        mode = "L"
+    else:
+        mode = "RGB"
+    mosaic = PillowImage.new(mode, size, color="white")
+    for img, tile in zip(imgs, tiles):
+        mosaic.paste(img.convert(mode), (tile.x, tile.y))
+
+    mosaic_fp = io.BytesIO()
+    if any(img.format == "JPEG" for img in imgs) and mode != "1":
+        mosaic.save(mosaic_fp, format="JPEG", quality=JPEG_QUALITY)
+    else:
+        mosaic.save(mosaic_fp, format="PNG", optimize=mode == "1")
+    return mosaic_fp.getvalue(), tiles
+
+
+def get_tile_idx(tiles: Sequence[Tile], vertices: list[dict]) -> int:
+    """Returns the index of the tile containing the center of `vertices`, the
+    gap below a tile belongs to it.
+    """
+    if not vertices:
+        return 0
+    center_y = sum(vertex.get("y", 0) for vertex in vertices) / len(vertices)
+    tile_ys = [tile.y for tile in tiles]
+    return max(0, bisect_right(tile_ys, center_y) - 1)
+
+
+def rebase(annotation: Any, tile: Tile) -> Any:
+    """Returns a copy of `annotation` with its vertices relative to `tile`."""
+    if isinstance(annotation, dict):
+        return {
+            key: (
+                [
+                    {
+                        **vertex,
+                        "x": vertex.get("x", 0) - tile.x,
+                        "y": vertex.get("y", 0) - tile.y,
+                    }
+                    for vertex in value
+                ]
+                if key == "vertices"
+                else rebase(value, tile)
+            )
+            for key, value in annotation.items()
+        }
+    if isinstance(annotation, list):
+        return [rebase(value, tile) for value in annotation]
+    return annotation
+
+
+def get_bounding_box(annotations: list[dict], key: str = "boundingBox") -> dict:
+    """Returns the box bounding the `key` boxes of `annotations`."""
+    vertices = [
+        vertex
+        for annotation in annotations
+        for vertex in annotation.get(key, {}).get("vertices", [])
+    ]
+    xs = [vertex.get("x", 0) for vertex in vertices] or [0]
+    ys = [vertex.get("y", 0) for vertex in vertices] or [0]
+    min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+    return {
+        "vertices": [
+            {"x": min_x, "y": min_y},
+            {"x": max_x, "y": min_y},
+            {"x": max_x, "y": max_y},
+            {"x": min_x, "y": max_y},
+        ],
+        "normalizedVertices": [],
+    }
+
+
+def get_text(blocks: list[dict]) -> str:
+    """Returns the text of `blocks` from their symbols and breaks."""
+    text = []
+    for block in blocks:
+        for paragraph in block.get("paragraphs", []):
+            for word in paragraph.get("words", []):
+                for symbol in word.get("symbols", []):
+                    text.append(symbol.get("text", ""))
+                    detected_break = symbol.get("property", {}).get("detectedBreak")
+                    if detected_break:
+                        text.append(BREAK_TEXTS.get(detected_break.get("type"), ""))
+    return "".join(text)
+
+
+def split_blocks(blocks: list[dict], tiles: Sequence[Tile]) -> list[list[dict]]:
+    """Split the `blocks` of a mosaic into the blocks of each tile.
+
+    The words are assigned to the tile containing their center, the paragraphs
+    and blocks spanning several tiles are split and their boxes recomputed.
+    """
+    tile_blocks: list[list[dict]] = [[] for _ in tiles]
+    for block in blocks:
+        block_paragraphs: list[list[dict]] = [[] for _ in tiles]
+        for paragraph in block.get("paragraphs", []):
+            paragraph_words: list[list[dict]] = [[] for _ in tiles]
+            for word in paragraph.get("words", []):
+                vertices = word.get("boundingBox", {}).get("vertices", [])
+                idx = get_tile_idx(tiles, vertices)
+                paragraph_words[idx].append(rebase(word, tiles[idx]))
+            for idx, words in enumerate(paragraph_words):
+                if words:
+                    block_paragraphs[idx].append(
+                        {
+                            **paragraph,
+                            "boundingBox": get_bounding_box(words),
+                            "words": words,
+                        }
+                    )
+        for idx, paragraphs in enumerate(block_paragraphs):
+            if paragraphs:
+                tile_blocks[idx].append(
+                    {
+                        **block,
+                        "boundingBox": get_bounding_box(paragraphs),
+                        "paragraphs": paragraphs,
+                    }
+                )
+    return tile_blocks
+
+
+def split_response(response: dict, tiles: Sequence[Tile]) -> list[dict]:
+    """Split the google vision `response` of a mosaic into the response of each
+    of its `tiles`, as if each page was sent on its own.
+    """
+    full_text_annotation = response.get("fullTextAnnotation")
+    pages = full_text_annotation.get("pages", []) if full_text_annotation else []
+    mosaic_blocks = [block for page in pages for block in page.get("blocks", [])]
+    tile_blocks = split_blocks(mosaic_blocks, tiles)
+
+    text_annotations = response.get("textAnnotations", [])
+    tile_word_annotations: list[list[dict]] = [[] for _ in tiles]
+    for word_annotation in text_annotations[1:]:
+        vertices = word_annotation.get("boundingPoly", {}).get("vertices", [])
+        idx = get_tile_idx(tiles, vertices)
+        tile_word_annotations[idx].append(rebase(word_annotation, tiles[idx]))
+
+    tile_responses = []
+    for tile, blocks, word_annotations in zip(
+        tiles, tile_blocks, tile_word_annotations
+    ):
+        if not blocks:
+            # like the response to a page without text
+            tile_response = {
+                key: value
+                for key, value in response.items()
+                if key != "fullTextAnnotation"
+            }
+            tile_response["textAnnotations"] = []
+            tile_responses.append(tile_response)
+            continue
+
+        text = get_text(blocks)
+        page: dict = {
+            **pages[0],
+            "width": tile.width,
+            "height": tile.height,
+            "blocks": blocks,
+        }
+        tile_text_annotations = []
+        if text_annotations:
+            tile_text_annotations.append(
+                {
+                    **text_annotations[0],
+                    "description": text,
+                    "boundingPoly": get_bounding_box(blocks),
+                }
+            )
+            tile_text_annotations.extend(word_annotations)
+        tile_responses.append(
+            {
+                **response,
+                "textAnnotations": tile_text_annotations,
+                "fullTextAnnotation": {
+                    **full_text_annotation,  # type: ignore
+                    "pages": [page],
+                    "text": text,
+                },
+            }
+        )
+    return tile_responses
+
+
+class ImageGroup(NamedTuple):
+    """Images sent as a single image, a mosaic if `tiles` is set."""
+
+    idxs: list[int]
+    image: ImageType
+    tiles: Optional[list[Tile]] = None
+
+
+class TilingEngine(OcrEngine):
+    """Ocr several pages with a single image.
+
+    The pages of a batch are stacked in mosaics of at most `max_tiles` pages,
+    `max_mosaic_pixels` pixels and `max_mosaic_bytes` bytes. The mosaics are
+    sent with `engine.ocr_batch` and the response of each mosaic is split back
+    into the response of each page, with the boxes relative to the page. The
+    single images are sent as they are.
+
+    Args:
+        engine (OcrEngine): engine of google vision responses
+        max_tiles (int): maximum number of pages of a mosaic
+        max_mosaic_pixels (int): maximum number of pixels of a mosaic
+        max_mosaic_bytes (int, optional): maximum size of an encoded mosaic
+    """
+
+    def __init__(
+        self,
+        engine: OcrEngine,
+        max_tiles: int,
+        max_mosaic_pixels: int = MAX_MOSAIC_PIXELS,
+        max_mosaic_bytes: Optional[int] = None,
+    ) -> None:
+        self.engine = engine
+        self.max_tiles = max_tiles
+        self.max_mosaic_pixels = max_mosaic_pixels
+        self.max_mosaic_bytes = max_mosaic_bytes
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    def ocr(self, image: ImageType) -> dict:
+        return self.engine.ocr(image)
+
+    async def aocr(self, image: ImageType) -> dict:
+        return await self.engine.aocr(image)
+
+    def ocr_json(self, image: ImageType) -> str:
+        return self.engine.ocr_json(image)
+
+    async def aocr_json(self, image: ImageType) -> str:
+        return await self.engine.aocr_json(image)
+
+    @staticmethod
+    def load_image_bytes(image: ImageType) -> ImageBytes:
+        if isinstance(image, (str, Path)):
+            return Path(image).read_bytes()
+        return image
+
+    def get_mosaic_pixels(self, sizes: list[tuple[int, int]]) -> int:
+        (width, height), _ = get_mosaic_layout(sizes)
+        return width * height
+
+    def group_images(self, images: Sequence[ImageType]) -> list[ImageGroup]:
+        """Group `images` in mosaics, in order."""
+        groups: list[ImageGroup] = []
+        pending: list[tuple[int, PillowImage.Image]] = []
+
+        def flush():
+            if pending:
+                groups.extend(self.get_image_groups(pending, images))
+                pending.clear()
+
+        for idx, image in enumerate(images):
+            try:
+                img = PillowImage.open(io.BytesIO(self.load_image_bytes(image)))
+            except Exception as e:
+                self.logger.warning(f"image {idx} of the batch can't be tiled: {e}")
+                flush()
+                groups.append(ImageGroup([idx], image))
+                continue
+            sizes = [pending_img.size for _, pending_img in pending] + [img.size]
+            if pending and (
+                len(sizes) > self.max_tiles
+                or self.get_mosaic_pixels(sizes) > self.max_mosaic_pixels
+            ):
+                flush()
+            pending.append((idx, img))
+        flush()
+        return groups
+
+    def get_image_groups(
+        self, pending: list[tuple[int, PillowImage.Image]], images: Sequence[ImageType]
+    ) -> list[ImageGroup]:
+        """Returns the groups of the `pending` images, halved until their mosaics
+        fit in `max_mosaic_bytes`.
+        """
+        if len(pending) == 1:
+            idx, _ = pending[0]
+            return [ImageGroup([idx], images[idx])]
+        mosaic, tiles = compose_mosaic([img for _, img in pending])
+        if self.max_mosaic_bytes is not None and len(mosaic) > self.max_mosaic_bytes:
+            half = len(pending) // 2
+            return self.get_image_groups(
+                pending[:half], images
+            ) + self.get_image_groups(pending[half:], images)
+        return [ImageGroup([idx for idx, _ in pending], mosaic, tiles)]
+
+    def ocr_batch(self, images: Sequence[ImageType]) -> OcrBatchResult:
+        """Run OCR on several images, stacked in mosaics.
+
+        Args:
+            images: file_paths or image bytes
+        Returns:
+            results: ocr response in dict for each image, in the same order. The
+                exception is returned in place of the response of a failed image.
+        """
+        groups = self.group_images(images)
+        responses = self.engine.ocr_batch([group.image for group in groups])
+        results: OcrBatchResult = [{} for _ in images]
+        for group, response in zip(groups, responses):
+            if isinstance(response, Exception) or group.tiles is None:
+                for idx in group.idxs:
+                    results[idx] = response
+                continue
+            for idx, tile_response in zip(
+                group.idxs, split_response(response, group.tiles)
+            ):
+                results[idx] = tile_response
+        n_mosaics = sum(1 for group in groups if group.tiles is not None)
+        self.logger.debug(
+            f"ocred {len(images)} images with {len(groups)} requests, "
+            f"{n_mosaics} of them mosaics"
+        )
+        return results
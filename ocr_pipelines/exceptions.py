@@ -14,6 +14,10 @@ class FailedToAssignBatchError(UploadError):
     """Failed to assign a batch to the upload."""
 
 
+class UploadFailedError(UploadError):
+    """Some files failed to upload."""
+
+
 class OcrEngineError(Error):
     """Base-class for OCR engine errors."""
 
@@ -1,30 +1,147 @@
-import gzip
-import io
-import json
+import asyncio
 import logging
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
 from openpecha.buda.api import image_group_to_folder_name
 
-from ocr_pipelines.config import ImportConfig
+from ocr_pipelines.archive import (
+    get_archive_fn,
+    get_archived_ocr_output_fns,
+    pack_ocr_output_dir,
+)
+from ocr_pipelines.cache import OcrResultCache
+from ocr_pipelines.config import OCR_OUTPUT_FORMAT_ZIP, Credentials, ImportConfig
 from ocr_pipelines.engines import register as ocr_engine_class_register
-from ocr_pipelines.engines.engine import OcrEngine
+from ocr_pipelines.engines.engine import ImageType, OcrEngine
 from ocr_pipelines.engines.google_vision import GoogleVisionEngine
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.engines.pool import EnginePool
+from ocr_pipelines.engines.pruning import RESPONSE_PROFILE_FULL, ResponsePruningEngine
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+from ocr_pipelines.engines.tiling import TilingEngine
 from ocr_pipelines.exceptions import (
     GoogleVisionCredentialsError,
     OCREngineNotSupported,
     OcrExecutorError,
 )
+from ocr_pipelines.ledger import (
+    PAGE_DONE,
+    PAGE_PENDING,
+    STAGE_OCR,
+    JobLedger,
+    get_worker_id,
+)
+from ocr_pipelines.page_filter import PAGE_BLANK, PageFilter
+from ocr_pipelines.preprocess import ImagePreprocessor
+from ocr_pipelines.result_writer import ResultWriter, write_atomic
+
+T = TypeVar("T")
+
+# ocr output of the blank pages, like the response of the engine to a blank page
+BLANK_PAGE_RESULT = "{}"
 
 
-def gzip_str(string_):
-    # taken from https://gist.github.com/Garrett-R/dc6f08fc1eab63f94d2cbb89cb61c33d
-    out = io.BytesIO()
+def get_google_vision_engine(
+    config: ImportConfig,
+    credentials: Optional[Credentials],
+    max_retries: int,
+    image_download_dir: Path,
+    hedging_policies: list[HedgingPolicy],
+) -> GoogleVisionEngine:
+    """Returns a google vision engine of `credentials`, with its own quota. Its
+    hedging policy, if any, is added to `hedging_policies`.
+    """
+    rate_limiter = RateLimiter(
+        requests_per_minute=config.requests_per_minute,
+        max_concurrency=config.ocr_workers,
+        max_retries=max_retries,
+        retry_on=GoogleVisionEngine.QUOTA_ERRORS,
+    )
+    hedging = None
+    if config.ocr_hedge_percentile is not None:
+        hedging = HedgingPolicy(
+            percentile=config.ocr_hedge_percentile,
+            max_extra_ratio=config.ocr_hedge_max_ratio,
+            max_workers=2 * config.ocr_workers,
+        )
+        hedging_policies.append(hedging)
+    return GoogleVisionEngine(
+        credentials,  # type: ignore
+        config.model_type,
+        config.lang_hint,
+        image_download_dir,
+        config.ocr_outputs_path,
+        rate_limiter=rate_limiter,
+        request_timeout=config.ocr_request_timeout,
+        hedging=hedging,
+    )
 
-    with gzip.GzipFile(fileobj=out, mode="w") as fo:
-        fo.write(string_.encode())
 
-    bytes_obj = out.getvalue()
-    return bytes_obj
+def get_max_mosaic_bytes(config: ImportConfig) -> int:
+    """Returns the maximum size of a mosaic of `ocr_tiles_per_request` pages"""
+    return config.ocr_max_image_bytes or config.ocr_batch_max_bytes
+
+
+def get_ocr_engine(
+    config: ImportConfig,
+    image_download_dir: Path,
+    hedging_policies: list[HedgingPolicy],
+) -> OcrEngine:
+    """Returns the ocr engine of `config`, the hedging policies of its google
+    vision engines are added to `hedging_policies`.
+
+    Raises:
+        OCREngineNotSupported: if `config.ocr_engine` isn't supported
+    """
+    ocr_engine_class = ocr_engine_class_register.get(config.ocr_engine)
+    if ocr_engine_class != GoogleVisionEngine:
+        raise OCREngineNotSupported(f"OCR engine `{config.ocr_engine}` not suporrted")
+    credentials = config.credentials
+    if isinstance(credentials, list) and len(credentials) > 1:
+        # one engine per key, the pool retries the quota errors on the other keys
+        ocr_engine: OcrEngine = EnginePool(
+            [
+                get_google_vision_engine(
+                    config,
+                    key_credentials,
+                    max_retries=0,
+                    image_download_dir=image_download_dir,
+                    hedging_policies=hedging_policies,
+                )
+                for key_credentials in credentials
+            ],
+            cooldown=config.ocr_credentials_cooldown,
+            max_retries=config.ocr_max_retries,
+        )
+    else:
+        if isinstance(credentials, list):
+            credentials = credentials[0]
+        ocr_engine = get_google_vision_engine(
+            config,
+            credentials,
+            max_retries=config.ocr_max_retries,
+            image_download_dir=image_download_dir,
+            hedging_policies=hedging_policies,
+        )
+    if config.ocr_tiles_per_request > 1:
+        # several pages of a batch are sent in a single image
+        ocr_engine = TilingEngine(
+            ocr_engine,
+            max_tiles=config.ocr_tiles_per_request,
+            max_mosaic_bytes=get_max_mosaic_bytes(config),
+        )
+    if config.ocr_response_profile != RESPONSE_PROFILE_FULL:
+        # pruned once the responses of the mosaics are split
+        ocr_engine = ResponsePruningEngine(ocr_engine, config.ocr_response_profile)
+    return ocr_engine
 
 
 class OCRExecutor:
@@ -32,60 +149,652 @@ class OCRExecutor:
         self,
         config: ImportConfig,
         image_download_dir: Path,
+        ocr_engine: Optional[OcrEngine] = None,
     ) -> None:
+        if config.ocr_tiles_per_request > 1 and (
+            config.ocr_batch_size <= 1 or config.ocr_async
+        ):
+            raise ValueError(
+                "ocr_tiles_per_request packs the pages of a batch in a single "
+                "request, it requires ocr_batch_size > 1 and no ocr_async"
+            )
         self.config = config
         self.image_download_dir = image_download_dir
+        # engine shared by the executors of a multi-scan run
+        self.ocr_engine = ocr_engine
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.result_writer = ResultWriter(compresslevel=config.gzip_compresslevel)
+        self.ocr_cache: Optional[OcrResultCache] = None
+        self._archived_ocr_output_fns: dict[Path, set[str]] = {}
+        if config.ocr_cache_path is not None:
+            self.ocr_cache = OcrResultCache(
+                config.ocr_cache_path, config.ocr_cache_max_bytes
+            )
+        self.preprocessor: Optional[ImagePreprocessor] = None
+        if config.ocr_max_image_pixels or config.ocr_max_image_bytes:
+            self.preprocessor = ImagePreprocessor(
+                max_pixels=config.ocr_max_image_pixels,
+                max_bytes=config.ocr_max_image_bytes,
+            )
+        # scale factors of the downscaled images, by image group and image
+        self.image_scale_factors: dict[str, dict[str, float]] = {}
+        self.page_filter: Optional[PageFilter] = None
+        if config.skip_blank_pages or config.skip_duplicate_pages:
+            self.page_filter = PageFilter(
+                skip_blank=config.skip_blank_pages,
+                skip_duplicates=config.skip_duplicate_pages,
+            )
+        # pages not sent to the ocr engine: the blank pages by image group and
+        # the duplicate pages with their twin by image group
+        self.skipped_pages: dict[str, dict] = {"blank": {}, "duplicate": {}}
+        # `(img_path, result_fn, twin_result_fn)` of the duplicate pages
+        self._duplicate_pages: list[tuple[Path, Path, Path]] = []
+        # hedging policies of the google vision engines
+        self.hedging_policies: list[HedgingPolicy] = []
+        self.ledger: Optional[JobLedger] = None
+        if config.job_ledger_path is not None:
+            self.ledger = JobLedger(
+                config.job_ledger_path, lease_seconds=config.job_lease_seconds
+            )
+        self.worker_id = get_worker_id()
+        # `(img_group, page)` of the pages claimed in the ledger, by result_fn
+        self._claimed_pages: dict[Path, tuple[str, str]] = {}
+        # True once a run finished the ocr of the scan, with a ledger the run of
+        # the worker which finished its last pages
+        self.scan_finished = False
 
     def get_ocr_engine(self) -> OcrEngine:
-        ocr_engine_class = ocr_engine_class_register.get(self.config.ocr_engine)
-        if ocr_engine_class == GoogleVisionEngine:
-            ocr_engine = ocr_engine_class(
-                self.config.credentials,
-                self.config.model_type,
-                self.config.lang_hint,
-                self.image_download_dir,
-                self.config.ocr_outputs_path,
-            )
-            return ocr_engine
-        else:
-            raise OCREngineNotSupported(
-                f"OCR engine `{self.config.ocr_engine}` not suporrted"
-            )
+        if self.ocr_engine is not None:
+            return self.ocr_engine
+        return get_ocr_engine(
+            self.config, self.image_download_dir, self.hedging_policies
+        )
 
-    def run(self):
-        ocr_engine = self.get_ocr_engine()
+    def get_ocr_output_dir(self, img_group_id: str) -> Path:
+        """Returns the directory where the ocr outputs of `img_group_id` are saved"""
         bdrc_scan_id = self.image_download_dir.name
+        img_grp_folder_name = image_group_to_folder_name(bdrc_scan_id, img_group_id)
+        return self.config.ocr_outputs_path / bdrc_scan_id / img_grp_folder_name
+
+    def get_result_fn(self, img_path: Path) -> Path:
+        """Returns the path of the ocr output of the image at `img_path`"""
+        ocr_output_dir = self.get_ocr_output_dir(img_path.parent.name)
+        return ocr_output_dir / f"{img_path.stem}.json.gz"
+
+    def get_cache_key(
+        self, img_path: Path, img_bytes: Optional[bytes] = None
+    ) -> Optional[str]:
+        """Returns the ocr cache key of the image at `img_path`, or of its
+        in-memory bits `img_bytes`, None if the ocr cache is disabled.
+        """
+        if self.ocr_cache is None:
+            return None
+        # the default settings aren't in the key, the outputs cached before
+        # they were added are still used
+        settings = []
+        if self.config.ocr_response_profile != RESPONSE_PROFILE_FULL:
+            settings.append(f"response_profile={self.config.ocr_response_profile}")
+        if self.config.ocr_tiles_per_request > 1:
+            settings.append(
+                f"tiles_per_request={self.config.ocr_tiles_per_request}"
+                f",max_mosaic_bytes={get_max_mosaic_bytes(self.config)}"
+            )
+        return self.ocr_cache.get_key(
+            img_path.read_bytes() if img_bytes is None else img_bytes,
+            self.config.ocr_engine,
+            self.config.model_type,
+            self.config.lang_hint,
+            *settings,
+        )
+
+    def preprocess_img(
+        self, img_path: Path, img_bytes: Optional[bytes] = None
+    ) -> Optional[bytes]:
+        """Returns the bits of the image at `img_path`, or of its in-memory bits
+        `img_bytes`, downscaled by `preprocessor` and records their scale factor.
+        Without `preprocessor`, `img_bytes` is returned as is.
+        """
+        if self.preprocessor is None:
+            return img_bytes
+        if img_bytes is None:
+            img_bytes = img_path.read_bytes()
+        img_bytes, scale = self.preprocessor.preprocess(img_bytes)
+        if scale != 1.0:
+            img_group_scale_factors = self.image_scale_factors.setdefault(
+                img_path.parent.name, {}
+            )
+            img_group_scale_factors[img_path.name] = scale
+        return img_bytes
+
+    def prepare_img(
+        self, img_path: Path, img_bytes: Optional[bytes] = None
+    ) -> tuple[Optional[bytes], Optional[str]]:
+        """Returns the bits of the image at `img_path` as sent to the ocr engine,
+        see `preprocess_img`, and their ocr cache key.
+        """
+        img_bytes = self.preprocess_img(img_path, img_bytes)
+        return img_bytes, self.get_cache_key(img_path, img_bytes)
+
+    def log_prepare_error(self, img_path: Path, error: Exception):
+        self.logger.error(f"failed to prepare {img_path} for the ocr")
+        self.logger.exception(error)
+
+    def load_cached_result(self, cache_key: Optional[str], result_fn: Path) -> bool:
+        """Write the cached ocr output at `cache_key` to `result_fn`, and mark its
+        page done in the ledger.
+
+        Returns:
+            bool: True if the ocr output was cached
+        """
+        if self.ocr_cache is None or cache_key is None:
+            return False
+        gzip_result = self.ocr_cache.get(cache_key)
+        if gzip_result is None:
+            return False
+        write_atomic(gzip_result, result_fn)
+        self.complete_claimed_page(result_fn)
+        return True
+
+    def ocr_img(
+        self,
+        ocr_engine: OcrEngine,
+        img_path: Path,
+        result_fn: Path,
+        img_bytes: Optional[bytes] = None,
+    ) -> bool:
+        """Run `ocr_engine` on `img_path` and save the ocr output to `result_fn`.
+
+        The ocr engine isn't called if the ocr output of the image is cached.
+        The in-memory bits `img_bytes` of the image are sent instead of reading
+        `img_path`, if given. The image is downscaled first if `preprocessor`
+        is set.
+
+        Returns:
+            bool: True if the ocr output is saved, False if the ocr failed
+
+        Raises:
+            OcrExecutorError: if the ocr engine credentials are invalid
+        """
+        try:
+            img_bytes, cache_key = self.prepare_img(img_path, img_bytes)
+        except Exception as e:
+            # an undecodable image, the other pages are still ocred
+            self.log_prepare_error(img_path, e)
+            return False
+        if self.load_cached_result(cache_key, result_fn):
+            return True
+        try:
+            result_json = ocr_engine.ocr_json(
+                img_path if img_bytes is None else img_bytes
+            )
+        except GoogleVisionCredentialsError as e:
+            self.logger.exception(e)
+            raise OcrExecutorError("OCR Executor failed") from e
+        except Exception as e:
+            self.logger.error(
+                f"{ocr_engine.__class__.__name__} failed to ocr {result_fn}"
+            )
+            self.logger.exception(e)
+            return False
+        self.save_result(result_json, result_fn, cache_key)
+        return True
+
+    async def aocr_img(
+        self, ocr_engine: OcrEngine, img_path: Path, result_fn: Path
+    ) -> bool:
+        """Async counterpart of `ocr_img`, the ocr cache is used and the ocr output
+        is saved in a thread.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            img_bytes, cache_key = await loop.run_in_executor(
+                None, self.prepare_img, img_path
+            )
+        except Exception as e:
+            self.log_prepare_error(img_path, e)
+            return False
+        if await loop.run_in_executor(
+            None, self.load_cached_result, cache_key, result_fn
+        ):
+            return True
+        try:
+            result_json = await ocr_engine.aocr_json(
+                img_path if img_bytes is None else img_bytes
+            )
+        except GoogleVisionCredentialsError as e:
+            self.logger.exception(e)
+            raise OcrExecutorError("OCR Executor failed") from e
+        except Exception as e:
+            self.logger.error(
+                f"{ocr_engine.__class__.__name__} failed to ocr {result_fn}"
+            )
+            self.logger.exception(e)
+            return False
+        await loop.run_in_executor(
+            None, self.save_result, result_json, result_fn, cache_key
+        )
+        return True
+
+    def ocr_img_batch(
+        self, ocr_engine: OcrEngine, batch: list[tuple[Path, Path]]
+    ) -> list[bool]:
+        """Run `ocr_engine` on a batch of `(img_path, result_fn)` with a single
+        `ocr_batch_json` call and save each ocr output to its `result_fn`. The images
+        whose ocr output is cached aren't sent to the ocr engine.
+
+        Returns:
+            list[bool]: for each image, True if its ocr output is saved
+
+        Raises:
+            OcrExecutorError: if the ocr engine credentials are invalid
+        """
+        ocr_engine_name = ocr_engine.__class__.__name__
+        saved = [False] * len(batch)
+        uncached: list[tuple[int, ImageType, Path, Optional[str]]] = []
+        for idx, (img_path, result_fn) in enumerate(batch):
+            try:
+                img_bytes, cache_key = self.prepare_img(img_path)
+            except Exception as e:
+                self.log_prepare_error(img_path, e)
+                continue
+            if self.load_cached_result(cache_key, result_fn):
+                saved[idx] = True
+            else:
+                image: ImageType = img_path if img_bytes is None else img_bytes
+                uncached.append((idx, image, result_fn, cache_key))
+        if not uncached:
+            return saved
+
+        try:
+            results = ocr_engine.ocr_batch_json([image for _, image, _, _ in uncached])
+        except GoogleVisionCredentialsError as e:
+            self.logger.exception(e)
+            raise OcrExecutorError("OCR Executor failed") from e
+        except Exception as e:
+            self.logger.error(
+                f"{ocr_engine_name} failed to ocr the batch of {len(uncached)} images "
+                f"starting at {uncached[0][2]}"
+            )
+            self.logger.exception(e)
+            return saved
+
+        for (idx, _, result_fn, cache_key), result in zip(uncached, results):
+            if isinstance(result, GoogleVisionCredentialsError):
+                self.logger.error(result, exc_info=result)
+                raise OcrExecutorError("OCR Executor failed") from result
+            if isinstance(result, Exception):
+                self.logger.error(f"{ocr_engine_name} failed to ocr {result_fn}")
+                self.logger.error(result, exc_info=result)
+                continue
+            self.save_result(result, result_fn, cache_key)
+            saved[idx] = True
+        return saved
+
+    def save_result(
+        self, result_json: str, result_fn: Path, cache_key: Optional[str] = None
+    ):
+        """Queue the ocr output `result_json` to be written to `result_fn` by
+        `result_writer` and then to the ocr cache at `cache_key`, if any.
+        """
+        on_written: Optional[Callable[[Path], None]] = None
+        if self.ocr_cache is not None and cache_key is not None:
+            # bound to locals, the narrowed types don't carry into the closure
+            ocr_cache, key = self.ocr_cache, cache_key
+
+            def put_in_cache(result_fn: Path):
+                ocr_cache.put(key, result_fn.read_bytes())
+                self.complete_claimed_page(result_fn)
+
+            on_written = put_in_cache
+        elif result_fn in self._claimed_pages:
+            on_written = self.complete_claimed_page
+
+        self.result_writer.submit(result_json, result_fn, on_written)
+
+    def complete_claimed_page(self, result_fn: Path):
+        """Mark the page of `result_fn` done in the ledger, if it was claimed."""
+        claimed_page = self._claimed_pages.get(result_fn)
+        if self.ledger is None or claimed_page is None:
+            return
+        img_group, page = claimed_page
+        self.ledger.complete(
+            self.image_download_dir.name,
+            STAGE_OCR,
+            img_group,
+            page,
+            n_bytes=result_fn.stat().st_size,
+        )
+
+    def iter_pending_imgs(self) -> Iterator[tuple[Path, Path]]:
+        """Yields `(img_path, result_fn)` of the downloaded images, in sorted order,
+        which don't have an ocr output yet.
+
+        The pending images are claimed from the ledger, if any, instead of
+        checking the ocr output of each image.
+        """
+        if self.ledger is not None:
+            yield from self.iter_claimed_imgs(self.ledger)
+            return
         img_group_paths = list(self.image_download_dir.iterdir())
         img_group_paths.sort()
         for img_group_path in img_group_paths:
-            img_group_id = img_group_path.name
-            img_grp_folder_name = image_group_to_folder_name(bdrc_scan_id, img_group_id)
-            ocr_output_dir = (
-                self.config.ocr_outputs_path
-                / bdrc_scan_id
-                / img_grp_folder_name
-            )
+            ocr_output_dir = self.get_ocr_output_dir(img_group_path.name)
             ocr_output_dir.mkdir(exist_ok=True, parents=True)
             img_paths = list(img_group_path.iterdir())
             img_paths.sort()
             for img_path in img_paths:
                 result_fn = ocr_output_dir / f"{img_path.stem}.json.gz"
-                if result_fn.is_file():
+                if self.is_ocred(result_fn):
                     continue
-                try:
-                    result = ocr_engine.ocr(img_path)
-                except GoogleVisionCredentialsError as e:
-                    self.logger.exception(e)
-                    raise OcrExecutorError("OCR Executor failed") from e
-                except Exception as e:
-                    self.logger.error(
-                        f"{ocr_engine.__class__.__name__} failed to ocr {result_fn}"
-                    )
-                    self.logger.exception(e)
-                    continue
-                result_json = json.dumps(result)
-                gzip_result = gzip_str(result_json)
-                result_fn.write_bytes(gzip_result)
+                yield img_path, result_fn
+
+    def register_imgs(self, ledger: JobLedger):
+        """Add the downloaded images to the ledger, done if they have an ocr
+        output and pending otherwise.
+        """
+        bdrc_scan_id = self.image_download_dir.name
+        pages: dict[str, list[tuple[str, str]]] = {PAGE_PENDING: [], PAGE_DONE: []}
+        for img_group_path in sorted(self.image_download_dir.iterdir()):
+            ocr_output_dir = self.get_ocr_output_dir(img_group_path.name)
+            for img_path in sorted(img_group_path.iterdir()):
+                result_fn = ocr_output_dir / f"{img_path.stem}.json.gz"
+                state = PAGE_DONE if self.is_ocred(result_fn) else PAGE_PENDING
+                pages[state].append((img_group_path.name, img_path.name))
+        for state, state_pages in pages.items():
+            ledger.add_pages(bdrc_scan_id, STAGE_OCR, state_pages, state=state)
+
+    def iter_claimed_imgs(self, ledger: JobLedger) -> Iterator[tuple[Path, Path]]:
+        """Yields `(img_path, result_fn)` of the pages claimed from the ledger, the
+        images are registered in the ledger by the first run of the scan.
+        """
+        bdrc_scan_id = self.image_download_dir.name
+        if not ledger.has_pages(bdrc_scan_id, STAGE_OCR):
+            self.register_imgs(ledger)
+        claim_size = self.config.ocr_batch_size * max(1, self.config.ocr_workers)
+        while True:
+            jobs = ledger.claim(
+                bdrc_scan_id, STAGE_OCR, self.worker_id, limit=claim_size
+            )
+            if not jobs:
+                return
+            for job in jobs:
+                img_path = self.image_download_dir / job.img_group / job.page
+                result_fn = self.get_result_fn(img_path)
+                result_fn.parent.mkdir(exist_ok=True, parents=True)
+                self._claimed_pages[result_fn] = (job.img_group, job.page)
+                yield img_path, result_fn
+
+    def release_claimed_pages(self):
+        """Complete the claimed pages which have an ocr output, the pages cached
+        or duplicate, and give back the others to the ledger.
+        """
+        if self.ledger is None:
+            return
+        bdrc_scan_id = self.image_download_dir.name
+        for result_fn, (img_group, page) in self._claimed_pages.items():
+            if result_fn.is_file():
+                self.ledger.complete(
+                    bdrc_scan_id,
+                    STAGE_OCR,
+                    img_group,
+                    page,
+                    n_bytes=result_fn.stat().st_size,
+                )
+            else:
+                self.ledger.release(
+                    bdrc_scan_id,
+                    STAGE_OCR,
+                    img_group,
+                    page,
+                    self.worker_id,
+                    error="no ocr output",
+                )
+        self._claimed_pages.clear()
+
+    def filter_pending_imgs(
+        self, pending_imgs: Iterable[tuple[Path, Path]]
+    ) -> Iterator[tuple[Path, Path]]:
+        """Yields the `pending_imgs` which must be sent to the ocr engine.
+
+        The blank pages get a placeholder ocr output. The duplicate pages get a
+        copy of the ocr output of their twin by `copy_duplicate_results`, once
+        it is ocred.
+        """
+        if self.page_filter is None:
+            yield from pending_imgs
+            return
+        for img_path, result_fn in pending_imgs:
+            img_group = img_path.parent.name
+            page_class = self.page_filter.classify(
+                img_group, img_path.name, img_path.read_bytes()
+            )
+            if page_class is None:
+                yield img_path, result_fn
+            elif page_class.kind == PAGE_BLANK:
+                self.save_result(BLANK_PAGE_RESULT, result_fn)
+                self.skipped_pages["blank"].setdefault(img_group, []).append(
+                    img_path.name
+                )
+            elif page_class.twin is None:
+                # a duplicate page always has a twin, ocr the page otherwise
+                yield img_path, result_fn
+            else:
+                twin_result_fn = self.get_result_fn(img_path.with_name(page_class.twin))
+                self._duplicate_pages.append((img_path, result_fn, twin_result_fn))
+                self.skipped_pages["duplicate"].setdefault(img_group, {})[
+                    img_path.name
+                ] = page_class.twin
+            # the claims of the duplicate pages don't wait for the end of the run
+            self.copy_duplicate_results(final=False)
+
+    def copy_duplicate_results(self, final: bool = True):
+        """Copy the ocr output of the twin of each duplicate page whose twin is
+        written, and mark the duplicate page done in the ledger.
+
+        Args:
+            final (bool): True at the end of the run, the duplicate pages of a
+                twin which failed are then left to the next run. Otherwise they
+                wait for their twin.
+        """
+        waiting_pages = []
+        for img_path, result_fn, twin_result_fn in self._duplicate_pages:
+            if twin_result_fn.is_file():
+                write_atomic(twin_result_fn.read_bytes(), result_fn)
+                self.complete_claimed_page(result_fn)
+            elif final:
+                self.logger.warning(
+                    f"{twin_result_fn} is missing, {result_fn} is left to ocr"
+                )
+                del self.skipped_pages["duplicate"][img_path.parent.name][img_path.name]
+            else:
+                waiting_pages.append((img_path, result_fn, twin_result_fn))
+        self._duplicate_pages = waiting_pages
+
+    def log_skipped_pages(self):
+        if self.page_filter is None:
+            return
+        n_blank = sum(len(pages) for pages in self.skipped_pages["blank"].values())
+        n_duplicate = sum(
+            len(pages) for pages in self.skipped_pages["duplicate"].values()
+        )
+        self.logger.info(f"skipped {n_blank} blank and {n_duplicate} duplicate pages")
+
+    def is_ocred(self, result_fn: Path) -> bool:
+        """Returns True if the ocr output `result_fn` is saved, either as a file or
+        packed in the archive of its image group.
+        """
+        if result_fn.is_file():
+            return True
+        ocr_output_dir = result_fn.parent
+        if ocr_output_dir not in self._archived_ocr_output_fns:
+            archive_fn = get_archive_fn(ocr_output_dir)
+            self._archived_ocr_output_fns[ocr_output_dir] = get_archived_ocr_output_fns(
+                archive_fn
+            )
+        return result_fn.name in self._archived_ocr_output_fns[ocr_output_dir]
 
+    def pack_ocr_outputs(self) -> list[Path]:
+        """Pack the ocr outputs of each image group of the scan in an archive.
+
+        Returns:
+            list[Path]: paths to the archives
+        """
+        bdrc_scan_id = self.image_download_dir.name
+        ocr_output_path = self.config.ocr_outputs_path / bdrc_scan_id
+        archive_fns = [
+            pack_ocr_output_dir(ocr_output_dir)
+            for ocr_output_dir in sorted(ocr_output_path.iterdir())
+            if ocr_output_dir.is_dir()
+        ]
+        self._archived_ocr_output_fns.clear()
+        return archive_fns
+
+    def iter_batches(
+        self, pending_imgs: Iterable[tuple[Path, Path]]
+    ) -> Iterator[list[tuple[Path, Path]]]:
+        """Group `pending_imgs` in batches of at most `config.ocr_batch_size` images
+        and `config.ocr_batch_max_bytes` bytes of images. An image larger than
+        `config.ocr_batch_max_bytes` is sent alone.
+        """
+        batch: list[tuple[Path, Path]] = []
+        batch_bytes = 0
+        for img_path, result_fn in pending_imgs:
+            img_bytes = img_path.stat().st_size
+            if batch and (
+                len(batch) >= self.config.ocr_batch_size
+                or batch_bytes + img_bytes > self.config.ocr_batch_max_bytes
+            ):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append((img_path, result_fn))
+            batch_bytes += img_bytes
+        if batch:
+            yield batch
+
+    def run_concurrently(self, ocr_fn: Callable[[T], Any], pending: Iterable[T]):
+        """Call `ocr_fn` on each of `pending` with at most `config.ocr_workers`
+        calls in flight.
+
+        Raises:
+            OcrExecutorError: if the ocr engine credentials are invalid, the
+                calls not started yet are cancelled.
+        """
+        n_workers = self.config.ocr_workers
+        futures: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            try:
+                for item in pending:
+                    if len(futures) >= 2 * n_workers:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    futures.add(executor.submit(ocr_fn, item))
+                for future in as_completed(futures):
+                    future.result()
+            except OcrExecutorError:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    async def arun_concurrently(
+        self, ocr_engine: OcrEngine, pending_imgs: Iterable[tuple[Path, Path]]
+    ):
+        """Ocr `pending_imgs` with `ocr_engine.aocr_json`, with at most
+        `config.ocr_workers` requests in flight.
+
+        Raises:
+            OcrExecutorError: if the ocr engine credentials are invalid, the
+                requests in flight are cancelled.
+        """
+        semaphore = asyncio.Semaphore(self.config.ocr_workers)
+        tasks: set[asyncio.Task] = set()
+
+        async def aocr_img(img_path: Path, result_fn: Path) -> bool:
+            try:
+                return await self.aocr_img(ocr_engine, img_path, result_fn)
+            finally:
+                semaphore.release()
+
+        try:
+            for img_path, result_fn in pending_imgs:
+                await semaphore.acquire()
+                done_tasks = {task for task in tasks if task.done()}
+                tasks -= done_tasks
+                for task in done_tasks:
+                    task.result()
+                tasks.add(asyncio.create_task(aocr_img(img_path, result_fn)))
+            await asyncio.gather(*tasks)
+        except OcrExecutorError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def ocr_pending_imgs(
+        self, ocr_engine: OcrEngine, pending_imgs: Iterable[tuple[Path, Path]]
+    ):
+        """Ocr `pending_imgs` in the mode set by the config: async, batched
+        and/or concurrent.
+        """
+        if self.config.ocr_async:
+            asyncio.run(self.arun_concurrently(ocr_engine, pending_imgs))
+            return
+
+        pending: Iterable[Any]
+        if self.config.ocr_batch_size > 1:
+            pending = self.iter_batches(pending_imgs)
+
+            def ocr_fn(batch):
+                return self.ocr_img_batch(ocr_engine, batch)
+
+        else:
+            pending = pending_imgs
+
+            def ocr_fn(pending_img):
+                img_path, result_fn = pending_img
+                return self.ocr_img(ocr_engine, img_path, result_fn)
+
+        if self.config.ocr_workers > 1:
+            self.run_concurrently(ocr_fn, pending)
+        else:
+            for item in pending:
+                ocr_fn(item)
+
+    def run(self):
+        ocr_engine = self.get_ocr_engine()
+        bdrc_scan_id = self.image_download_dir.name
+        try:
+            try:
+                self.ocr_pending_imgs(
+                    ocr_engine, self.filter_pending_imgs(self.iter_pending_imgs())
+                )
+            finally:
+                # the ocr outputs already received are written even if the run
+                # failed
+                self.result_writer.join()
+            self.copy_duplicate_results()
+        finally:
+            self.release_claimed_pages()
+        self.scan_finished = self.ledger is None or self.ledger.claim_stage_end(
+            bdrc_scan_id, STAGE_OCR, self.worker_id
+        )
+        if not self.scan_finished:
+            # packed, uploaded and published by the worker finishing the last pages
+            self.logger.info(f"{bdrc_scan_id} is left to other workers")
+        elif self.config.ocr_output_format == OCR_OUTPUT_FORMAT_ZIP:
+            self.pack_ocr_outputs()
+        self.log_cache_stats()
+        self.log_skipped_pages()
+        self.log_hedging_stats()
         return self.config.ocr_outputs_path / bdrc_scan_id
+
+    def log_hedging_stats(self):
+        for hedging in self.hedging_policies:
+            self.logger.info(f"hedging: {hedging.get_stats()}")
+
+    def log_cache_stats(self):
+        if self.ocr_cache is None:
+            return
+        self.logger.info(
+            f"ocr cache: {self.ocr_cache.hits} hits, {self.ocr_cache.misses} misses"
+        )
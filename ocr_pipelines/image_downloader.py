@@ -1,19 +1,193 @@
+import hashlib
 import io
 import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterator, Union
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TypeVar, Union
 
 from openpecha.buda import api as buda_api
 from PIL import Image as PillowImage
 from wand.image import Image as WandImage
 
 from ocr_pipelines.exceptions import BdcrScanNotFound
+from ocr_pipelines.result_writer import write_atomic
+from ocr_pipelines.utils import PageSlots, bounded_map
+
+T = TypeVar("T")
+
+# bucket of the bdrc scan images
+BDRC_ARCHIVE_BUCKET = "archive.tbrc.org"
+
+
+# leading bytes of the image formats, by format
+IMG_FORMAT_SIGNATURES = {
+    "jpeg": [b"\xff\xd8\xff"],
+    "png": [b"\x89PNG\r\n\x1a\n"],
+    "gif": [b"GIF87a", b"GIF89a"],
+    "bmp": [b"BM"],
+    "tiff": [b"II*\x00", b"MM\x00*"],
+}
+# image formats accepted as they are by the ocr engines
+RAW_IMG_FORMATS = {"jpeg", "png", "gif", "bmp", "webp"}
+# tiff tag of the number of bits per pixel component
+TIFF_BITS_PER_SAMPLE_TAG = 258
+
+
+def detect_img_format(img_bytes: bytes) -> Optional[str]:
+    """Returns the format of `img_bytes` from its leading bytes, None if unknown."""
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        return "webp"
+    for img_format, signatures in IMG_FORMAT_SIGNATURES.items():
+        if any(img_bytes.startswith(signature) for signature in signatures):
+            return img_format
+    return None
+
+
+def is_bilevel(img: PillowImage.Image) -> bool:
+    """Returns True if `img` is a 1-bit image, like the Group4 bdrc tiffs."""
+    if img.mode == "1":
+        return True
+    bits_per_sample = getattr(img, "tag_v2", {}).get(TIFF_BITS_PER_SAMPLE_TAG)
+    if isinstance(bits_per_sample, tuple):
+        return all(bits == 1 for bits in bits_per_sample)
+    return bits_per_sample == 1
+
+
+def get_img_format(fn: Path) -> str:
+    """Returns the format an image saved to `fn` is encoded in, from its extension."""
+    return PillowImage.registered_extensions().get(fn.suffix.lower(), "PNG")
+
+
+def encode_img_with_wand(fp: io.BytesIO) -> bytes:
+    with WandImage(blob=fp.getvalue()) as img:
+        if img.depth == 1:
+            # keep bilevel images 1-bit instead of 8-bit grayscale
+            img.type = "bilevel"
+        return img.make_blob("png")
+
+
+def encode_img_with_pillow(fp: io.BytesIO, img_format: str) -> bytes:
+    """
+    uses pillow to interpret the bits as an image and encode it in a format
+    that is appropriate for Google Vision (png instead of tiff for instance).
+    Bilevel images are encoded as compact 1-bit pngs.
+    """
+    img = PillowImage.open(fp)
+    encoded_fp = io.BytesIO()
+    if is_bilevel(img):
+        if img.mode != "1":
+            img = img.convert("1")
+        img.save(encoded_fp, format=img_format, optimize=True)
+    else:
+        img.save(encoded_fp, format=img_format)
+    return encoded_fp.getvalue()
+
+
+def save_img_with_wand(fp: io.BytesIO, fn: Path) -> bool:
+    try:
+        Path(fn).write_bytes(encode_img_with_wand(fp))
+        return True
+    except Exception:
+        logging.exception(f"Failed to save {fn} with `Wand`")
+        return False
+
+
+def save_img_with_pillow(fp: io.BytesIO, fn: Path) -> bool:
+    try:
+        Path(fn).write_bytes(encode_img_with_pillow(fp, get_img_format(Path(fn))))
+    except Exception:
+        logging.exception(f"Failed to save {fn} with `Pillow`")
+        return False
+
+    return True
+
+
+def encode_img(fp: io.BytesIO, fn: Path) -> Optional[bytes]:
+    """Returns the image bits `fp` encoded like the image saved to `fn`, None if
+    both Pillow and Wand failed to convert them.
+    """
+    try:
+        return encode_img_with_pillow(fp, get_img_format(fn))
+    except Exception:
+        logging.exception(f"Failed to encode {fn} with `Pillow`")
+    try:
+        return encode_img_with_wand(fp)
+    except Exception:
+        logging.exception(f"Failed to encode {fn} with `Wand`")
+    return None
+
+
+def convert_img(spool_fn: str, output_fn: str) -> bool:
+    """Convert the image bits spooled to `spool_fn` and save them to `output_fn`.
+
+    Runs in the conversion processes, the image bits are passed through the
+    spool file instead of being pickled.
+    """
+    fp = io.BytesIO(Path(spool_fn).read_bytes())
+    saved = save_img_with_pillow(fp, Path(output_fn))
+    if not saved:
+        saved = save_img_with_wand(fp, Path(output_fn))
+    return saved
+
+
+def convert_img_to_bytes(spool_fn: str, output_fn: str) -> Optional[bytes]:
+    """In-memory counterpart of `convert_img`, returns the converted image bits."""
+    return encode_img(io.BytesIO(Path(spool_fn).read_bytes()), Path(output_fn))
+
+
+class SourceImage(NamedTuple):
+    """Source of a downloaded image on BDRC S3.
+
+    Args:
+        key (str): key of the image in `BDRC_ARCHIVE_BUCKET`
+        md5 (str): md5 hex digest of the image bytes
+    """
+
+    key: str
+    md5: str
 
 
 class BDRCImageDownloader:
-    def __init__(self, bdrc_scan_id: str, output_dir: Path) -> None:
+    """Download the images of a bdrc scan from BDRC S3.
+
+    Args:
+        bdrc_scan_id (str): bdrc scan id
+        output_dir (Path): directory to save the images of the scan
+        max_workers (int): number of images fetched concurrently per image group.
+            Defaults to 1, ie. images are fetched one at a time.
+        conversion_processes (int, optional): number of processes converting the
+            images, None for one per cpu. Defaults to 0, ie. the images are
+            converted on the download threads. The processes are spawned, they
+            import `__main__` again, so a script starting the download must
+            guard it with `if __name__ == "__main__"`.
+        in_memory_images (bool): keep the images in memory, in `img_bytes` by the
+            path they would be saved to, instead of saving them. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        bdrc_scan_id: str,
+        output_dir: Path,
+        max_workers: int = 1,
+        conversion_processes: Optional[int] = 0,
+        in_memory_images: bool = False,
+    ) -> None:
         self.bdrc_scan_id = bdrc_scan_id
         self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.conversion_processes = conversion_processes
+        self.in_memory_images = in_memory_images
+        self.img_bytes: dict[Path, bytes] = {}
+        self._conversion_executor: Optional[ProcessPoolExecutor] = None
+        self._conversion_lock = threading.Lock()
+        self.failed_images: dict[str, list[str]] = {}
+        # source of each saved image, by saved image path
+        self.source_images: dict[Path, SourceImage] = {}
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
     def get_img_groups(self):
         """
@@ -30,62 +204,250 @@ class BDRCImageDownloader:
             yield img["filename"]
 
     def save_img_with_wand(self, fp: io.BytesIO, fn: Path) -> bool:
-        try:
-            with WandImage(blob=fp.getvalue()) as img:
-                img.format = "png"
-                img.save(filename=str(fn))
-                return True
-        except Exception:
-            logging.exception(f"Failed to save {fn} with `Wand`")
-            return False
+        return save_img_with_wand(fp, fn)
 
     def save_img_with_pillow(self, fp: io.BytesIO, fn: Path) -> bool:
+        return save_img_with_pillow(fp, fn)
+
+    def get_conversion_executor(self) -> ProcessPoolExecutor:
+        with self._conversion_lock:
+            if self._conversion_executor is None:
+                # spawned, forking the download threads isn't safe
+                self._conversion_executor = ProcessPoolExecutor(
+                    max_workers=self.conversion_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._conversion_executor
+
+    def convert_img_in_process(
+        self, convert_fn: Callable[[str, str], T], fp: io.BytesIO, output_fn: Path
+    ) -> Optional[T]:
+        """Run `convert_fn` on the image bits `fp` in a conversion process.
+
+        The image bits are spooled to a temporary file read by the conversion
+        process. The download thread waits for the conversion without holding
+        the GIL, so the other downloads go on.
+
+        Returns:
+            the result of `convert_fn`, None if the conversion process failed
         """
-        uses pillow to interpret the bits as an image and save as a format
-        that is appropriate for Google Vision (png instead of tiff for instance).
-        """
+        executor = self.get_conversion_executor()
+        spool_fd, spool_fn = tempfile.mkstemp(prefix="ocr-pipelines-", suffix=".img")
         try:
-            img = PillowImage.open(fp)
-            img.save(str(fn))
+            with os.fdopen(spool_fd, "wb") as spool_f:
+                spool_f.write(fp.getbuffer())
+            return executor.submit(convert_fn, spool_fn, str(output_fn)).result()
         except Exception:
-            logging.exception(f"Failed to save {fn} with `Pillow`")
-            return False
+            self.logger.exception(f"Failed to convert {output_fn}")
+            return None
+        finally:
+            os.unlink(spool_fn)
 
-        return True
+    def close(self):
+        """Shut down the conversion processes, if any."""
+        with self._conversion_lock:
+            if self._conversion_executor is not None:
+                self._conversion_executor.shutdown()
+                self._conversion_executor = None
+
+    @staticmethod
+    def get_img_output_fn(fn: Union[str, Path], img_group_dir: Path) -> Path:
+        """Returns the path where the image `fn` is saved in `img_group_dir`"""
+        fn = Path(fn)
+        if fn.suffix in [".tif", ".tiff", ".TIF"]:
+            return img_group_dir / f"{fn.stem}.png"
+        return img_group_dir / fn.name
 
-    def save_img(self, fp: io.BytesIO, fn: Union[str, Path], img_group_dir: Path):
-        """Save the image in .png format to `img_groupdir/fn
+    def save_img(
+        self, fp: io.BytesIO, fn: Union[str, Path], img_group_dir: Path
+    ) -> bool:
+        """Save the image to `img_groupdir/fn`
 
-        Google Vision API does not support bdrc tiff images.
+        The format is detected from the image bits. The formats accepted by the
+        ocr engines are written as they are, without decoding. The others, like
+        the bdrc tiff images Google Vision API does not support, are converted
+        to png.
 
         Args:
             fp (io.BytesIO): image bits
             fn (str): filename
             img_group_dir (Path): directory to save the image
-        """
-        output_fn = img_group_dir / fn
-        fn = Path(fn)
-        if fn.suffix in [".tif", ".tiff", ".TIF"]:
-            output_fn = img_group_dir / f"{fn.stem}.png"
 
+        Returns:
+            bool: True if the image is saved, False otherwise
+        """
+        output_fn = self.get_img_output_fn(fn, img_group_dir)
+        if detect_img_format(fp.getbuffer()[:16].tobytes()) in RAW_IMG_FORMATS:
+            write_atomic(fp.getvalue(), output_fn)
+            return True
+        if self.conversion_processes != 0:
+            return bool(self.convert_img_in_process(convert_img, fp, output_fn))
         saved = self.save_img_with_pillow(fp, output_fn)
         if not saved:
-            self.save_img_with_wand(fp, output_fn)
+            saved = self.save_img_with_wand(fp, output_fn)
+        return saved
 
-    def save_img_group(self, img_group, img_group_dir):
-        s3_folder_prefix = buda_api.get_s3_folder_prefix(self.bdrc_scan_id, img_group)
-        for img_fn in self.get_s3_img_list(img_group):
-            img_path_s3 = Path(s3_folder_prefix) / img_fn
+    def get_img_bytes(
+        self, fp: io.BytesIO, fn: Union[str, Path], img_group_dir: Path
+    ) -> Optional[bytes]:
+        """In-memory counterpart of `save_img`, returns the image bits `save_img`
+        would write to `img_group_dir`, None if the conversion failed.
+        """
+        output_fn = self.get_img_output_fn(fn, img_group_dir)
+        if detect_img_format(fp.getbuffer()[:16].tobytes()) in RAW_IMG_FORMATS:
+            return fp.getvalue()
+        if self.conversion_processes != 0:
+            return self.convert_img_in_process(convert_img_to_bytes, fp, output_fn)
+        return encode_img(fp, output_fn)
+
+    def pop_img_bytes(self, saved_img_path: Path) -> Optional[bytes]:
+        """Returns the in-memory bits of the image `saved_img_path` and forgets
+        them, None if the image is on disk.
+        """
+        return self.img_bytes.pop(saved_img_path, None)
+
+    def fetch_img(self, s3_folder_prefix: str, img_fn: str) -> Optional[io.BytesIO]:
+        """Fetch the image bits of `img_fn` from BDRC S3.
+
+        Returns:
+            io.BytesIO: image bits, None if the image is missing or empty
+        """
+        img_path_s3 = Path(s3_folder_prefix) / img_fn
+        try:
             img_bits = buda_api.gets3blob(str(img_path_s3))
-            if img_bits:
-                self.save_img(img_bits, img_fn, img_group_dir)
+        except Exception:
+            self.logger.exception(f"Failed to fetch {img_path_s3}")
+            return None
+        if img_bits is None:
+            self.logger.error(f"Image {img_path_s3} not found")
+            return None
+        if isinstance(img_bits, io.BytesIO) and not img_bits.getbuffer().nbytes:
+            self.logger.error(f"Image {img_path_s3} is empty")
+            return None
+        return img_bits
+
+    def download_img(
+        self, img_fn: str, s3_folder_prefix: str, img_group_dir: Path
+    ) -> Optional[Path]:
+        """Fetch `img_fn` and save it to `img_group_dir`, or keep it in `img_bytes`
+        in in-memory mode.
+
+        Returns:
+            Path: path of the saved image, None if it failed to download or save
+        """
+        img_bits = self.fetch_img(s3_folder_prefix, img_fn)
+        if img_bits is None:
+            return None
+        saved_img_path = self.get_img_output_fn(img_fn, img_group_dir)
+        if self.in_memory_images:
+            img_bytes = self.get_img_bytes(img_bits, img_fn, img_group_dir)
+            if img_bytes is None:
+                return None
+            self.img_bytes[saved_img_path] = img_bytes
+        elif not self.save_img(img_bits, img_fn, img_group_dir):
+            return None
+        self.source_images[saved_img_path] = SourceImage(
+            key=str(Path(s3_folder_prefix) / img_fn),
+            md5=hashlib.md5(img_bits.getbuffer()).hexdigest(),
+        )
+        return saved_img_path
+
+    def iter_img_group(
+        self,
+        img_group: str,
+        img_group_dir: Path,
+        page_slots: Optional[PageSlots] = None,
+    ) -> Iterator[tuple[str, Optional[Path]]]:
+        """Download the images of `img_group` to `img_group_dir`.
+
+        Yields `(img_fn, saved_img_path)` in filename order as soon as each image
+        is saved, `saved_img_path` is None for the images that failed. With
+        `max_workers` > 1 the images are fetched and saved by a thread pool
+        which never runs more than `2 * max_workers` images ahead of the consumer.
+
+        With `page_slots`, a slot is taken before fetching each image and the
+        download stops once the slots are stopped. The images fetched ahead of the
+        consumer hold fewer than `page_slots.n_slots` slots, so the consumer always
+        has a page which frees a slot.
+        """
+        s3_folder_prefix = buda_api.get_s3_folder_prefix(self.bdrc_scan_id, img_group)
+        img_fns = sorted(self.get_s3_img_list(img_group))
+        img_fns_to_fetch: Iterable[str] = img_fns
+        max_pending = self.max_workers * 2
+        if page_slots is not None:
+            img_fns_to_fetch = page_slots.iter_with_slots(img_fns)
+            max_pending = max(1, min(max_pending, page_slots.n_slots))
+
+        def download_img(img_fn: str) -> Optional[Path]:
+            return self.download_img(img_fn, s3_folder_prefix, img_group_dir)
+
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                saved_img_paths = bounded_map(
+                    executor, download_img, img_fns_to_fetch, max_pending=max_pending
+                )
+                yield from zip(img_fns, saved_img_paths)
+        else:
+            for img_fn in img_fns_to_fetch:
+                yield img_fn, download_img(img_fn)
+
+    def save_img_group(self, img_group: str, img_group_dir: Path) -> list[str]:
+        """Download all the images of `img_group` to `img_group_dir`.
+
+        Returns:
+            list[str]: filenames of the images that failed to download or save
+        """
+        n_imgs = 0
+        failed_img_fns = []
+        for img_fn, saved_img_path in self.iter_img_group(img_group, img_group_dir):
+            n_imgs += 1
+            if saved_img_path is None:
+                failed_img_fns.append(img_fn)
+
+        if failed_img_fns:
+            self.logger.error(
+                f"{len(failed_img_fns)}/{n_imgs} images of {img_group} failed to download"
+            )
+        return failed_img_fns
+
+    def iter_download(
+        self, page_slots: Optional[PageSlots] = None
+    ) -> Iterator[tuple[str, Path]]:
+        """Download the images of the scan like `download`.
+
+        Yields `(img_group_id, saved_img_path)` as soon as each image is saved,
+        failed images are recorded in `failed_images`. With `page_slots`, a slot
+        is taken before fetching each image, the consumer releases the slots of
+        the yielded images and the slots of the failed images are released here.
+        """
+        bdrc_scan_dir = self.output_dir / self.bdrc_scan_id
+        try:
+            for img_group_id in self.get_img_groups():
+                img_group_dir = bdrc_scan_dir / img_group_id
+                img_group_dir.mkdir(exist_ok=True, parents=True)
+                for img_fn, saved_img_path in self.iter_img_group(
+                    img_group_id, img_group_dir, page_slots
+                ):
+                    if saved_img_path is None:
+                        self.failed_images.setdefault(img_group_id, []).append(img_fn)
+                        if page_slots is not None:
+                            page_slots.release()
+                        continue
+                    yield img_group_id, saved_img_path
+        finally:
+            self.close()
 
     def download(self):
         bdrc_scan_dir = self.output_dir / self.bdrc_scan_id
         bdrc_scan_dir.mkdir(exist_ok=True, parents=True)
-        for img_group_id in self.get_img_groups():
-            img_group_dir = bdrc_scan_dir / img_group_id
-            img_group_dir.mkdir(exist_ok=True, parents=True)
-            self.save_img_group(img_group_id, img_group_dir)
+        try:
+            for img_group_id in self.get_img_groups():
+                img_group_dir = bdrc_scan_dir / img_group_id
+                img_group_dir.mkdir(exist_ok=True, parents=True)
+                failed_img_fns = self.save_img_group(img_group_id, img_group_dir)
+                if failed_img_fns:
+                    self.failed_images[img_group_id] = failed_img_fns
+        finally:
+            self.close()
 
         return bdrc_scan_dir
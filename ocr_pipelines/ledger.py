@@ -0,0 +1,329 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+# stages of a page, only the ocr of the pages is tracked
+STAGE_OCR = "ocr"
+
+# states of a page at a stage
+PAGE_PENDING = "pending"
+PAGE_CLAIMED = "claimed"
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    scan_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    img_group TEXT NOT NULL,
+    page TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    lease_until REAL,
+    finished_at REAL,
+    duration REAL,
+    n_bytes INTEGER,
+    error TEXT,
+    PRIMARY KEY (scan_id, stage, img_group, page)
+);
+CREATE INDEX IF NOT EXISTS pages_state ON pages (scan_id, stage, state);
+CREATE TABLE IF NOT EXISTS stage_ends (
+    scan_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    n_finished INTEGER NOT NULL,
+    claimed_at REAL NOT NULL,
+    PRIMARY KEY (scan_id, stage)
+);
+"""
+
+
+def get_worker_id() -> str:
+    """Returns the id of the current process, unique across the nodes."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class PageJob(NamedTuple):
+    """A page claimed at a stage."""
+
+    scan_id: str
+    stage: str
+    img_group: str
+    page: str
+    attempts: int
+
+
+class JobLedger:
+    """SQLite ledger of the state of each page of the scans at each stage, the
+    pipelines only track the ocr of the pages (`STAGE_OCR`).
+
+    The pages are claimed atomically by the workers, which may be processes of
+    several nodes sharing the ledger file, and the claim of a worker expires
+    after `lease_seconds` so the pages of a dead worker are claimed again. A
+    page failing `max_attempts` times is left failed. The ledger file must be
+    on a filesystem with working locks.
+
+    Args:
+        path (Path): path of the ledger file
+        lease_seconds (float): duration of a claim
+        max_attempts (int): number of claims of a page before it is failed
+        timeout (float): seconds to wait for the lock of the ledger
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = 600.0,
+        max_attempts: int = 3,
+        timeout: float = 60.0,
+    ) -> None:
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread, sqlite connections can't be shared
+        between threads.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the statements in a transaction holding the write lock from the
+        start, so the reads of the transaction aren't stale.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def add_pages(
+        self,
+        scan_id: str,
+        stage: str,
+        pages: Iterable[tuple[str, str]],
+        state: str = PAGE_PENDING,
+    ) -> int:
+        """Add the `(img_group, page)` of `pages` at `stage` in `state`, the pages
+        already in the ledger are left unchanged.
+
+        Returns:
+            int: number of pages added
+        """
+        now = time.time()
+        finished_at = now if state == PAGE_DONE else None
+        with self.transaction() as connection:
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO pages "
+                "(scan_id, stage, img_group, page, state, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (scan_id, stage, img_group, page, state, finished_at)
+                    for img_group, page in pages
+                ],
+            )
+            return cursor.rowcount
+
+    def has_pages(self, scan_id: str, stage: str) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM pages WHERE scan_id = ? AND stage = ? LIMIT 1",
+            (scan_id, stage),
+        ).fetchone()
+        return row is not None
+
+    def claim(
+        self, scan_id: str, stage: str, worker: str, limit: int = 1
+    ) -> list[PageJob]:
+        """Claim at most `limit` pending pages of `scan_id` at `stage`, and the
+        claimed pages whose lease expired, in order.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            # the pages of dead workers which were claimed too many times
+            connection.execute(
+                "UPDATE pages SET state = ?, error = ? "
+                "WHERE scan_id = ? AND stage = ? AND state = ? AND lease_until < ? "
+                "AND attempts >= ?",
+                (
+                    PAGE_FAILED,
+                    "lease expired",
+                    scan_id,
+                    stage,
+                    PAGE_CLAIMED,
+                    now,
+                    self.max_attempts,
+                ),
+            )
+            rows = connection.execute(
+                "SELECT rowid, img_group, page, attempts FROM pages "
+                "WHERE scan_id = ? AND stage = ? "
+                "AND (state = ? OR (state = ? AND lease_until < ?)) "
+                "ORDER BY img_group, page LIMIT ?",
+                (scan_id, stage, PAGE_PENDING, PAGE_CLAIMED, now, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE pages SET state = ?, worker = ?, attempts = attempts + 1, "
+                "claimed_at = ?, lease_until = ? WHERE rowid = ?",
+                [
+                    (PAGE_CLAIMED, worker, now, now + self.lease_seconds, row["rowid"])
+                    for row in rows
+                ],
+            )
+        return [
+            PageJob(scan_id, stage, row["img_group"], row["page"], row["attempts"] + 1)
+            for row in rows
+        ]
+
+    def complete(
+        self,
+        scan_id: str,
+        stage: str,
+        img_group: str,
+        page: str,
+        n_bytes: Optional[int] = None,
+    ):
+        """Mark the page done, with the size of its output."""
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE pages SET state = ?, finished_at = ?, "
+                "duration = ? - claimed_at, n_bytes = ?, error = NULL "
+                "WHERE scan_id = ? AND stage = ? AND img_group = ? AND page = ? "
+                "AND state != ?",
+                (
+                    PAGE_DONE,
+                    now,
+                    now,
+                    n_bytes,
+                    scan_id,
+                    stage,
+                    img_group,
+                    page,
+                    PAGE_DONE,
+                ),
+            )
+
+    def release(
+        self,
+        scan_id: str,
+        stage: str,
+        img_group: str,
+        page: str,
+        worker: str,
+        error: Optional[str] = None,
+    ):
+        """Give back the page claimed by `worker` which wasn't done. It is
+        pending again, or failed once it was claimed `max_attempts` times.
+        """
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE pages SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_until = NULL, error = ? "
+                "WHERE scan_id = ? AND stage = ? AND img_group = ? AND page = ? "
+                "AND state = ? AND worker = ?",
+                (
+                    self.max_attempts,
+                    PAGE_FAILED,
+                    PAGE_PENDING,
+                    error,
+                    scan_id,
+                    stage,
+                    img_group,
+                    page,
+                    PAGE_CLAIMED,
+                    worker,
+                ),
+            )
+
+    def claim_stage_end(self, scan_id: str, stage: str, worker: str) -> bool:
+        """Claim the work done once the pages of `scan_id` at `stage` are
+        finished, such as packing their outputs.
+
+        Only one worker gets the claim, once no page is pending or claimed. The
+        end of the stage is claimed again if pages were finished since.
+
+        Returns:
+            bool: True if `worker` claimed the end of the stage
+        """
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT SUM(state IN (?, ?)) AS n_unfinished, "
+                "SUM(state IN (?, ?)) AS n_finished FROM pages "
+                "WHERE scan_id = ? AND stage = ?",
+                (PAGE_PENDING, PAGE_CLAIMED, PAGE_DONE, PAGE_FAILED, scan_id, stage),
+            ).fetchone()
+            if row["n_unfinished"]:
+                return False
+            n_finished = row["n_finished"] or 0
+            stage_end = connection.execute(
+                "SELECT n_finished FROM stage_ends WHERE scan_id = ? AND stage = ?",
+                (scan_id, stage),
+            ).fetchone()
+            if stage_end is not None and stage_end["n_finished"] == n_finished:
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO stage_ends "
+                "(scan_id, stage, worker, n_finished, claimed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (scan_id, stage, worker, n_finished, time.time()),
+            )
+        return True
+
+    def get_pages(
+        self, scan_id: str, stage: Optional[str] = None, state: Optional[str] = None
+    ) -> list[dict]:
+        """Returns the pages of `scan_id`, at `stage` and in `state` if set."""
+        query = "SELECT * FROM pages WHERE scan_id = ?"
+        params: list = [scan_id]
+        if stage is not None:
+            query += " AND stage = ?"
+            params.append(stage)
+        if state is not None:
+            query += " AND state = ?"
+            params.append(state)
+        query += " ORDER BY stage, img_group, page"
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def get_counts(self, scan_id: str) -> dict[str, dict[str, int]]:
+        """Returns the number of pages of `scan_id` in each state, by stage."""
+        counts: dict[str, dict[str, int]] = {}
+        rows = self.connection.execute(
+            "SELECT stage, state, COUNT(*) AS n_pages FROM pages "
+            "WHERE scan_id = ? GROUP BY stage, state",
+            (scan_id,),
+        )
+        for row in rows:
+            counts.setdefault(row["stage"], {})[row["state"]] = row["n_pages"]
+        return counts
@@ -1,3 +1,4 @@
+import copy
 from datetime import datetime, timezone
 
 from ocr_pipelines.config import ImportConfig
@@ -34,6 +35,23 @@ class Metadata:
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    def update(self, **kwargs):
+        """Add `kwargs` to the additional metadata."""
+        self.kwargs.update(kwargs)
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    def copy(self) -> "Metadata":
+        """Returns a copy of the metadata, updated independently."""
+        return Metadata(
+            pipeline_config=self.pipeline_config,
+            sponsor=self.sponsor,
+            sponsor_consent=self.sponsor_consent,
+            timestamp=self.timestamp,
+            batch_id=self.batch_id,
+            **copy.deepcopy(self.kwargs),
+        )
+
     def to_dict(self):
         return {
             "timestamp": self.timestamp,
@@ -41,6 +59,7 @@ class Metadata:
             "ocr_engine": self.pipeline_config.ocr_engine,
             "ocr_model_type": self.pipeline_config.model_type,
             "ocr_lang_hint": self.pipeline_config.lang_hint,
+            "ocr_response_profile": self.pipeline_config.ocr_response_profile,
             "software_id": f"ocr-pipelines@v{self.pipeline_config.version}",
             "sponsor": self.sponsor,
             "sponsor_consent": self.sponsor_consent,
@@ -55,6 +74,8 @@ class Metadata:
             ocr_engine=metadata_dict["ocr_engine"],
             model_type=metadata_dict["ocr_model_type"],
             lang_hint=metadata_dict["ocr_lang_hint"],
+            # the outputs imported before the profiles were kept in full
+            ocr_response_profile=metadata_dict.pop("ocr_response_profile", "full"),
         )
         del metadata_dict["ocr_engine"]
         del metadata_dict["ocr_model_type"]
@@ -0,0 +1,188 @@
+import io
+import logging
+from typing import NamedTuple, Optional
+
+from PIL import Image as PillowImage
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover
+    HAS_NUMPY = False
+
+PAGE_BLANK = "blank"
+PAGE_DUPLICATE = "duplicate"
+
+# size the pages are decoded at, jpeg pages are decoded at a reduced scale
+DRAFT_SIZE = 1024
+# size of the pages on which the ink coverage is measured
+INK_SIZE = 256
+# width and height of the perceptual hash, in bits
+HASH_SIZE = 16
+
+
+class PageClass(NamedTuple):
+    """Class of a page which doesn't need to be ocred.
+
+    Args:
+        kind (str): `PAGE_BLANK` or `PAGE_DUPLICATE`
+        twin (str, optional): the earlier page a duplicate page is a copy of
+    """
+
+    kind: str
+    twin: Optional[str] = None
+
+
+class PageFilter:
+    """Flag the blank and near-duplicate pages of a scan, which don't need to be
+    sent to the ocr engine.
+
+    The ink of a page are its pixels, downsampled keeping the darkest pixel,
+    which differ from the background by more than `ink_contrast`. A page is
+    blank if less than `max_ink_coverage` of its pixels are ink. A page is a
+    near-duplicate of an earlier page of its image group if their perceptual
+    hashes differ by at most `max_hash_distance` bits and less than
+    `max_ink_diff` of their ink is not within a pixel of the other page's ink.
+
+    Requires numpy, installed with the `page-filter` extra.
+
+    Args:
+        skip_blank (bool): flag the blank pages
+        skip_duplicates (bool): flag the near-duplicate pages
+        max_ink_coverage (float): maximum ratio of ink pixels of a blank page
+        ink_contrast (int): minimum difference of an ink pixel to the background
+        max_hash_distance (int): maximum number of different hash bits of two
+            near-duplicate pages, out of `HASH_SIZE * HASH_SIZE`.
+        max_ink_diff (float): maximum ratio of the ink of two near-duplicate
+            pages which isn't in both pages.
+    """
+
+    def __init__(
+        self,
+        skip_blank: bool = True,
+        skip_duplicates: bool = True,
+        max_ink_coverage: float = 0.0005,
+        ink_contrast: int = 64,
+        max_hash_distance: int = 16,
+        max_ink_diff: float = 0.05,
+    ) -> None:
+        if not HAS_NUMPY:
+            raise ImportError(
+                "numpy is required to skip blank and duplicate pages, "
+                "install ocr_pipelines[page-filter]"
+            )
+        self.skip_blank = skip_blank
+        self.skip_duplicates = skip_duplicates
+        self.max_ink_coverage = max_ink_coverage
+        self.ink_contrast = ink_contrast
+        self.max_hash_distance = max_hash_distance
+        self.max_ink_diff = max_ink_diff
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        # hashes, ink and names of the pages seen, by image group
+        self._hashes: dict[str, list["np.ndarray"]] = {}
+        self._inks: dict[str, list["np.ndarray"]] = {}
+        self._page_names: dict[str, list[str]] = {}
+
+    @staticmethod
+    def load_gray(img_bytes: bytes) -> "np.ndarray":
+        img = PillowImage.open(io.BytesIO(img_bytes))
+        img.draft("L", (DRAFT_SIZE, DRAFT_SIZE))
+        return np.asarray(img.convert("L"))
+
+    @staticmethod
+    def downsample_min(gray: "np.ndarray", size: int) -> "np.ndarray":
+        """Downsample `gray` to about `size` pixels on its longer side keeping the
+        darkest pixel of each block, so thin strokes aren't washed out.
+        """
+        block = max(1, max(gray.shape) // size)
+        height = gray.shape[0] // block * block
+        width = gray.shape[1] // block * block
+        blocks = gray[:height, :width].reshape(
+            height // block, block, width // block, block
+        )
+        return blocks.min(axis=(1, 3))
+
+    def get_ink(self, gray: "np.ndarray") -> "np.ndarray":
+        """Returns the mask of the pixels of `gray`, downsampled, which differ
+        from the background, the median pixel, by more than `ink_contrast`.
+        """
+        small = self.downsample_min(gray, INK_SIZE).astype(np.int16)
+        background = np.median(small)
+        return np.abs(small - background) > self.ink_contrast
+
+    @staticmethod
+    def dilate(ink: "np.ndarray") -> "np.ndarray":
+        """Returns `ink` grown by a pixel in every direction."""
+        padded = np.pad(ink, 1)
+        height, width = ink.shape
+        dilated = np.zeros_like(ink)
+        for dy in range(3):
+            for dx in range(3):
+                rows, cols = slice(dy, dy + height), slice(dx, dx + width)
+                dilated |= padded[rows, cols]
+        return dilated
+
+    def get_ink_diff(self, ink: "np.ndarray", other_ink: "np.ndarray") -> float:
+        """Returns the ratio of the ink of two pages which isn't within a pixel of
+        the other page's ink, 1 if the pages don't have the same size.
+        """
+        if ink.shape != other_ink.shape:
+            return 1.0
+        n_diff = np.count_nonzero(ink & ~self.dilate(other_ink))
+        n_diff += np.count_nonzero(other_ink & ~self.dilate(ink))
+        n_ink = np.count_nonzero(ink) + np.count_nonzero(other_ink)
+        return n_diff / max(n_ink, 1)
+
+    @staticmethod
+    def get_hash(gray: "np.ndarray") -> "np.ndarray":
+        """Returns the difference hash of `gray`, as `HASH_SIZE * HASH_SIZE` bits."""
+        img = PillowImage.fromarray(gray).resize(
+            (HASH_SIZE + 1, HASH_SIZE), PillowImage.BOX
+        )
+        pixels = np.asarray(img, dtype=np.int16)
+        return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+    def find_twin(
+        self, img_group: str, page_hash: "np.ndarray", ink: "np.ndarray"
+    ) -> Optional[str]:
+        """Returns the earliest page of `img_group` the page is a near-duplicate of."""
+        hashes = self._hashes.get(img_group)
+        if not hashes:
+            return None
+        distances = np.count_nonzero(np.stack(hashes) != page_hash, axis=1)
+        for idx in np.flatnonzero(distances <= self.max_hash_distance):
+            if self.get_ink_diff(ink, self._inks[img_group][idx]) < self.max_ink_diff:
+                return self._page_names[img_group][idx]
+        return None
+
+    def classify(
+        self, img_group: str, page_name: str, img_bytes: bytes
+    ) -> Optional[PageClass]:
+        """Classify the page `page_name` of `img_group`, the pages of an image
+        group are compared with the pages classified before them.
+
+        Returns:
+            PageClass: the class of the page, None if it must be ocred
+        """
+        try:
+            gray = self.load_gray(img_bytes)
+        except Exception as e:
+            self.logger.warning(f"failed to load {page_name} to classify it: {e}")
+            return None
+
+        ink = self.get_ink(gray)
+        if self.skip_blank and np.mean(ink) < self.max_ink_coverage:
+            return PageClass(PAGE_BLANK)
+        if not self.skip_duplicates:
+            return None
+
+        page_hash = self.get_hash(gray)
+        twin = self.find_twin(img_group, page_hash, ink)
+        if twin is not None:
+            return PageClass(PAGE_DUPLICATE, twin)
+        self._hashes.setdefault(img_group, []).append(page_hash)
+        self._inks.setdefault(img_group, []).append(ink)
+        self._page_names.setdefault(img_group, []).append(page_name)
+        return None
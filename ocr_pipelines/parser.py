@@ -1,6 +1,9 @@
+import gzip
+import json
 from pathlib import Path
 from typing import Union
 
+from openpecha.buda.api import image_group_to_folder_name
 from openpecha.core import ids
 from openpecha.core.pecha import OpenPechaGitRepo
 from openpecha.formatters.ocr.google_vision import (
@@ -9,6 +12,7 @@ from openpecha.formatters.ocr.google_vision import (
 )
 from openpecha.formatters.ocr.hocr import BDRCGBFileProvider, HOCRFormatter
 
+from ocr_pipelines.archive import OCR_OUTPUT_SUFFIX, OcrOutputArchiveReader
 from ocr_pipelines.config import ImportConfig, ReimportConfig
 from ocr_pipelines.engines import GoogleVisionEngine
 from ocr_pipelines.exceptions import DataProviderNotSupported, OCREngineNotSupported
@@ -16,13 +20,33 @@ from ocr_pipelines.metadata import Metadata
 
 ConfigType = Union[ImportConfig, ReimportConfig]
 
+
+class GoogleVisionBDRCArchiveProvider(GoogleVisionBDRCFileProvider):
+    """Google Vision data provider which reads the ocr outputs packed in image
+    group archives, and falls back to the ocr output files of the image groups
+    which aren't packed.
+    """
+
+    def __init__(self, bdrc_scan_id, ocr_import_info, ocr_disk_path=None, mode="local"):
+        super().__init__(bdrc_scan_id, ocr_import_info, ocr_disk_path, mode)
+        self.archive_reader = OcrOutputArchiveReader(ocr_disk_path)
+
+    def get_image_data(self, image_group_id, image_id):
+        vol_folder = image_group_to_folder_name(self.bdrc_scan_id, image_group_id)
+        ocr_output_fn = f"{Path(image_id).stem}{OCR_OUTPUT_SUFFIX}"
+        gzip_ocr_output = self.archive_reader.read(vol_folder, ocr_output_fn)
+        if gzip_ocr_output is None:
+            return super().get_image_data(image_group_id, image_id)
+        return json.loads(gzip.decompress(gzip_ocr_output))
+
+
 PARSERS_REGISTER = {
     GoogleVisionEngine.__name__: GoogleVisionFormatter,
     "hocr": HOCRFormatter,
 }
 
 DATA_PROVIDER_REGISTER = {
-    GoogleVisionEngine.__name__: GoogleVisionBDRCFileProvider,
+    GoogleVisionEngine.__name__: GoogleVisionBDRCArchiveProvider,
     "hocr": BDRCGBFileProvider,
 }
 
@@ -1,50 +1,195 @@
+import copy
+import logging
+import os
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, NamedTuple, Optional, Sequence
 
+import boto3
+from boto3.s3.transfer import TransferConfig
 from openpecha.core.pecha import OpenPechaFS
 from openpecha.utils import download_pecha_assets
 
+from ocr_pipelines.batch import BatchImportReport, ScanImportResult, estimate_page_count
 from ocr_pipelines.config import ImportConfig, ReimportConfig
-from ocr_pipelines.executor import OCRExecutor
+from ocr_pipelines.engines import OcrEngine
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.executor import OCRExecutor, get_ocr_engine
 from ocr_pipelines.image_downloader import BDRCImageDownloader
 from ocr_pipelines.metadata import Metadata
 from ocr_pipelines.parser import OCRParser
+from ocr_pipelines.streaming import StreamingImportRunner
 from ocr_pipelines.update_pecha import update_pecha
 from ocr_pipelines.upload import BdrcS3Uploader
 
+logger = logging.getLogger(__name__)
+
+# status of an import whose scan is finished by other workers of the job ledger
+LEFT_TO_OTHER_WORKERS = "left to other workers"
+
+
+class PipelineClients(NamedTuple):
+    """Long-lived clients shared by the imports of a multi-scan run.
+
+    Args:
+        ocr_engine (OcrEngine): ocr engine, with its vision clients and quota
+        s3_client: s3 client of the uploaders
+        hedging_policies (list[HedgingPolicy]): hedging policies of the google
+            vision engines of `ocr_engine`
+    """
+
+    ocr_engine: OcrEngine
+    s3_client: Any
+    hedging_policies: Sequence[HedgingPolicy] = ()
+
+
+def get_pipeline_clients(config: ImportConfig) -> PipelineClients:
+    """Returns the clients of a multi-scan run, created before the import threads
+    start since the default boto3 session isn't thread-safe.
+    """
+    hedging_policies: list[HedgingPolicy] = []
+    ocr_engine = get_ocr_engine(config, config.images_path, hedging_policies)
+    return PipelineClients(
+        ocr_engine=ocr_engine,
+        s3_client=boto3.session.Session().client("s3"),
+        hedging_policies=hedging_policies,
+    )
+
+
+def get_scan_config(config: ImportConfig, max_workers: int) -> ImportConfig:
+    """Returns the config of a scan imported along `max_workers` - 1 other scans,
+    the conversion processes of `config`, one per cpu if None, are divided
+    between the scans. The images are converted on the download threads if
+    `config` has no conversion processes, the default.
+    """
+    if config.conversion_processes == 0 or max_workers <= 1:
+        return config
+    scan_config = copy.copy(config)
+    conversion_processes = config.conversion_processes or os.cpu_count() or 1
+    scan_config.conversion_processes = max(1, conversion_processes // max_workers)
+    return scan_config
+
+
+def interleave_by_size(
+    bdrc_scan_ids: list[str], estimates: dict[str, int]
+) -> list[str]:
+    """Returns `bdrc_scan_ids` alternating the largest and the smallest scans
+    left, so the large scans don't start last and the small scans don't wait
+    for all the large ones.
+    """
+    by_size = sorted(bdrc_scan_ids, key=lambda scan_id: estimates[scan_id])
+    scheduled_scan_ids = []
+    while by_size:
+        scheduled_scan_ids.append(by_size.pop())
+        if by_size:
+            scheduled_scan_ids.append(by_size.pop(0))
+    return scheduled_scan_ids
+
 
 def get_pecha_url(pecha_id: str) -> str:
     return f"https://github.com/OpenPecha-Data/{pecha_id}"
 
 
+def get_transfer_config(config: ImportConfig) -> Optional[TransferConfig]:
+    """Returns the config of the managed uploads, None for sequential uploads."""
+    if config.upload_workers <= 1:
+        return None
+    return TransferConfig(
+        multipart_threshold=config.upload_multipart_threshold,
+        multipart_chunksize=config.upload_multipart_chunksize,
+    )
+
+
 def import_pipeline(
-    bdrc_scan_id: str, config: ImportConfig, metadata: Metadata
+    bdrc_scan_id: str,
+    config: ImportConfig,
+    metadata: Metadata,
+    batch_id_cache: Optional[dict[str, str]] = None,
+    clients: Optional[PipelineClients] = None,
 ) -> dict:
     """Pipeline for importing ocred pecha to opf
 
+    With `config.job_ledger_path`, several workers share the ocr of the scan,
+    only the worker finishing its last pages uploads and publishes it.
+
     Args:
         bdrc_scan_id (str): bdrc scan id
         config (ImportConfig): import config object
+        batch_id_cache (dict, optional): batch assigned to each scan, shared by
+            the imports of a multi-scan run
+        clients (PipelineClients, optional): clients shared by the imports of a
+            multi-scan run, new clients are created if None
 
     Returns:
-        dict: pecha id and pecha url
+        dict: pecha id and pecha url, None with the status
+            `LEFT_TO_OTHER_WORKERS` if the scan is published by another worker
     """
 
     downloader = BDRCImageDownloader(
-        bdrc_scan_id=bdrc_scan_id, output_dir=config.images_path
+        bdrc_scan_id=bdrc_scan_id,
+        output_dir=config.images_path,
+        max_workers=config.download_workers,
+        conversion_processes=config.conversion_processes,
+        # the non-streaming import ocrs the images once they are all on disk
+        in_memory_images=config.streaming and config.in_memory_images,
     )
-    saved_images_dir = downloader.download()
-
-    ocr_executor = OCRExecutor(config=config, image_download_dir=saved_images_dir)
-    ocr_output_path = ocr_executor.run()
+    uploader = BdrcS3Uploader(
+        bdrc_scan_id=bdrc_scan_id,
+        service=config.ocr_engine,
+        # a resumed import is uploaded to the batch of the failed run
+        batch=metadata.batch_id,
+        max_workers=config.upload_workers,
+        transfer_config=get_transfer_config(config),
+        sync=config.upload_sync,
+        reserve_batch=config.reserve_batch,
+        batch_id_cache=batch_id_cache,
+        source_images=downloader.source_images,
+        client=clients.s3_client if clients else None,
+    )
+    ocr_engine = clients.ocr_engine if clients else None
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        uploader = BdrcS3Uploader(bdrc_scan_id=bdrc_scan_id, service=config.ocr_engine)
+    if config.streaming:
+        saved_images_dir = config.images_path / bdrc_scan_id
+        ocr_executor = OCRExecutor(
+            config=config, image_download_dir=saved_images_dir, ocr_engine=ocr_engine
+        )
+        runner = StreamingImportRunner(
+            downloader=downloader,
+            ocr_executor=ocr_executor,
+            uploader=uploader,
+            max_pages_in_flight=config.max_pages_in_flight,
+        )
+        ocr_output_path = runner.run(metadata=metadata.to_dict())
+        if ocr_executor.image_scale_factors:
+            metadata.update(image_scale_factors=ocr_executor.image_scale_factors)
+            uploader.upload_metadata(metadata.to_dict())
+    else:
+        saved_images_dir = downloader.download()
+        ocr_executor = OCRExecutor(
+            config=config, image_download_dir=saved_images_dir, ocr_engine=ocr_engine
+        )
+        ocr_output_path = ocr_executor.run()
+        if not ocr_executor.scan_finished:
+            # the pages claimed by the other workers of the ledger aren't ocred
+            # yet, the last worker uploads and publishes the scan
+            return {
+                "pecha_id": None,
+                "pecha_url": None,
+                "status": LEFT_TO_OTHER_WORKERS,
+            }
+        if ocr_executor.image_scale_factors:
+            metadata.update(image_scale_factors=ocr_executor.image_scale_factors)
+        if ocr_executor.page_filter is not None:
+            metadata.update(skipped_pages=ocr_executor.skipped_pages)
         uploader.upload(
             ocr_images_path=saved_images_dir,
             ocr_outputs_path=ocr_output_path,
             metadata=metadata.to_dict(),
         )
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
         metadata.batch_id = uploader.batch
         ocr_parser = OCRParser(
             config=config,
@@ -66,6 +211,103 @@ def import_pipeline(
         return result
 
 
+def import_scan(
+    bdrc_scan_id: str,
+    estimated_pages: int,
+    config: ImportConfig,
+    metadata: Metadata,
+    batch_id_cache: dict[str, str],
+    clients: PipelineClients,
+) -> ScanImportResult:
+    """Import `bdrc_scan_id` as part of a multi-scan run, the errors are returned
+    in the result instead of raised.
+    """
+    start = time.monotonic()
+    try:
+        pecha = import_pipeline(
+            bdrc_scan_id,
+            config,
+            metadata.copy(),
+            batch_id_cache=batch_id_cache,
+            clients=clients,
+        )
+    except Exception as e:
+        logger.exception(e)
+        return ScanImportResult(
+            bdrc_scan_id,
+            estimated_pages,
+            time.monotonic() - start,
+            error=f"{e.__class__.__name__}: {e}",
+        )
+    return ScanImportResult(
+        bdrc_scan_id, estimated_pages, time.monotonic() - start, pecha=pecha
+    )
+
+
+def batch_import_pipeline(
+    bdrc_scan_ids: list[str],
+    config: ImportConfig,
+    metadata: Metadata,
+    max_workers: int = 1,
+    batch_id_cache: Optional[dict[str, str]] = None,
+    clients: Optional[PipelineClients] = None,
+) -> BatchImportReport:
+    """Pipeline for importing several ocred pechas to opf.
+
+    The scans are imported by `max_workers` workers, alternating the largest and
+    the smallest scans. The ocr engine and the s3 client are shared by the
+    imports, the conversion processes are divided between the workers and a
+    failed import doesn't stop the others.
+
+    Args:
+        bdrc_scan_ids (list[str]): bdrc scan ids
+        config (ImportConfig): import config object
+        metadata (Metadata): metadata of the imports, copied for each scan
+        max_workers (int): number of scans imported concurrently
+        batch_id_cache (dict, optional): batch assigned to each scan
+        clients (PipelineClients, optional): clients shared by the imports, new
+            clients are created if None
+
+    Returns:
+        BatchImportReport: result or error of each scan
+    """
+    bdrc_scan_ids = list(dict.fromkeys(bdrc_scan_ids))
+    if clients is None:
+        clients = get_pipeline_clients(config)
+    if batch_id_cache is None:
+        batch_id_cache = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        estimates = dict(
+            zip(bdrc_scan_ids, executor.map(estimate_page_count, bdrc_scan_ids))
+        )
+    scheduled_scan_ids = interleave_by_size(bdrc_scan_ids, estimates)
+    scan_config = get_scan_config(config, max_workers)
+    logger.info(
+        f"importing {len(scheduled_scan_ids)} scans of about "
+        f"{sum(estimates.values())} pages with {max_workers} workers"
+    )
+
+    report = BatchImportReport(n_scans=len(scheduled_scan_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                import_scan,
+                scan_id,
+                estimates[scan_id],
+                scan_config,
+                metadata,
+                batch_id_cache,
+                clients,
+            )
+            for scan_id in scheduled_scan_ids
+        ]
+        for future in as_completed(futures):
+            report.add(future.result())
+    report.add_hedging_stats(clients.hedging_policies)
+    return report
+
+
 def reimport_pipeline(pecha_id: str, config: ReimportConfig, metadata: Metadata):
     """Pipeline to reimport ocr pecha to opf incase of update in opf parser
 
@@ -0,0 +1,93 @@
+import io
+import logging
+import math
+from typing import Optional
+
+from PIL import Image as PillowImage
+
+# formats the preprocessed images are encoded in, the others are encoded in png
+ENCODED_IMG_FORMATS = {"JPEG", "PNG", "GIF", "BMP", "WEBP"}
+# quality of the resampled jpeg images
+JPEG_QUALITY = 90
+# margin taken below the byte budget when estimating the next scale
+BYTES_SCALE_MARGIN = 0.9
+# maximum number of downscales to get under the byte budget
+MAX_DOWNSCALES = 5
+
+
+class ImagePreprocessor:
+    """Downscale the page images before they are sent to the ocr engine.
+
+    Images larger than `max_pixels` are resampled down to `max_pixels`, and
+    images still larger than `max_bytes` once encoded are downscaled further
+    until they fit. The images within the limits are returned unchanged.
+
+    Args:
+        max_pixels (int, optional): maximum number of pixels of an image
+        max_bytes (int, optional): maximum size of an encoded image
+    """
+
+    def __init__(
+        self, max_pixels: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    def get_pixels_scale(self, img: PillowImage.Image) -> float:
+        """Returns the scale bringing `img` down to `max_pixels`, at most 1."""
+        n_pixels = img.width * img.height
+        if self.max_pixels is None or n_pixels <= self.max_pixels:
+            return 1.0
+        return math.sqrt(self.max_pixels / n_pixels)
+
+    @staticmethod
+    def resample(img: PillowImage.Image, scale: float) -> PillowImage.Image:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        if img.mode == "1":
+            # bilevel images are resampled in grayscale and thresholded back
+            resampled = img.convert("L").resize(size, PillowImage.LANCZOS)
+            return resampled.convert("1", dither=PillowImage.NONE)
+        if img.mode not in ("L", "RGB", "RGBA"):
+            img = img.convert("RGB")
+        return img.resize(size, PillowImage.LANCZOS)
+
+    @staticmethod
+    def encode(img: PillowImage.Image, img_format: str) -> bytes:
+        encoded_fp = io.BytesIO()
+        if img_format == "JPEG":
+            if img.mode not in ("L", "RGB"):
+                img = img.convert("RGB")
+            img.save(encoded_fp, format=img_format, quality=JPEG_QUALITY)
+        else:
+            img.save(encoded_fp, format=img_format, optimize=True)
+        return encoded_fp.getvalue()
+
+    def preprocess(self, img_bytes: bytes) -> tuple[bytes, float]:
+        """Downscale the image `img_bytes` to the pixel and byte limits.
+
+        Returns:
+            tuple[bytes, float]: the preprocessed image and its scale factor
+                relative to the original image, 1 if it is unchanged.
+        """
+        img = PillowImage.open(io.BytesIO(img_bytes))
+        scale = self.get_pixels_scale(img)
+        within_bytes = self.max_bytes is None or len(img_bytes) <= self.max_bytes
+        if scale == 1.0 and within_bytes:
+            return img_bytes, 1.0
+
+        img_format = img.format if img.format in ENCODED_IMG_FORMATS else "PNG"
+        img.load()
+        encoded = self.encode(self.resample(img, scale), img_format)
+        for _ in range(MAX_DOWNSCALES):
+            if self.max_bytes is None or len(encoded) <= self.max_bytes:
+                break
+            scale *= math.sqrt(self.max_bytes / len(encoded)) * BYTES_SCALE_MARGIN
+            encoded = self.encode(self.resample(img, scale), img_format)
+        else:
+            if len(encoded) > self.max_bytes:  # type: ignore
+                self.logger.warning(
+                    f"image of {len(encoded)} bytes still above {self.max_bytes} "
+                    f"bytes after {MAX_DOWNSCALES} downscales"
+                )
+        return encoded, scale
@@ -0,0 +1,151 @@
+import gzip
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Optional
+
+# number of characters of the ocr output encoded and compressed at once
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+def get_tmp_fn(result_fn: Path) -> Path:
+    """Returns the temporary path `result_fn` is written to before being renamed."""
+    return result_fn.with_name(f".{result_fn.name}.tmp")
+
+
+def is_tmp_fn(fn: Path) -> bool:
+    return fn.name.startswith(".") and fn.name.endswith(".tmp")
+
+
+def write_atomic(data: bytes, fn: Path):
+    """Write `data` to a temporary file renamed to `fn` once complete."""
+    tmp_fn = get_tmp_fn(fn)
+    tmp_fn.write_bytes(data)
+    os.replace(tmp_fn, fn)
+
+
+def write_gzip_json(result_json: str, result_fn: Path, compresslevel: int = 9):
+    """Stream `result_json` into the gzip file `result_fn`.
+
+    The ocr output is compressed by chunks to a temporary file renamed to
+    `result_fn` once complete, so `result_fn` is never left truncated.
+    """
+    tmp_fn = get_tmp_fn(result_fn)
+    with open(tmp_fn, "wb") as f:
+        # no filename in the gzip header
+        with gzip.GzipFile(
+            filename="", mode="wb", compresslevel=compresslevel, fileobj=f
+        ) as gzip_f:
+            for chunk_start in range(0, len(result_json), WRITE_CHUNK_SIZE):
+                chunk_end = chunk_start + WRITE_CHUNK_SIZE
+                gzip_f.write(result_json[chunk_start:chunk_end].encode())
+    os.replace(tmp_fn, result_fn)
+
+
+class ResultWriter:
+    """Write gzipped ocr outputs on a background thread.
+
+    Compressing and writing the ocr outputs overlaps with the ocr requests. At
+    most `max_pending` outputs wait to be written, `submit` blocks when the
+    writer falls behind.
+
+    Args:
+        compresslevel (int): gzip compression level, from 1 (fastest) to 9
+        max_pending (int): maximum number of ocr outputs waiting to be written
+    """
+
+    def __init__(self, compresslevel: int = 9, max_pending: int = 64) -> None:
+        self.compresslevel = compresslevel
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ResultWriter"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: dict[Path, Future] = {}
+        self._failed: dict[Path, BaseException] = {}
+
+    def _write(
+        self,
+        result_json: str,
+        result_fn: Path,
+        on_written: Optional[Callable[[Path], None]],
+    ):
+        try:
+            write_gzip_json(result_json, result_fn, self.compresslevel)
+            if on_written is not None:
+                on_written(result_fn)
+        except Exception as e:
+            self.logger.error(f"failed to write {result_fn}")
+            self.logger.exception(e)
+            raise
+        finally:
+            self._slots.release()
+
+    def submit(
+        self,
+        result_json: str,
+        result_fn: Path,
+        on_written: Optional[Callable[[Path], None]] = None,
+    ) -> Future:
+        """Queue `result_json` to be written to `result_fn`.
+
+        Args:
+            result_json (str): ocr output
+            result_fn (Path): path of the gzipped ocr output
+            on_written (Callable, optional): called with `result_fn` on the
+                writer thread once it is written.
+        """
+        self._slots.acquire()
+        future = self._executor.submit(self._write, result_json, result_fn, on_written)
+        with self._lock:
+            self._pending[result_fn] = future
+        future.add_done_callback(lambda _: self._forget(result_fn, future))
+        return future
+
+    def _forget(self, result_fn: Path, future: Future):
+        with self._lock:
+            if self._pending.get(result_fn) is future:
+                del self._pending[result_fn]
+            error = future.exception()
+            if error is not None:
+                self._failed[result_fn] = error
+
+    def wait(self, result_fn: Path):
+        """Wait until `result_fn` is written, if it is pending.
+
+        Raises:
+            Exception: the error raised while writing `result_fn`
+        """
+        with self._lock:
+            future = self._pending.get(result_fn)
+            error = self._failed.get(result_fn)
+        if future is not None:
+            future.result()
+        elif error is not None:
+            raise error
+
+    def join(self):
+        """Wait until all the pending ocr outputs are written.
+
+        Raises:
+            Exception: the first error raised while writing an ocr output
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures)
+        with self._lock:
+            errors = list(self._failed.values())
+            self._failed.clear()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Wait until the pending ocr outputs are written and stop the writer
+        thread, the errors are logged by `_write`.
+        """
+        self._executor.shutdown(wait=True)
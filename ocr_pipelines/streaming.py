@@ -0,0 +1,201 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from ocr_pipelines.config import OCR_OUTPUT_FORMAT_ZIP, ImportConfig
+from ocr_pipelines.engines.engine import OcrEngine
+from ocr_pipelines.exceptions import PipelineError
+from ocr_pipelines.executor import OCRExecutor
+from ocr_pipelines.image_downloader import BDRCImageDownloader
+from ocr_pipelines.upload import BdrcS3Uploader
+from ocr_pipelines.utils import PageSlots
+
+_DONE = object()
+
+
+def get_unsupported_options(config: ImportConfig) -> list[str]:
+    """Returns the options of `config` which only the non-streaming import
+    supports.
+    """
+    unsupported_options = {
+        "ocr_batch_size": config.ocr_batch_size > 1,
+        "ocr_async": config.ocr_async,
+        "ocr_tiles_per_request": config.ocr_tiles_per_request > 1,
+        "job_ledger_path": config.job_ledger_path is not None,
+        "skip_blank_pages": config.skip_blank_pages,
+        "skip_duplicate_pages": config.skip_duplicate_pages,
+    }
+    return [option for option, is_set in unsupported_options.items() if is_set]
+
+
+class StreamingImportRunner:
+    """Run the download, ocr and upload stages of an import concurrently.
+
+    Each stage runs in its own thread and pages are passed to the next stage
+    through queues as soon as they are ready: a page is ocred as soon as its
+    image is saved and uploaded as soon as its ocr output is written. The ocr
+    stage runs up to `config.ocr_workers` requests concurrently. At most
+    `max_pages_in_flight` pages are between the start of their download and
+    their upload at any time.
+
+    With an in-memory downloader the image bits are passed from stage to stage,
+    an image is only written to disk to be uploaded, if it can't be copied from
+    its source on BDRC S3.
+
+    Args:
+        downloader (BDRCImageDownloader): downloader of the scan images
+        ocr_executor (OCRExecutor): executor running the ocr on the images
+        uploader (BdrcS3Uploader): uploader of the images and ocr outputs
+        max_pages_in_flight (int): maximum number of downloaded pages which are
+            not uploaded yet.
+
+    Raises:
+        ValueError: if the config sets options of the non-streaming import, the
+            pages are ocred one at a time.
+    """
+
+    def __init__(
+        self,
+        downloader: BDRCImageDownloader,
+        ocr_executor: OCRExecutor,
+        uploader: BdrcS3Uploader,
+        max_pages_in_flight: int = 32,
+    ) -> None:
+        unsupported_options = get_unsupported_options(ocr_executor.config)
+        if unsupported_options:
+            raise ValueError(
+                "the streaming import doesn't support "
+                f"{', '.join(unsupported_options)}, unset them or disable streaming"
+            )
+        self.downloader = downloader
+        self.ocr_executor = ocr_executor
+        self.uploader = uploader
+        self.max_pages_in_flight = max_pages_in_flight
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.pack_ocr_outputs = (
+            ocr_executor.config.ocr_output_format == OCR_OUTPUT_FORMAT_ZIP
+        )
+
+        self._ocr_queue: queue.Queue = queue.Queue()
+        self._upload_queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._page_slots = PageSlots(max_pages_in_flight, self._stop)
+        self._errors: list[BaseException] = []
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _download_stage(self):
+        # the slot of a page is taken before its download
+        for _, img_path in self.downloader.iter_download(self._page_slots):
+            img_bytes = self.downloader.pop_img_bytes(img_path)
+            self._ocr_queue.put((img_path, img_bytes))
+
+    def _ocr_page(
+        self, ocr_engine: OcrEngine, img_path: Path, img_bytes: Optional[bytes]
+    ):
+        if self._stop.is_set():
+            return
+        try:
+            result_fn = self.ocr_executor.get_result_fn(img_path)
+            if not self.ocr_executor.is_ocred(result_fn):
+                result_fn.parent.mkdir(exist_ok=True, parents=True)
+                if not self.ocr_executor.ocr_img(
+                    ocr_engine, img_path, result_fn, img_bytes
+                ):
+                    self._upload_queue.put((img_path, img_bytes, None))
+                    return
+            self._upload_queue.put((img_path, img_bytes, result_fn))
+        except BaseException as e:
+            self._fail(e)
+
+    def _ocr_stage(self):
+        ocr_engine = self.ocr_executor.get_ocr_engine()
+        n_workers = self.ocr_executor.config.ocr_workers
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            while True:
+                item = self._get(self._ocr_queue)
+                if item is _DONE:
+                    return
+                executor.submit(self._ocr_page, ocr_engine, *item)
+
+    def _upload_stage(self):
+        while True:
+            item = self._get(self._upload_queue)
+            if item is _DONE:
+                return
+            img_path, img_bytes, result_fn = item
+            # packed ocr outputs are uploaded once all the pages are ocred
+            if result_fn is not None and not self.pack_ocr_outputs:
+                self.ocr_executor.result_writer.wait(result_fn)
+                self.uploader.upload_ocr_output(result_fn)
+            if img_bytes is None:
+                self.uploader.upload_ocr_image(img_path)
+            else:
+                self.uploader.upload_ocr_image_bytes(img_path, img_bytes)
+            self._page_slots.release()
+
+    def _fail(self, error: BaseException):
+        self.logger.exception(error)
+        self._errors.append(error)
+        self._stop.set()
+
+    def _run_stage(self, stage: Callable, next_queue: Optional[queue.Queue]):
+        try:
+            stage()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if next_queue is not None:
+                next_queue.put(_DONE)
+
+    def run(self, metadata: dict) -> Path:
+        """Download, ocr and upload all the pages of the scan.
+
+        Args:
+            metadata (dict): metadata uploaded along the ocr outputs
+
+        Returns:
+            Path: path to the ocr outputs of the scan
+
+        Raises:
+            PipelineError: if any of the stages failed
+        """
+        self.uploader.upload_metadata(metadata)
+
+        stages = [
+            (self._download_stage, self._ocr_queue),
+            (self._ocr_stage, self._upload_queue),
+            (self._upload_stage, None),
+        ]
+        threads = [
+            threading.Thread(target=self._run_stage, args=stage, daemon=True)
+            for stage in stages
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            if self._errors:
+                raise PipelineError("Streaming import failed") from self._errors[0]
+
+            bdrc_scan_id = self.downloader.bdrc_scan_id
+            ocr_output_path = self.ocr_executor.config.ocr_outputs_path / bdrc_scan_id
+            if self.pack_ocr_outputs:
+                self.ocr_executor.result_writer.join()
+                self.ocr_executor.pack_ocr_outputs()
+                self.uploader.upload_ocr_outputs(ocr_output_path)
+        finally:
+            # the ocr outputs already received are written even if a stage failed
+            self.ocr_executor.result_writer.close()
+        return ocr_output_path
@@ -1,12 +1,81 @@
 import hashlib
 import json
+import logging
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 
-from ocr_pipelines.exceptions import FailedToAssignBatchError
+from ocr_pipelines.archive import is_archive_fn
+from ocr_pipelines.config import BATCH_PREFIX
+from ocr_pipelines.exceptions import FailedToAssignBatchError, UploadFailedError
+from ocr_pipelines.image_downloader import BDRC_ARCHIVE_BUCKET, SourceImage
+from ocr_pipelines.result_writer import is_tmp_fn, write_atomic
+
+# marker object reserving a batch
+BATCH_MARKER_FN = ".reserved"
+
+
+class UploadReport:
+    """Aggregated progress and failures of the uploads of a list of files.
+
+    Args:
+        files (list): `(local_file, key)` of the files to upload
+        log_every (int): number of uploaded files between two progress logs
+    """
+
+    def __init__(self, files: list[tuple[Path, str]], log_every: int = 100) -> None:
+        self.n_files = len(files)
+        self.n_bytes = sum(local_file.stat().st_size for local_file, _ in files)
+        self.log_every = log_every
+        self.uploaded_files = 0
+        self.uploaded_bytes = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.failed: dict[Path, Exception] = {}
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._lock = threading.Lock()
+
+    def add_bytes(self, n_bytes: int):
+        with self._lock:
+            self.uploaded_bytes += n_bytes
+
+    def add_uploaded(self, local_file: Path):
+        with self._lock:
+            self.uploaded_files += 1
+            if self.uploaded_files % self.log_every == 0:
+                self.logger.info(self.summary())
+
+    def add_skipped(self, local_file: Path):
+        with self._lock:
+            self.skipped_files += 1
+            self.skipped_bytes += local_file.stat().st_size
+
+    def add_copied(self, local_file: Path):
+        with self._lock:
+            self.copied_files += 1
+            self.copied_bytes += local_file.stat().st_size
+
+    def add_failure(self, local_file: Path, error: Exception):
+        self.logger.error(f"failed to upload {local_file}: {error}")
+        with self._lock:
+            self.failed[local_file] = error
+
+    def summary(self) -> str:
+        return (
+            f"uploaded {self.uploaded_files}/{self.n_files} files "
+            f"({self.uploaded_bytes}/{self.n_bytes} bytes), "
+            f"skipped {self.skipped_files} files ({self.skipped_bytes} bytes), "
+            f"copied {self.copied_files} files ({self.copied_bytes} bytes), "
+            f"{len(self.failed)} failed"
+        )
 
 
 class BdrcS3Uploader:
@@ -17,45 +86,98 @@ class BdrcS3Uploader:
     Args:
         bdrc_scan_id (str): bdrc scan id
         service (str): service name (e.g. google-vision, namsel-ocr)
-        batch (str): batch name
+        batch (str, optional): batch name, a new batch is assigned if None
+        max_workers (int): maximum number of concurrent uploads
+        transfer_config (TransferConfig, optional): config of the managed
+            transfers, files are sent with `put_object` if None. Defaults to
+            boto3 defaults when `max_workers` > 1.
+        sync (bool): skip the files which are already uploaded to the batch with
+            the same size and ETag.
+        reserve_batch (bool): reserve the assigned batch with a marker object so
+            concurrent uploaders of the scan can't get the same batch.
+        batch_id_cache (dict, optional): batch assigned to each scan and service,
+            shared by the uploaders of a multi-scan run.
+        source_images (dict, optional): source on BDRC S3 of the downloaded
+            images, the images identical to their source are copied server-side
+            instead of uploaded.
+        client (optional): s3 client, shared by the uploaders of a multi-scan
+            run. A new client is created if None.
     """
 
-    def __init__(self, bdrc_scan_id: str, service: str):
+    def __init__(
+        self,
+        bdrc_scan_id: str,
+        service: str,
+        batch: Optional[str] = None,
+        max_workers: int = 1,
+        transfer_config: Optional[TransferConfig] = None,
+        sync: bool = False,
+        reserve_batch: bool = False,
+        batch_id_cache: Optional[dict[str, str]] = None,
+        source_images: Optional[dict[Path, SourceImage]] = None,
+        client: Optional[Any] = None,
+    ):
         self.bdrc_scan_id = bdrc_scan_id
         self.service = service
         self.bucket_name = "ocr.bdrc.io"
-        self.client = boto3.client("s3")
-        self.bucket = boto3.resource("s3").Bucket(self.bucket_name)
-        self._batch: Optional[str] = None
+        # clients are thread-safe, unlike resources, they are shared by the
+        # concurrent uploads. The uploader may be created on an import thread,
+        # the default session isn't thread-safe
+        self.client = (
+            client if client is not None else boto3.session.Session().client("s3")
+        )
+        self._batch: Optional[str] = batch
+        self.max_workers = max_workers
+        self.sync = sync
+        self.reserve_batch = reserve_batch
+        self.batch_id_cache = batch_id_cache
+        self.source_images = source_images if source_images is not None else {}
+        self._remote_objects: Optional[dict[str, tuple[int, str]]] = None
+        if transfer_config is None and max_workers > 1:
+            transfer_config = TransferConfig()
+        self.transfer_config = transfer_config
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
     @property
     def batch(self) -> str:
         if not self._batch:
-            self._batch = self.__get_available_batch_id()
+            cache_key = f"{self.bdrc_scan_id}/{self.service}"
+            if self.batch_id_cache is not None and cache_key in self.batch_id_cache:
+                self._batch = self.batch_id_cache[cache_key]
+            else:
+                self._batch = self.__get_available_batch_id()
+                if self.reserve_batch:
+                    self.__reserve_batch(self._batch)
+                if self.batch_id_cache is not None:
+                    self.batch_id_cache[cache_key] = self._batch
         return self._batch
 
-    def __s3_dir_exists(self, path: Path) -> bool:
-        """Check if a key exists in s3
-
-        Args:
-            key (str): key to check
-
-        Returns:
-            bool: True if the key exists, False otherwise
+    def __list_batch_ids(self) -> set[str]:
+        """Returns the batches of the scan and service with a delimiter listing of
+        `service_dir`, a single request unless there are more than 1000 batches.
         """
-        response = self.client.list_objects_v2(
-            Bucket=self.bucket_name, Prefix=str(path), MaxKeys=1
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=f"{self.service_dir}/{BATCH_PREFIX}-",
+            Delimiter="/",
         )
-        if response["KeyCount"] == 0:
-            return False
-        return True
+        batch_ids = set()
+        for page in pages:
+            for common_prefix in page.get("CommonPrefixes", []):
+                batch_ids.add(Path(common_prefix["Prefix"]).name)
+        return batch_ids
+
+    def __reserve_batch(self, batch_id: str):
+        marker_key = self.service_dir / batch_id / BATCH_MARKER_FN
+        self.client.put_object(Bucket=self.bucket_name, Key=str(marker_key), Body=b"")
 
     def __get_available_batch_id(self, n_iter: int = 30) -> str:
+        existing_batch_ids = self.__list_batch_ids()
         n = 0
         while n < n_iter:
-            candidate = f"batch-{uuid.uuid4().hex[:4]}"
-            s3_batch_dir = self.service_dir / candidate
-            if not self.__s3_dir_exists(s3_batch_dir):
+            candidate = f"{BATCH_PREFIX}-{uuid.uuid4().hex[:4]}"
+            if candidate not in existing_batch_ids:
                 return candidate
             n += 1
         raise FailedToAssignBatchError(
@@ -111,20 +233,252 @@ class BdrcS3Uploader:
 
         metadata_path = self.batch_dir / "info.json"
         metadata_bytes = bytes(json.dumps(metadata), "utf-8")
-        self.bucket.put_object(Key=str(metadata_path), Body=metadata_bytes)
+        self.client.put_object(
+            Bucket=self.bucket_name, Key=str(metadata_path), Body=metadata_bytes
+        )
+
+    def get_ocr_image_key(self, image_file: Path) -> str:
+        s3_imagegroup_dir = self.get_imagegroup_dir(
+            self.s3_ocr_images_dir, image_file.parent.name
+        )
+        return str(s3_imagegroup_dir / image_file.name)
+
+    def get_ocr_output_key(self, ocr_output_file: Path) -> str:
+        s3_imagegroup_dir = self.get_imagegroup_dir(
+            self.s3_ocr_outputs_dir, ocr_output_file.parent.name
+        )
+        return str(s3_imagegroup_dir / ocr_output_file.name)
+
+    def get_ocr_output_archive_key(self, archive_file: Path) -> str:
+        s3_imagegroup_dir = self.get_imagegroup_dir(
+            self.s3_ocr_outputs_dir, archive_file.stem
+        )
+        return f"{s3_imagegroup_dir}{archive_file.suffix}"
+
+    def upload_file(
+        self,
+        local_file: Path,
+        key: str,
+        callback: Optional[Callable[[int], None]] = None,
+    ):
+        """Save a single file to s3 at `key`
+
+        Without `transfer_config` the file is sent with a single `put_object`,
+        otherwise it is streamed from disk with a managed transfer, in parts if it
+        is larger than the multipart threshold.
+
+        Args:
+            local_file (Path): path to the file
+            key (str): s3 key of the file
+            callback (Callable, optional): called with the number of bytes sent
+        """
+        if self.transfer_config is None:
+            self.client.put_object(
+                Bucket=self.bucket_name, Key=key, Body=local_file.read_bytes()
+            )
+            if callback is not None:
+                callback(local_file.stat().st_size)
+        else:
+            self.client.upload_file(
+                str(local_file),
+                self.bucket_name,
+                key,
+                Config=self.transfer_config,
+                Callback=callback,
+            )
+
+    @property
+    def remote_objects(self) -> dict[str, tuple[int, str]]:
+        """`(size, etag)` of the objects already uploaded to the batch, by key.
+
+        The batch is listed once, on first access.
+        """
+        if self._remote_objects is None:
+            self._remote_objects = {}
+            paginator = self.client.get_paginator("list_objects_v2")
+            pages = paginator.paginate(
+                Bucket=self.bucket_name, Prefix=f"{self.batch_dir}/"
+            )
+            for page in pages:
+                for obj in page.get("Contents", []):
+                    etag = obj["ETag"].strip('"')
+                    self._remote_objects[obj["Key"]] = (obj["Size"], etag)
+        return self._remote_objects
+
+    def get_local_etag(self, local_file: Path, n_parts: int) -> str:
+        """Returns the ETag s3 computes for `local_file` uploaded in `n_parts` parts.
+
+        The ETag of a single part upload is the MD5 of the file, the ETag of a
+        multipart upload is the MD5 of the MD5s of the parts followed by the
+        number of parts.
+        """
+        if n_parts <= 1:
+            return hashlib.md5(local_file.read_bytes()).hexdigest()
+        chunksize = (
+            self.transfer_config.multipart_chunksize
+            if self.transfer_config is not None
+            else TransferConfig().multipart_chunksize
+        )
+        part_md5s = []
+        with local_file.open("rb") as f:
+            for part in iter(lambda: f.read(chunksize), b""):
+                part_md5s.append(hashlib.md5(part).digest())
+        return f"{hashlib.md5(b''.join(part_md5s)).hexdigest()}-{len(part_md5s)}"
+
+    def is_uploaded(self, local_file: Path, key: str) -> bool:
+        """Returns True if `local_file` is already uploaded at `key` with the same
+        size and ETag.
+        """
+        remote_object = self.remote_objects.get(key)
+        if remote_object is None:
+            return False
+        size, etag = remote_object
+        if size != local_file.stat().st_size:
+            return False
+        n_parts = int(etag.split("-")[1]) if "-" in etag else 1
+        return self.get_local_etag(local_file, n_parts) == etag
+
+    def copy_source_image(
+        self, image_file: Path, key: str, image_bytes: Optional[bytes] = None
+    ) -> bool:
+        """Copy the source of `image_file` from BDRC S3 to `key` server-side if
+        `image_file`, or its in-memory bits `image_bytes`, is identical to its
+        source, ie. it wasn't converted.
+
+        Returns:
+            bool: True if the image is copied, False if it must be uploaded
+        """
+        source_image = self.source_images.get(image_file)
+        if source_image is None:
+            return False
+        if image_bytes is None:
+            image_bytes = image_file.read_bytes()
+        if hashlib.md5(image_bytes).hexdigest() != source_image.md5:
+            return False
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                CopySource={"Bucket": BDRC_ARCHIVE_BUCKET, "Key": source_image.key},
+            )
+        except ClientError as e:
+            self.logger.warning(
+                f"failed to copy {source_image.key} to {key}, uploading it: {e}"
+            )
+            return False
+        return True
+
+    def upload_files(self, files: list[tuple[Path, str]]) -> UploadReport:
+        """Save `files`, a list of `(local_file, key)`, to s3 with up to
+        `max_workers` concurrent uploads.
+
+        A failed upload doesn't stop the others, the failures are aggregated in
+        the report. In sync mode the files already uploaded are skipped. The
+        images identical to their source on BDRC S3 are copied server-side.
+
+        Returns:
+            UploadReport: progress and failures of the uploads
+
+        Raises:
+            UploadFailedError: if any of the files failed to upload
+        """
+        report = UploadReport(files)
+
+        def upload(file: tuple[Path, str]):
+            local_file, key = file
+            try:
+                if self.sync and self.is_uploaded(local_file, key):
+                    report.add_skipped(local_file)
+                    return
+                if self.copy_source_image(local_file, key):
+                    report.add_copied(local_file)
+                    return
+                self.upload_file(local_file, key, callback=report.add_bytes)
+            except Exception as e:
+                report.add_failure(local_file, e)
+                return
+            report.add_uploaded(local_file)
+
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for _ in executor.map(upload, files):
+                    pass
+        else:
+            for file in files:
+                upload(file)
+
+        self.logger.info(report.summary())
+        if report.failed:
+            raise UploadFailedError(
+                f"{len(report.failed)} of {report.n_files} files failed to upload"
+            )
+        return report
+
+    def sync_file(self, local_file: Path, key: str):
+        """Save a single file to s3 at `key`, unless it is already uploaded in
+        sync mode.
+        """
+        if self.sync and self.is_uploaded(local_file, key):
+            return
+        if self.copy_source_image(local_file, key):
+            return
+        self.upload_file(local_file, key)
+
+    def upload_ocr_image(self, image_file: Path):
+        """Save a single ocr image to s3
+
+        Args:
+            image_file (Path): path to the image, its parent dir is the imagegroup
+        """
+        self.sync_file(image_file, self.get_ocr_image_key(image_file))
+
+    def upload_ocr_image_bytes(self, image_file: Path, image_bytes: bytes):
+        """Save a single in-memory ocr image to s3
+
+        The image is copied server-side from its source if it is unchanged,
+        otherwise it is written to `image_file` and uploaded from there.
+
+        Args:
+            image_file (Path): path the image is written to, its parent dir is
+                the imagegroup
+            image_bytes (bytes): image bits
+        """
+        key = self.get_ocr_image_key(image_file)
+        if self.sync and self.remote_objects.get(key) == (
+            len(image_bytes),
+            hashlib.md5(image_bytes).hexdigest(),
+        ):
+            return
+        if self.copy_source_image(image_file, key, image_bytes):
+            return
+        write_atomic(image_bytes, image_file)
+        if self.sync and self.is_uploaded(image_file, key):
+            return
+        self.upload_file(image_file, key)
+
+    def upload_ocr_output(self, ocr_output_file: Path):
+        """Save a single ocr output to s3
+
+        Args:
+            ocr_output_file (Path): path to the ocr output, its parent dir is the imagegroup
+        """
+        self.sync_file(ocr_output_file, self.get_ocr_output_key(ocr_output_file))
+
+    def upload_ocr_output_archive(self, archive_file: Path):
+        """Save the archive of the ocr outputs of an image group to s3
+
+        Args:
+            archive_file (Path): path to the archive, its stem is the imagegroup
+        """
+        self.sync_file(archive_file, self.get_ocr_output_archive_key(archive_file))
 
     def upload_ocr_images(self, images_path: Path):
         """Save the ocr images to s3"""
+        files = []
         for local_imagegroup_dir in images_path.iterdir():
             for image_file in local_imagegroup_dir.iterdir():
-                imagegroup = local_imagegroup_dir.name
-                s3_imagegroup_dir = self.get_imagegroup_dir(
-                    self.s3_ocr_images_dir, imagegroup
-                )
-                s3_image_path = s3_imagegroup_dir / image_file.name
-                self.bucket.put_object(
-                    Key=str(s3_image_path), Body=image_file.read_bytes()
-                )
+                files.append((image_file, self.get_ocr_image_key(image_file)))
+        self.upload_files(files)
 
     def upload_ocr_outputs(self, ocr_output_path: Path):
         """Save the ocr output to s3
@@ -132,16 +486,22 @@ class BdrcS3Uploader:
         Args:
             ocr_output_paths (Path): path to the ocr output
         """
+        files = []
         for local_imagegroup_dir in ocr_output_path.iterdir():
+            if is_archive_fn(local_imagegroup_dir):
+                archive_key = self.get_ocr_output_archive_key(local_imagegroup_dir)
+                files.append((local_imagegroup_dir, archive_key))
+                continue
+            if not local_imagegroup_dir.is_dir():
+                continue
             for ocr_output_file in local_imagegroup_dir.iterdir():
-                imagegroup = local_imagegroup_dir.name
-                s3_imagegroup_dir = self.get_imagegroup_dir(
-                    self.s3_ocr_outputs_dir, imagegroup
-                )
-                s3_ocr_output_path = s3_imagegroup_dir / ocr_output_file.name
-                self.bucket.put_object(
-                    Key=str(s3_ocr_output_path), Body=ocr_output_file.read_bytes()
+                # left over by an interrupted write
+                if is_tmp_fn(ocr_output_file):
+                    continue
+                files.append(
+                    (ocr_output_file, self.get_ocr_output_key(ocr_output_file))
                 )
+        self.upload_files(files)
 
     def upload(self, ocr_images_path: Path, ocr_outputs_path: Path, metadata: dict):
         """Upload the ocr images, output and metadata to s3
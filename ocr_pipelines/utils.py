@@ -1,8 +1,16 @@
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
 import requests
 from google.oauth2.service_account import Credentials
 
 from ocr_pipelines.exceptions import RequestFailedError
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 def requests_get_json(url):
     r = requests.get(url)
@@ -17,3 +25,57 @@ def check_google_server_account_key_format(credentials_dict: dict) -> bool:
     except ValueError:
         return False
     return True
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable[[T], R],
+    iterable: Iterable[T],
+    max_pending: int,
+) -> Iterator[R]:
+    """Like `executor.map` but never submits more than `max_pending` tasks ahead
+    of the consumer. Results are yielded in the order of `iterable`.
+    """
+    pending: deque[Future] = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class PageSlots:
+    """Bounded number of pages in flight, waiting for a slot gives up once `stop`
+    is set.
+
+    Args:
+        n_slots (int): maximum number of pages in flight
+        stop (threading.Event, optional): event set to stop waiting for a slot
+    """
+
+    def __init__(self, n_slots: int, stop: Optional[threading.Event] = None) -> None:
+        self.n_slots = n_slots
+        self.stop = stop if stop is not None else threading.Event()
+        self._semaphore = threading.BoundedSemaphore(n_slots)
+
+    def acquire(self) -> bool:
+        """Wait for a free slot, returns False if `stop` was set first."""
+        while not self.stop.is_set():
+            if self._semaphore.acquire(timeout=0.1):
+                return True
+        return False
+
+    def release(self):
+        self._semaphore.release()
+
+    def iter_with_slots(self, iterable: Iterable[T]) -> Iterator[T]:
+        """Yields the items of `iterable`, each once a slot is taken for it."""
+        for item in iterable:
+            if not self.acquire():
+                return
+            yield item
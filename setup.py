@@ -36,5 +36,9 @@ setup(
         "Wand>=0.6.0, <=1.0.0",
         "google-cloud-vision>=3.1.4, <4.0.0",
     ],
+    extras_require={
+        # blank and duplicate pages detection
+        "page-filter": ["numpy>=1.21"],
+    },
     python_requires=">=3.8",
 )
@@ -0,0 +1,97 @@
+import gzip
+import json
+import zipfile
+
+from ocr_pipelines.archive import (
+    OcrOutputArchiveReader,
+    get_archive_fn,
+    pack_ocr_output_dir,
+)
+from ocr_pipelines.parser import GoogleVisionBDRCArchiveProvider
+
+
+def write_ocr_outputs(ocr_output_dir, pages):
+    ocr_output_dir.mkdir(parents=True, exist_ok=True)
+    for page in pages:
+        ocr_output_fn = ocr_output_dir / f"I1234{page:04}.json.gz"
+        ocr_output_fn.write_bytes(gzip.compress(json.dumps({"page": page}).encode()))
+
+
+def test_pack_ocr_output_dir(tmp_path):
+    # arrange
+    ocr_output_dir = tmp_path / "W1KG12345" / "W1KG12345-1234"
+    write_ocr_outputs(ocr_output_dir, range(1, 4))
+
+    # act
+    archive_fn = pack_ocr_output_dir(ocr_output_dir)
+
+    # assert
+    assert archive_fn == tmp_path / "W1KG12345" / "W1KG12345-1234.zip"
+    assert not ocr_output_dir.exists()
+    with zipfile.ZipFile(archive_fn) as archive:
+        assert archive.namelist() == [
+            "I12340001.json.gz",
+            "I12340002.json.gz",
+            "I12340003.json.gz",
+        ]
+        assert all(
+            info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()
+        )
+
+
+def test_pack_ocr_output_dir_adds_resumed_pages(tmp_path):
+    # arrange
+    ocr_output_dir = tmp_path / "W1KG12345" / "W1KG12345-1234"
+    write_ocr_outputs(ocr_output_dir, [1, 2])
+    pack_ocr_output_dir(ocr_output_dir)
+    write_ocr_outputs(ocr_output_dir, [3])
+
+    # act
+    archive_fn = pack_ocr_output_dir(ocr_output_dir)
+
+    # assert
+    with zipfile.ZipFile(archive_fn) as archive:
+        assert len(archive.namelist()) == 3
+    assert archive_fn == get_archive_fn(ocr_output_dir)
+
+
+def test_ocr_output_archive_reader(tmp_path):
+    # arrange
+    ocr_output_dir = tmp_path / "W1KG12345" / "W1KG12345-1234"
+    write_ocr_outputs(ocr_output_dir, [1, 2])
+    pack_ocr_output_dir(ocr_output_dir)
+    reader = OcrOutputArchiveReader(tmp_path / "W1KG12345")
+
+    # act
+    ocr_output = reader.read("W1KG12345-1234", "I12340002.json.gz")
+    missing_page = reader.read("W1KG12345-1234", "I12340003.json.gz")
+    missing_img_group = reader.read("W1KG12345-1235", "I12350001.json.gz")
+    reader.close()
+
+    # assert
+    assert json.loads(gzip.decompress(ocr_output)) == {"page": 2}  # type: ignore
+    assert missing_page is None
+    assert missing_img_group is None
+
+
+def test_archive_data_provider(tmp_path):
+    # arrange
+    ocr_output_path = tmp_path / "W1KG12345"
+    write_ocr_outputs(ocr_output_path / "W1KG12345-1234", [1])
+    pack_ocr_output_dir(ocr_output_path / "W1KG12345-1234")
+    unpacked_ocr_output_dir = ocr_output_path / "W1KG12345-1235"
+    unpacked_ocr_output_dir.mkdir()
+    (unpacked_ocr_output_dir / "I12350001.json.gz").write_bytes(
+        gzip.compress(b'{"page": "unpacked"}')
+    )
+    data_provider = GoogleVisionBDRCArchiveProvider(
+        bdrc_scan_id="W1KG12345", ocr_import_info={}, ocr_disk_path=ocr_output_path
+    )
+
+    # act
+    packed_ocr_output = data_provider.get_image_data("I1234", "I12340001.tif")
+    unpacked_ocr_output = data_provider.get_image_data("I1235", "I12350001.jpg")
+
+    # assert
+    assert packed_ocr_output == {"page": 1}
+    assert unpacked_ocr_output == {"page": "unpacked"}
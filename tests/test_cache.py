@@ -0,0 +1,81 @@
+import os
+
+from ocr_pipelines.cache import OcrResultCache
+
+
+def test_ocr_cache_key_depends_on_image_and_settings():
+    # arrange
+    key = OcrResultCache.get_key(b"image", "GoogleVisionEngine", "builtin/weekly", "bo")
+
+    # act and assert
+    assert key == OcrResultCache.get_key(
+        b"image", "GoogleVisionEngine", "builtin/weekly", "bo"
+    )
+    assert key != OcrResultCache.get_key(
+        b"other-image", "GoogleVisionEngine", "builtin/weekly", "bo"
+    )
+    assert key != OcrResultCache.get_key(
+        b"image", "GoogleVisionEngine", "builtin/stable", "bo"
+    )
+    assert key != OcrResultCache.get_key(
+        b"image", "GoogleVisionEngine", "builtin/weekly", ""
+    )
+    assert key != OcrResultCache.get_key(
+        b"image", "GoogleVisionEngine", "builtin/weekly", "bo", "response_profile=text"
+    )
+
+
+def test_ocr_cache_get_and_put(tmp_path):
+    # arrange
+    ocr_cache = OcrResultCache(tmp_path / "ocr_cache", max_bytes=1000)
+    key = OcrResultCache.get_key(b"image", "GoogleVisionEngine", "", "")
+
+    # act
+    missed = ocr_cache.get(key)
+    ocr_cache.put(key, b"gzipped-result")
+    cached = ocr_cache.get(key)
+
+    # assert
+    assert missed is None
+    assert cached == b"gzipped-result"
+    assert ocr_cache.hits == 1
+    assert ocr_cache.misses == 1
+    assert ocr_cache.total_bytes == len(b"gzipped-result")
+
+
+def test_ocr_cache_evicts_least_recently_used(tmp_path):
+    # arrange
+    ocr_cache = OcrResultCache(tmp_path / "ocr_cache", max_bytes=30)
+    keys = [OcrResultCache.get_key(f"image-{i}".encode(), "", "", "") for i in range(3)]
+    ocr_cache.put(keys[0], b"0" * 10)
+    ocr_cache.put(keys[1], b"1" * 10)
+    ocr_cache.put(keys[2], b"2" * 10)
+
+    # act
+    ocr_cache.get(keys[0])
+    ocr_cache.put(keys[1], b"1" * 20)
+
+    # assert
+    assert ocr_cache.get(keys[2]) is None
+    assert not ocr_cache.get_entry_fn(keys[2]).exists()
+    assert ocr_cache.get(keys[0]) == b"0" * 10
+    assert ocr_cache.get(keys[1]) == b"1" * 20
+    assert ocr_cache.total_bytes == 30
+
+
+def test_ocr_cache_is_reloaded_from_disk(tmp_path):
+    # arrange
+    ocr_cache = OcrResultCache(tmp_path / "ocr_cache", max_bytes=20)
+    old_key = OcrResultCache.get_key(b"old-image", "", "", "")
+    new_key = OcrResultCache.get_key(b"new-image", "", "", "")
+    ocr_cache.put(new_key, b"n" * 10)
+    ocr_cache.put(old_key, b"o" * 10)
+    os.utime(ocr_cache.get_entry_fn(old_key), (0, 0))
+
+    # act
+    reloaded_ocr_cache = OcrResultCache(tmp_path / "ocr_cache", max_bytes=20)
+    reloaded_ocr_cache.put(OcrResultCache.get_key(b"image", "", "", ""), b"i" * 10)
+
+    # assert
+    assert reloaded_ocr_cache.get(old_key) is None
+    assert reloaded_ocr_cache.get(new_key) == b"n" * 10
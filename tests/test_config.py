@@ -63,6 +63,38 @@ def test_import_config_serialized():
         "credentials": credentials,
         "images_path": str(images_path),
         "ocr_outputs_path": str(ocr_output_path),
+        "download_workers": 1,
+        "conversion_processes": 0,
+        "streaming": False,
+        "in_memory_images": False,
+        "max_pages_in_flight": 32,
+        "ocr_workers": 1,
+        "ocr_batch_size": 1,
+        "ocr_batch_max_bytes": 10000000,
+        "ocr_tiles_per_request": 1,
+        "ocr_async": False,
+        "requests_per_minute": None,
+        "ocr_max_retries": 5,
+        "ocr_credentials_cooldown": 60.0,
+        "ocr_request_timeout": None,
+        "ocr_hedge_percentile": None,
+        "ocr_hedge_max_ratio": 0.05,
+        "ocr_max_image_pixels": None,
+        "ocr_max_image_bytes": None,
+        "skip_blank_pages": False,
+        "skip_duplicate_pages": False,
+        "ocr_cache_path": None,
+        "ocr_cache_max_bytes": 10 * 1000 * 1000 * 1000,
+        "job_ledger_path": None,
+        "job_lease_seconds": 600.0,
+        "gzip_compresslevel": 9,
+        "ocr_output_format": "files",
+        "ocr_response_profile": "full",
+        "upload_workers": 1,
+        "upload_multipart_threshold": 8 * 1024 * 1024,
+        "upload_multipart_chunksize": 8 * 1024 * 1024,
+        "upload_sync": False,
+        "reserve_batch": False,
     }
     assert json.dumps(config_dict)
 
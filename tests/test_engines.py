@@ -1,11 +1,20 @@
+import asyncio
 import json
 import os
 from pathlib import Path
 from unittest import mock
 
 import pytest
+from google.api_core import exceptions as gcloud_exceptions
+from google.cloud import vision
 
-from ocr_pipelines.engines import GoogleVisionEngine
+from ocr_pipelines.engines import GoogleVisionEngine, OcrEngine, register
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+from ocr_pipelines.exceptions import (
+    GoogleVisionCredentialsError,
+    GoogleVisionEngineError,
+)
 
 
 def test_load_image_with_image_bytes(test_data_path):
@@ -75,6 +84,192 @@ def test_google_vision_engine(
     mock_response.to_json.assert_called_once_with("response")
 
 
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_ocr_batch(
+    mock_credentials, mock_client_class, test_data_path
+):
+    # arrange
+    test_image_path = test_data_path / "test_script_image.jpg"
+    images = [test_image_path, Path("fake-path"), test_image_path.read_bytes()]
+    mock_client = mock.MagicMock()
+    mock_client.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(
+        responses=[
+            {"full_text_annotation": {"text": "text"}},
+            {"error": {"code": 3, "message": "Bad image data."}},
+        ]
+    )
+    mock_client_class.return_value = mock_client
+
+    # action
+    google_vision = GoogleVisionEngine({"fake-key": "fake-value"})
+    results = google_vision.ocr_batch(images)
+
+    # assert
+    assert len(results) == 3
+    assert results[0]["fullTextAnnotation"]["text"] == "text"
+    assert isinstance(results[1], FileNotFoundError)
+    assert isinstance(results[2], GoogleVisionEngineError)
+    assert mock_client.batch_annotate_images.call_count == 1
+    requests = mock_client.batch_annotate_images.call_args.kwargs["requests"]
+    assert len(requests) == 2
+
+
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_ocr_batch_splits_large_batches(
+    mock_credentials, mock_client_class
+):
+    # arrange
+    images = [b"fake-image"] * (GoogleVisionEngine.MAX_BATCH_SIZE + 1)
+    mock_client = mock.MagicMock()
+    mock_client.batch_annotate_images.side_effect = (
+        lambda requests: vision.BatchAnnotateImagesResponse(
+            responses=[{} for _ in requests]
+        )
+    )
+    mock_client_class.return_value = mock_client
+
+    # action
+    google_vision = GoogleVisionEngine({"fake-key": "fake-value"})
+    results = google_vision.ocr_batch(images)
+
+    # assert
+    assert len(results) == len(images)
+    assert mock_client.batch_annotate_images.call_count == 2
+
+
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_ocr_batch_permission_denied(
+    mock_credentials, mock_client_class
+):
+    # arrange
+    mock_client = mock.MagicMock()
+    mock_client.batch_annotate_images.side_effect = gcloud_exceptions.PermissionDenied(
+        "denied"
+    )
+    mock_client_class.return_value = mock_client
+
+    # action and assert
+    google_vision = GoogleVisionEngine({"fake-key": "fake-value"})
+    with pytest.raises(GoogleVisionCredentialsError):
+        google_vision.ocr_batch([b"fake-image"])
+
+
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_retries_quota_errors(mock_credentials, mock_client_class):
+    # arrange
+    mock_client = mock.MagicMock()
+    mock_client.batch_annotate_images.side_effect = [
+        gcloud_exceptions.ResourceExhausted("quota exceeded"),
+        vision.BatchAnnotateImagesResponse(responses=[{}, {}]),
+    ]
+    mock_client_class.return_value = mock_client
+    rate_limiter = RateLimiter(
+        max_concurrency=2, backoff_base=0, retry_on=GoogleVisionEngine.QUOTA_ERRORS
+    )
+
+    # action
+    google_vision = GoogleVisionEngine(
+        {"fake-key": "fake-value"}, rate_limiter=rate_limiter
+    )
+    results = google_vision.ocr_batch([b"fake-image", b"fake-image"])
+
+    # assert
+    assert len(results) == 2
+    assert mock_client.batch_annotate_images.call_count == 2
+    assert rate_limiter.n_throttled == 1
+
+
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_request_timeout_and_hedging(
+    mock_credentials, mock_client_class
+):
+    # arrange
+    mock_client = mock.MagicMock()
+    mock_client.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(
+        responses=[{}]
+    )
+    mock_client_class.return_value = mock_client
+    hedging = HedgingPolicy(min_samples=1)
+
+    # action
+    google_vision = GoogleVisionEngine(
+        {"fake-key": "fake-value"}, request_timeout=30, hedging=hedging
+    )
+    google_vision.ocr_batch([b"fake-image"])
+
+    # assert
+    assert mock_client.batch_annotate_images.call_args.kwargs["timeout"] == 30
+    assert hedging.n_requests == 1
+    assert hedging.get_delay() is not None
+
+
+@mock.patch(
+    "google.cloud.vision.ImageAnnotatorAsyncClient", autospec=True, spec_set=True
+)
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_aocr(
+    mock_credentials, mock_client_class, mock_async_client_class, test_data_path
+):
+    # arrange
+    test_image_path = test_data_path / "test_script_image.jpg"
+    mock_credentials.from_service_account_info.return_value = "fake-credentials_obj"
+    mock_async_client = mock.MagicMock()
+    mock_async_client.batch_annotate_images = mock.AsyncMock(
+        return_value=vision.BatchAnnotateImagesResponse(
+            responses=[{"full_text_annotation": {"text": "text"}}]
+        )
+    )
+    mock_async_client_class.return_value = mock_async_client
+
+    async def aocr_twice(google_vision):
+        return [
+            await google_vision.aocr(test_image_path),
+            await google_vision.aocr(test_image_path),
+        ]
+
+    # action
+    google_vision = GoogleVisionEngine({"fake-key": "fake-value"})
+    responses = asyncio.run(aocr_twice(google_vision))
+
+    # assert
+    assert responses[0]["fullTextAnnotation"]["text"] == "text"
+    assert responses[0] == responses[1]
+    mock_async_client_class.assert_called_once_with(credentials="fake-credentials_obj")
+    assert mock_async_client.batch_annotate_images.await_count == 2
+
+
+def test_ocr_engine_default_aocr():
+    # arrange
+    class FakeOcrEngine(OcrEngine):
+        def ocr(self, image):
+            return {"image": image}
+
+    # action
+    response = asyncio.run(FakeOcrEngine().aocr("fake-image"))
+
+    # assert
+    assert response == {"image": "fake-image"}
+    del register["FakeOcrEngine"]
+
+
 @pytest.mark.engine
 @pytest.mark.skipif(
     bool(os.environ.get("OP_OCR_TEST_ENGINE")) is False,
@@ -90,3 +285,36 @@ def test_google_vision_engine_with_google_vision_service(test_data_path):
     print(response)
 
     assert isinstance(response, dict)
+
+
+@mock.patch("google.cloud.vision.ImageAnnotatorClient", autospec=True, spec_set=True)
+@mock.patch(
+    "ocr_pipelines.engines.google_vision.Credentials", autospec=True, spec_set=True
+)
+def test_google_vision_engine_ocr_json(mock_credentials, mock_client_class):
+    # arrange
+    response = vision.AnnotateImageResponse(
+        {
+            "text_annotations": [{"description": "བཀྲ་ཤིས།\n"}],
+            "full_text_annotation": {
+                "text": "བཀྲ་ཤིས།\n",
+                "pages": [{"width": 100, "height": 50, "confidence": 0.98}],
+            },
+        }
+    )
+    mock_client = mock.MagicMock()
+    mock_client.annotate_image.return_value = response
+    mock_client.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(
+        responses=[response]
+    )
+    mock_client_class.return_value = mock_client
+    google_vision = GoogleVisionEngine({"fake-key": "fake-value"})
+
+    # action
+    response_json = google_vision.ocr_json(b"fake-image")
+    batch_response_json = google_vision.ocr_batch_json([b"fake-image"])
+
+    # assert
+    expected_json = json.dumps(google_vision.ocr(b"fake-image"))
+    assert response_json == expected_json
+    assert batch_response_json == [expected_json]
@@ -1,8 +1,20 @@
+import asyncio
+import gzip
+import io
+import json
 import tempfile
+import time
+import zipfile
 from pathlib import Path
 from unittest import mock
 
+import pytest
+from PIL import Image as PillowImage
+from PIL import ImageDraw
+
 from ocr_pipelines.config import ImportConfig
+from ocr_pipelines.engines.pool import EnginePool
+from ocr_pipelines.exceptions import GoogleVisionCredentialsError, OcrExecutorError
 from ocr_pipelines.executor import OCRExecutor
 
 
@@ -14,7 +26,7 @@ def test_executor(
 
     # mock ocr_engine_class_register and GoogleVisionEngine
     mock_google_vision_engine_instance = mock_google_vision_engine.return_value
-    mock_google_vision_engine_instance.ocr.return_value = {}
+    mock_google_vision_engine_instance.ocr_json.return_value = "{}"
     mock_google_vision_engine.return_value = mock_google_vision_engine_instance
     mock_ocr_engine_class_register.get.return_value = mock_google_vision_engine
 
@@ -34,3 +46,664 @@ def test_executor(
         ocr_output_path = ocr_executor.run()
 
         assert isinstance(ocr_output_path, Path)
+
+
+@pytest.fixture
+def image_download_dir(tmp_path):
+    image_download_dir = tmp_path / "images" / "W1KG12345"
+    for img_group in ["I1234", "I1235"]:
+        img_group_dir = image_download_dir / img_group
+        img_group_dir.mkdir(parents=True)
+        for i in range(1, 11):
+            (img_group_dir / f"{img_group}{i:04}.jpg").write_bytes(b"fake-image")
+    return image_download_dir
+
+
+def test_executor_downscales_images(tmp_path):
+    # arrange
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    large_img_path = img_group_dir / "I12340001.png"
+    PillowImage.new("L", (400, 200)).save(large_img_path)
+    small_img_path = img_group_dir / "I12340002.png"
+    PillowImage.new("L", (100, 50)).save(small_img_path)
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_max_image_pixels=200 * 100,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=img_group_dir.parent
+    )
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.return_value = "{}"
+
+    # act
+    for img_path in [large_img_path, small_img_path]:
+        result_fn = ocr_executor.get_result_fn(img_path)
+        result_fn.parent.mkdir(parents=True, exist_ok=True)
+        ocr_executor.ocr_img(ocr_engine, img_path, result_fn)
+    ocr_executor.result_writer.join()
+
+    # assert
+    large_img, small_img = [call.args[0] for call in ocr_engine.ocr_json.call_args_list]
+    with PillowImage.open(io.BytesIO(large_img)) as img:
+        assert img.size == (200, 100)
+    assert small_img == small_img_path.read_bytes()
+    assert ocr_executor.image_scale_factors == {
+        "I1234": {"I12340001.png": pytest.approx(0.5)}
+    }
+
+
+@pytest.mark.parametrize(
+    "config_kwargs", [{}, {"ocr_batch_size": 2}, {"ocr_async": True}]
+)
+def test_executor_skips_undecodable_images_when_downscaling(tmp_path, config_kwargs):
+    # arrange
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    (img_group_dir / "I12340001.png").write_bytes(b"corrupt-image")
+    PillowImage.new("L", (100, 50)).save(img_group_dir / "I12340002.png")
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_max_image_pixels=200 * 100,
+        **config_kwargs,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=img_group_dir.parent
+    )
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.return_value = "{}"
+    ocr_engine.aocr_json = mock.AsyncMock(return_value="{}")
+    ocr_engine.ocr_batch_json.side_effect = lambda images: ["{}"] * len(images)
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act
+    ocr_output_path = ocr_executor.run()
+
+    # assert
+    assert sorted(fn.name for fn in (ocr_output_path / "W1KG12345-1234").iterdir()) == [
+        "I12340002.json.gz"
+    ]
+
+
+def test_executor_skips_blank_and_duplicate_pages(tmp_path):
+    # arrange
+    pytest.importorskip("numpy")
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    page = PillowImage.new("L", (400, 200), color=255)
+    page.save(img_group_dir / "I12340001.png")
+    ImageDraw.Draw(page).line([(20, 100), (380, 100)], fill=0, width=3)
+    page.save(img_group_dir / "I12340002.png")
+    page.save(img_group_dir / "I12340003.png")
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        skip_blank_pages=True,
+        skip_duplicate_pages=True,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=img_group_dir.parent
+    )
+    ocr_executor.get_ocr_engine = mock.MagicMock()  # type: ignore
+    ocr_engine = ocr_executor.get_ocr_engine.return_value
+    ocr_engine.ocr_json.return_value = json.dumps({"text": "page"})
+
+    # act
+    ocr_output_path = ocr_executor.run()
+
+    # assert
+    ocred_images = [call.args[0].name for call in ocr_engine.ocr_json.call_args_list]
+    assert ocred_images == ["I12340002.png"]
+    ocr_output_dir = ocr_output_path / "W1KG12345-1234"
+    results = {
+        result_fn.name: json.loads(gzip.decompress(result_fn.read_bytes()))
+        for result_fn in ocr_output_dir.iterdir()
+    }
+    assert results == {
+        "I12340001.json.gz": {},
+        "I12340002.json.gz": {"text": "page"},
+        "I12340003.json.gz": {"text": "page"},
+    }
+    assert ocr_executor.skipped_pages == {
+        "blank": {"I1234": ["I12340001.png"]},
+        "duplicate": {"I1234": {"I12340003.png": "I12340002.png"}},
+    }
+
+
+def test_executor_completes_duplicate_pages_once_their_twin_is_ocred(tmp_path):
+    # arrange
+    pytest.importorskip("numpy")
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    page = PillowImage.new("L", (400, 200), color=255)
+    ImageDraw.Draw(page).line([(20, 100), (380, 100)], fill=0, width=3)
+    page.save(img_group_dir / "I12340001.png")
+    page.save(img_group_dir / "I12340002.png")
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        skip_duplicate_pages=True,
+        job_ledger_path=tmp_path / "jobs.sqlite",
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=img_group_dir.parent
+    )
+
+    # act
+    pending_imgs = ocr_executor.filter_pending_imgs(ocr_executor.iter_pending_imgs())
+    img_path, result_fn = next(pending_imgs)
+    result_fn.write_bytes(gzip.compress(b"{}"))
+    ocr_executor.complete_claimed_page(result_fn)
+    remaining_imgs = list(pending_imgs)
+
+    # assert
+    assert img_path.name == "I12340001.png"
+    assert remaining_imgs == []
+    done_pages = ocr_executor.ledger.get_pages(  # type: ignore
+        "W1KG12345", state="done"
+    )
+    assert [page["page"] for page in done_pages] == ["I12340001.png", "I12340002.png"]
+
+
+def test_executor_concurrent_run(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_workers=4,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    existing_result_fn = ocr_executor.get_result_fn(
+        image_download_dir / "I1234" / "I12340001.jpg"
+    )
+    existing_result_fn.parent.mkdir(parents=True)
+    existing_result_fn.write_bytes(b"existing")
+
+    # mocks
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.side_effect = lambda img_path: json.dumps(
+        {"image": img_path.name}
+    )
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act
+    ocr_output_path = ocr_executor.run()
+
+    # assert
+    assert ocr_engine.ocr_json.call_count == 19
+    assert existing_result_fn.read_bytes() == b"existing"
+    for img_path in image_download_dir.glob("*/*.jpg"):
+        result_fn = ocr_executor.get_result_fn(img_path)
+        assert result_fn.parent.parent == ocr_output_path
+        if result_fn == existing_result_fn:
+            continue
+        result = json.loads(gzip.decompress(result_fn.read_bytes()))
+        assert result == {"image": img_path.name}
+
+
+def test_executor_concurrent_run_fails_fast_on_credentials_error(
+    image_download_dir, tmp_path
+):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_workers=2,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+
+    # mocks
+    def fake_ocr_json(img_path):
+        time.sleep(0.01)
+        raise GoogleVisionCredentialsError("invalid credentials")
+
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.side_effect = fake_ocr_json
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act and assert
+    with pytest.raises(OcrExecutorError):
+        ocr_executor.run()
+    assert ocr_engine.ocr_json.call_count < 20
+    assert not list((tmp_path / "ocr_outputs").glob("*/*/*.json.gz"))
+
+
+def test_executor_iter_batches(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_batch_size=4,
+        ocr_batch_max_bytes=25,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    img_group_dir = image_download_dir / "I1234"
+    (img_group_dir / "I12340005.jpg").write_bytes(b"large-fake-image" * 2)
+
+    # act
+    batches = list(ocr_executor.iter_batches(ocr_executor.iter_pending_imgs()))
+
+    # assert
+    batch_sizes = [len(batch) for batch in batches]
+    assert batch_sizes == [2, 2, 1, 2, 2, 2, 2, 2, 2, 2, 1]
+    assert batches[2][0][0] == img_group_dir / "I12340005.jpg"
+    assert [img_path for batch in batches for img_path, _ in batch] == sorted(
+        image_download_dir.glob("*/*.jpg")
+    )
+
+
+def test_executor_batched_run(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_batch_size=16,
+        ocr_workers=2,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    failed_img_path = image_download_dir / "I1235" / "I12350002.jpg"
+
+    # mocks
+    def fake_ocr_batch_json(img_paths):
+        return [
+            (
+                ValueError("fake error")
+                if img_path == failed_img_path
+                else json.dumps({"image": img_path.name})
+            )
+            for img_path in img_paths
+        ]
+
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_batch_json.side_effect = fake_ocr_batch_json
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act
+    ocr_executor.run()
+
+    # assert
+    assert ocr_engine.ocr_batch_json.call_count == 2
+    assert ocr_engine.ocr_json.call_count == 0
+    for img_path in image_download_dir.glob("*/*.jpg"):
+        result_fn = ocr_executor.get_result_fn(img_path)
+        assert result_fn.is_file() == (img_path != failed_img_path)
+
+
+def test_executor_batched_run_fails_on_credentials_error(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_batch_size=16,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+
+    # mocks
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_batch_json.side_effect = lambda img_paths: [
+        GoogleVisionCredentialsError("invalid credentials") for _ in img_paths
+    ]
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act and assert
+    with pytest.raises(OcrExecutorError):
+        ocr_executor.run()
+    assert ocr_engine.ocr_batch_json.call_count == 1
+
+
+def test_executor_async_run(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_workers=8,
+        ocr_async=True,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    failed_img_path = image_download_dir / "I1235" / "I12350002.jpg"
+    n_in_flight = 0
+    max_in_flight = 0
+
+    # mocks
+    async def fake_aocr_json(img_path):
+        nonlocal n_in_flight, max_in_flight
+        n_in_flight += 1
+        max_in_flight = max(max_in_flight, n_in_flight)
+        await asyncio.sleep(0.01)
+        n_in_flight -= 1
+        if img_path == failed_img_path:
+            raise ValueError("fake error")
+        return json.dumps({"image": img_path.name})
+
+    ocr_engine = mock.MagicMock()
+    ocr_engine.aocr_json.side_effect = fake_aocr_json
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act
+    ocr_executor.run()
+
+    # assert
+    assert ocr_engine.aocr_json.call_count == 20
+    assert 1 < max_in_flight <= 8
+    for img_path in image_download_dir.glob("*/*.jpg"):
+        result_fn = ocr_executor.get_result_fn(img_path)
+        assert result_fn.is_file() == (img_path != failed_img_path)
+
+
+def test_executor_async_run_fails_fast_on_credentials_error(
+    image_download_dir, tmp_path
+):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_workers=2,
+        ocr_async=True,
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+
+    # mocks
+    async def fake_aocr_json(img_path):
+        await asyncio.sleep(0.01)
+        raise GoogleVisionCredentialsError("invalid credentials")
+
+    ocr_engine = mock.MagicMock()
+    ocr_engine.aocr_json.side_effect = fake_aocr_json
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act and assert
+    with pytest.raises(OcrExecutorError):
+        ocr_executor.run()
+    assert ocr_engine.aocr_json.call_count < 20
+
+
+def test_executor_run_with_ocr_cache(image_download_dir, tmp_path):
+    # arrange
+    img_paths = sorted(image_download_dir.glob("*/*.jpg"))
+    for img_path in img_paths:
+        # the images of I1235 are duplicates of the images of I1234
+        img_path.write_bytes(f"fake-image-{img_path.stem[-4:]}".encode())
+
+    def get_ocr_executor(ocr_outputs_path):
+        import_config = ImportConfig(
+            ocr_engine="GoogleVisionEngine",
+            ocr_outputs_path=ocr_outputs_path,
+            ocr_cache_path=tmp_path / "ocr_cache",
+        )
+        ocr_executor = OCRExecutor(
+            config=import_config, image_download_dir=image_download_dir
+        )
+        ocr_engine = mock.MagicMock()
+        ocr_engine.ocr_json.side_effect = lambda img_path: json.dumps(
+            {"image": img_path.stem[-4:]}
+        )
+        ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+        return ocr_executor, ocr_engine
+
+    ocr_executor, ocr_engine = get_ocr_executor(tmp_path / "ocr_outputs")
+    reimport_ocr_executor, reimport_ocr_engine = get_ocr_executor(
+        tmp_path / "reimport_ocr_outputs"
+    )
+
+    # act
+    ocr_executor.run()
+    ocr_output_path = reimport_ocr_executor.run()
+
+    # assert
+    # the duplicates are cached once their first ocr output is written
+    assert ocr_engine.ocr_json.call_count >= 10
+    assert ocr_engine.ocr_json.call_count + ocr_executor.ocr_cache.hits == 20  # type: ignore
+    assert reimport_ocr_engine.ocr_json.call_count == 0
+    assert reimport_ocr_executor.ocr_cache.hits == 20  # type: ignore
+    for img_path in img_paths:
+        result_fn = reimport_ocr_executor.get_result_fn(img_path)
+        assert result_fn.is_relative_to(ocr_output_path)
+        assert json.loads(gzip.decompress(result_fn.read_bytes())) == {
+            "image": img_path.stem[-4:]
+        }
+
+
+def test_executor_cache_key_depends_on_response_profile_and_tiling(tmp_path):
+    # arrange
+    img_path = tmp_path / "images" / "W1KG12345" / "I1234" / "I12340001.jpg"
+    img_path.parent.mkdir(parents=True)
+    img_path.write_bytes(b"fake-image")
+
+    def get_cache_key(**kwargs):
+        import_config = ImportConfig(
+            ocr_engine="GoogleVisionEngine",
+            ocr_outputs_path=tmp_path / "ocr_outputs",
+            ocr_cache_path=tmp_path / "ocr_cache",
+            **kwargs,
+        )
+        ocr_executor = OCRExecutor(
+            config=import_config, image_download_dir=img_path.parents[1]
+        )
+        return ocr_executor.get_cache_key(img_path)
+
+    # act
+    full_key = get_cache_key()
+    text_key = get_cache_key(ocr_response_profile="text")
+    tiled_key = get_cache_key(ocr_batch_size=4, ocr_tiles_per_request=4)
+
+    # assert
+    assert full_key == get_cache_key(ocr_response_profile="full")
+    assert len({full_key, text_key, tiled_key}) == 3
+    assert tiled_key != get_cache_key(ocr_batch_size=4, ocr_tiles_per_request=2)
+
+
+def test_executor_run_with_job_ledger(image_download_dir, tmp_path):
+    # arrange
+    failed_img_path = image_download_dir / "I1235" / "I12350002.jpg"
+
+    def get_ocr_executor():
+        import_config = ImportConfig(
+            ocr_engine="GoogleVisionEngine",
+            ocr_outputs_path=tmp_path / "ocr_outputs",
+            job_ledger_path=tmp_path / "jobs.sqlite",
+        )
+        ocr_executor = OCRExecutor(
+            config=import_config, image_download_dir=image_download_dir
+        )
+        ocr_engine = mock.MagicMock()
+        ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+        return ocr_executor, ocr_engine
+
+    def fake_ocr_json(img_path):
+        if img_path == failed_img_path:
+            raise ValueError("fake error")
+        return json.dumps({"image": img_path.name})
+
+    ocr_executor, ocr_engine = get_ocr_executor()
+    ocr_engine.ocr_json.side_effect = fake_ocr_json
+    resumed_ocr_executor, resumed_ocr_engine = get_ocr_executor()
+    resumed_ocr_engine.ocr_json.return_value = "{}"
+
+    # act
+    ocr_executor.run()
+    counts = ocr_executor.ledger.get_counts("W1KG12345")  # type: ignore
+    resumed_ocr_executor.run()
+
+    # assert
+    assert counts == {"ocr": {"done": 19, "pending": 1}}
+    resumed_ocr_engine.ocr_json.assert_called_once_with(failed_img_path)
+    ledger = resumed_ocr_executor.ledger
+    assert ledger.get_counts("W1KG12345") == {"ocr": {"done": 20}}  # type: ignore
+    (failed_page,) = [
+        page
+        for page in ledger.get_pages("W1KG12345", stage="ocr")  # type: ignore
+        if page["page"] == failed_img_path.name
+    ]
+    assert failed_page["attempts"] == 2
+    assert failed_page["n_bytes"] > 0
+
+
+def test_executor_completes_cached_pages_right_away(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_cache_path=tmp_path / "ocr_cache",
+        job_ledger_path=tmp_path / "jobs.sqlite",
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    ocr_engine = mock.MagicMock()
+    img_path, result_fn = next(ocr_executor.iter_pending_imgs())
+    cache_key = ocr_executor.get_cache_key(img_path)
+    ocr_executor.ocr_cache.put(cache_key, gzip.compress(b"{}"))  # type: ignore
+
+    # act
+    ocr_executor.ocr_img(ocr_engine, img_path, result_fn)
+
+    # assert
+    ocr_engine.ocr_json.assert_not_called()
+    (done_page,) = ocr_executor.ledger.get_pages(  # type: ignore
+        "W1KG12345", state="done"
+    )
+    assert done_page["page"] == img_path.name
+
+
+def test_executor_zip_output_waits_for_the_other_workers(image_download_dir, tmp_path):
+    # arrange
+    def get_ocr_executor():
+        import_config = ImportConfig(
+            ocr_engine="GoogleVisionEngine",
+            ocr_outputs_path=tmp_path / "ocr_outputs",
+            ocr_output_format="zip",
+            job_ledger_path=tmp_path / "jobs.sqlite",
+        )
+        ocr_executor = OCRExecutor(
+            config=import_config, image_download_dir=image_download_dir
+        )
+        ocr_engine = mock.MagicMock()
+        ocr_engine.ocr_json.return_value = "{}"
+        ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+        return ocr_executor
+
+    ocr_executor = get_ocr_executor()
+    ledger = ocr_executor.ledger
+    ocr_executor.register_imgs(ledger)  # type: ignore
+    # a page claimed by another worker
+    (job,) = ledger.claim("W1KG12345", "ocr", "other-worker")  # type: ignore
+
+    # act
+    ocr_output_path = ocr_executor.run()
+    unpacked_fns = sorted(fn.name for fn in ocr_output_path.iterdir())
+    ledger.complete("W1KG12345", "ocr", job.img_group, job.page)  # type: ignore
+    get_ocr_executor().run()
+
+    # assert
+    assert unpacked_fns == ["W1KG12345-1234", "W1KG12345-1235"]
+    assert sorted(fn.name for fn in ocr_output_path.iterdir()) == [
+        "W1KG12345-1234.zip",
+        "W1KG12345-1235.zip",
+    ]
+
+
+def test_executor_run_with_zip_output_format(image_download_dir, tmp_path):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        ocr_output_format="zip",
+    )
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=image_download_dir
+    )
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.side_effect = lambda img_path: json.dumps(
+        {"image": img_path.name}
+    )
+    ocr_executor.get_ocr_engine = mock.MagicMock(return_value=ocr_engine)  # type: ignore
+
+    # act
+    ocr_output_path = ocr_executor.run()
+    resumed_ocr_output_path = ocr_executor.run()
+
+    # assert
+    assert resumed_ocr_output_path == ocr_output_path
+    assert ocr_engine.ocr_json.call_count == 20
+    assert sorted(fn.name for fn in ocr_output_path.iterdir()) == [
+        "W1KG12345-1234.zip",
+        "W1KG12345-1235.zip",
+    ]
+    with zipfile.ZipFile(ocr_output_path / "W1KG12345-1234.zip") as archive:
+        assert len(archive.namelist()) == 10
+        assert json.loads(gzip.decompress(archive.read("I12340001.json.gz"))) == {
+            "image": "I12340001.jpg"
+        }
+
+
+@mock.patch("ocr_pipelines.executor.GoogleVisionEngine", autospec=True)
+def test_get_ocr_engine_with_several_credentials(mock_google_vision_engine):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        credentials=[{"key": 1}, {"key": 2}],
+        ocr_max_retries=3,
+    )
+    ocr_executor = OCRExecutor(config=import_config, image_download_dir=Path("W1"))
+
+    # act
+    with mock.patch(
+        "ocr_pipelines.executor.ocr_engine_class_register",
+        {"GoogleVisionEngine": mock_google_vision_engine},
+    ):
+        ocr_engine = ocr_executor.get_ocr_engine()
+
+    # assert
+    assert isinstance(ocr_engine, EnginePool)
+    assert len(ocr_engine.engines) == 2
+    assert ocr_engine.max_retries == 3
+    credentials = [call.args[0] for call in mock_google_vision_engine.call_args_list]
+    assert credentials == [{"key": 1}, {"key": 2}]
+    rate_limiters = [
+        call.kwargs["rate_limiter"] for call in mock_google_vision_engine.call_args_list
+    ]
+    assert [rate_limiter.max_retries for rate_limiter in rate_limiters] == [0, 0]
+
+
+def test_get_ocr_engine_returns_shared_engine():
+    # arrange
+    ocr_engine = mock.MagicMock()
+    import_config = ImportConfig(ocr_engine="GoogleVisionEngine")
+    ocr_executor = OCRExecutor(
+        config=import_config, image_download_dir=Path("W1"), ocr_engine=ocr_engine
+    )
+
+    # act and assert
+    assert ocr_executor.get_ocr_engine() is ocr_engine
+
+
+@pytest.mark.parametrize(
+    "config_kwargs",
+    [{"ocr_batch_size": 1}, {"ocr_batch_size": 16, "ocr_async": True}],
+)
+def test_executor_rejects_tiles_without_batches(config_kwargs):
+    # arrange
+    import_config = ImportConfig(
+        ocr_engine="GoogleVisionEngine", ocr_tiles_per_request=4, **config_kwargs
+    )
+
+    # act and assert
+    with pytest.raises(ValueError, match="ocr_tiles_per_request"):
+        OCRExecutor(config=import_config, image_download_dir=Path("W1"))
@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+
+
+def get_warm_policy(latency=0.01, **kwargs):
+    hedging = HedgingPolicy(min_samples=10, **kwargs)
+    for _ in range(10):
+        hedging.record(latency)
+    return hedging
+
+
+def test_hedging_delay_is_latency_percentile():
+    # arrange
+    hedging = HedgingPolicy(percentile=0.9, min_samples=5)
+
+    # act
+    delays = []
+    for latency in range(1, 11):
+        delays.append(hedging.get_delay())
+        hedging.record(latency)
+
+    # assert
+    assert delays[:5] == [None] * 5
+    assert hedging.get_delay() == 9
+
+
+def test_hedging_returns_the_first_response():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1)
+    calls = []
+    release_primary = threading.Event()
+
+    def request():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # the primary request hangs
+            release_primary.wait(5)
+            return "primary"
+        return "hedge"
+
+    # act
+    start = time.monotonic()
+    result = hedging.call(request)
+    elapsed = time.monotonic() - start
+    release_primary.set()
+
+    # assert
+    assert result == "hedge"
+    assert elapsed < 1
+    assert hedging.n_hedged == 1
+    assert hedging.n_hedge_wins == 1
+
+
+def test_hedging_does_not_wait_for_the_rate_limiter_slot():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1)
+    rate_limiter = RateLimiter(max_concurrency=1)
+    calls = []
+    release_primary = threading.Event()
+
+    def request():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            release_primary.wait(5)
+            return "primary"
+        return "hedge"
+
+    # act
+    start = time.monotonic()
+    result = hedging.call(
+        request,
+        send=lambda timed_request: rate_limiter.call(timed_request),
+        can_hedge=rate_limiter.try_reserve,
+    )
+    elapsed = time.monotonic() - start
+    release_primary.set()
+
+    # assert
+    assert result == "hedge"
+    assert elapsed < 1
+
+
+def test_hedging_drops_the_hedge_not_sent_before_the_response():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1, max_workers=1)
+    calls = []
+
+    def request():
+        calls.append(len(calls))
+        time.sleep(0.1)
+        return "primary"
+
+    # act
+    result = hedging.call(request)
+    time.sleep(0.05)
+
+    # assert
+    assert result == "primary"
+    assert calls == [0]
+    assert hedging.n_hedged == 1
+
+
+def test_hedging_latency_excludes_the_rate_limiter_wait():
+    # arrange
+    hedging = HedgingPolicy(min_samples=1)
+
+    def send(timed_request):
+        # the request waits in the rate limiter
+        time.sleep(0.2)
+        return timed_request()
+
+    # act
+    hedging.call(lambda: "response", send=send)
+
+    # assert
+    assert hedging.get_delay() < 0.1
+
+
+def test_hedging_respects_the_extra_hedges_in_flight():
+    # arrange
+    hedging = HedgingPolicy(max_extra_ratio=1, max_hedges=1)
+
+    # act
+    hedges = []
+    for _ in range(3):
+        hedging.start_request()
+        hedges.append(hedging.try_hedge())
+    hedging.finish_hedge()
+    hedging.start_request()
+    hedges.append(hedging.try_hedge())
+
+    # assert
+    assert hedges == [True, False, False, True]
+
+
+def test_hedging_respects_the_extra_request_budget():
+    # arrange
+    hedging = HedgingPolicy(max_extra_ratio=0.25)
+
+    # act
+    hedges = []
+    for _ in range(8):
+        hedging.start_request()
+        hedges.append(hedging.try_hedge())
+
+    # assert
+    assert hedges == [False, False, False, True, False, False, False, True]
+    assert hedging.n_hedged == 2
+
+
+def test_hedging_raises_when_both_requests_fail():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1)
+
+    def request():
+        time.sleep(0.05)
+        raise ValueError("failed")
+
+    # act and assert
+    with pytest.raises(ValueError):
+        hedging.call(request)
+    assert hedging.n_hedged == 1
+
+
+def test_hedging_uses_the_hedge_when_the_primary_fails():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1)
+    calls = []
+
+    def request():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise ValueError("failed")
+        time.sleep(0.1)
+        return "hedge"
+
+    # act
+    result = hedging.call(request)
+
+    # assert
+    assert result == "hedge"
+
+
+def test_hedging_acall_cancels_the_slower_request():
+    # arrange
+    hedging = get_warm_policy(max_extra_ratio=1)
+    cancelled = []
+
+    async def request():
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+            return "primary"
+        return "hedge"
+
+    # act
+    result = asyncio.run(hedging.acall(request))
+
+    # assert
+    assert result == "hedge"
+    assert cancelled == [True]
@@ -1,11 +1,19 @@
+import hashlib
 import io
+import threading
 from pathlib import Path
 from unittest import mock
 
 import pytest
+from PIL import Image as PillowImage
 
 from ocr_pipelines.exceptions import BdcrScanNotFound
-from ocr_pipelines.image_downloader import BDRCImageDownloader
+from ocr_pipelines.image_downloader import (
+    BDRCImageDownloader,
+    SourceImage,
+    detect_img_format,
+)
+from ocr_pipelines.utils import PageSlots
 
 
 @pytest.mark.skip(reason="required interent connection")
@@ -87,8 +95,10 @@ def test_save_img_group(mock_get_s3_folder_prefix, mock_gets3blob):
     img_fn = "I00KG098350001.tif"
     downloader = BDRCImageDownloader(bdrc_scan_id=bdrc_scan_id, output_dir=Path("/tmp"))
 
+    img_bits = io.BytesIO(b"fake-image-content")
+
     # mocks
-    mock_gets3blob.return_value = b"fake-image-content"
+    mock_gets3blob.return_value = img_bits
     mock_get_s3_folder_prefix.return_value = f"{bdrc_scan_id}/{img_group}"
     downloader.get_s3_img_list = mock.MagicMock(return_value=[img_fn])  # type: ignore
     downloader.save_img = mock.MagicMock()  # type: ignore
@@ -99,11 +109,174 @@ def test_save_img_group(mock_get_s3_folder_prefix, mock_gets3blob):
     # assert
     downloader.get_s3_img_list.assert_called_once_with(img_group)
     downloader.save_img.assert_called_once_with(
-        b"fake-image-content", "I00KG098350001.tif", Path("/tmp")
+        img_bits, "I00KG098350001.tif", Path("/tmp")
     )
     mock_gets3blob.assert_called_once_with(f"{bdrc_scan_id}/{img_group}/{img_fn}")
 
 
+@mock.patch("ocr_pipelines.image_downloader.buda_api.gets3blob")
+@mock.patch("ocr_pipelines.image_downloader.buda_api.get_s3_folder_prefix")
+def test_save_img_group_concurrently(mock_get_s3_folder_prefix, mock_gets3blob):
+    # arrange
+    bdrc_scan_id = "W1KG12429"
+    img_group = "I00KG09835"
+    img_fns = [f"I00KG09835000{i}.jpg" for i in range(5, 0, -1)]
+    downloader = BDRCImageDownloader(
+        bdrc_scan_id=bdrc_scan_id, output_dir=Path("/tmp"), max_workers=4
+    )
+
+    # mocks
+    def fake_gets3blob(key):
+        if key.endswith("0003.jpg"):
+            return None
+        if key.endswith("0004.jpg"):
+            return io.BytesIO()
+        return io.BytesIO(b"fake-image-content")
+
+    mock_gets3blob.side_effect = fake_gets3blob
+    mock_get_s3_folder_prefix.return_value = f"{bdrc_scan_id}/{img_group}"
+    downloader.get_s3_img_list = mock.MagicMock(return_value=img_fns)  # type: ignore
+    downloader.save_img = mock.MagicMock(return_value=True)  # type: ignore
+
+    # act
+    failed_img_fns = downloader.save_img_group(img_group, Path("/tmp"))
+
+    # assert
+    assert failed_img_fns == ["I00KG098350003.jpg", "I00KG098350004.jpg"]
+    assert mock_gets3blob.call_count == 5
+    saved_img_fns = sorted(call.args[1] for call in downloader.save_img.call_args_list)
+    assert saved_img_fns == [
+        "I00KG098350001.jpg",
+        "I00KG098350002.jpg",
+        "I00KG098350005.jpg",
+    ]
+
+
+@mock.patch("ocr_pipelines.image_downloader.buda_api.gets3blob")
+def test_download_img_records_source_image(mock_gets3blob, tmp_path):
+    # arrange
+    downloader = BDRCImageDownloader(bdrc_scan_id="W1KG12429", output_dir=tmp_path)
+    img_fn = "I00KG098350001.jpg"
+
+    # mocks
+    mock_gets3blob.return_value = io.BytesIO(b"fake-image-content")
+    downloader.save_img = mock.MagicMock(return_value=True)  # type: ignore
+
+    # act
+    saved_img_path = downloader.download_img(img_fn, "W1KG12429/I00KG09835", tmp_path)
+
+    # assert
+    assert saved_img_path == tmp_path / img_fn
+    assert downloader.source_images == {
+        tmp_path
+        / img_fn: SourceImage(
+            key="W1KG12429/I00KG09835/I00KG098350001.jpg",
+            md5=hashlib.md5(b"fake-image-content").hexdigest(),
+        )
+    }
+
+
+def test_download_img_in_memory(tmp_path):
+    # arrange
+    downloader = BDRCImageDownloader(
+        bdrc_scan_id="W1KG12429", output_dir=tmp_path, in_memory_images=True
+    )
+    tiff_bytes = Path("tests/data/images/tiff_image.tif").read_bytes()
+
+    # mocks
+    downloader.fetch_img = mock.MagicMock(  # type: ignore
+        return_value=io.BytesIO(tiff_bytes)
+    )
+
+    # act
+    saved_img_path = downloader.download_img(
+        "I00KG098350001.tif", "W1KG12429/I00KG09835", tmp_path
+    )
+
+    # assert
+    assert saved_img_path == tmp_path / "I00KG098350001.png"
+    assert not saved_img_path.exists()
+    img_bytes = downloader.pop_img_bytes(saved_img_path)
+    with PillowImage.open(io.BytesIO(img_bytes)) as img:  # type: ignore
+        assert img.format == "PNG"
+        assert img.mode == "1"
+    assert downloader.pop_img_bytes(saved_img_path) is None
+
+
+def test_download_reports_failed_images(tmp_path):
+    # arrange
+    downloader = BDRCImageDownloader(bdrc_scan_id="W1KG12429", output_dir=tmp_path)
+
+    # mocks
+    downloader.get_img_groups = mock.MagicMock(  # type: ignore
+        return_value=["I00KG09835", "I00KG09836"]
+    )
+    downloader.save_img_group = mock.MagicMock(  # type: ignore
+        side_effect=[[], ["I00KG098360002.tif"]]
+    )
+
+    # act
+    downloader.download()
+
+    # assert
+    assert downloader.failed_images == {"I00KG09836": ["I00KG098360002.tif"]}
+
+
+def test_iter_download(tmp_path):
+    # arrange
+    downloader = BDRCImageDownloader(
+        bdrc_scan_id="W1KG12429", output_dir=tmp_path, max_workers=2
+    )
+    img_group_dir = tmp_path / "W1KG12429" / "I00KG09835"
+
+    # mocks
+    downloader.get_img_groups = mock.MagicMock(  # type: ignore
+        return_value=["I00KG09835"]
+    )
+    downloader.iter_img_group = mock.MagicMock(  # type: ignore
+        return_value=[
+            ("I00KG098350001.tif", img_group_dir / "I00KG098350001.png"),
+            ("I00KG098350002.tif", None),
+        ]
+    )
+
+    # act
+    saved_imgs = list(downloader.iter_download())
+
+    # assert
+    assert saved_imgs == [("I00KG09835", img_group_dir / "I00KG098350001.png")]
+    assert downloader.failed_images == {"I00KG09835": ["I00KG098350002.tif"]}
+    assert img_group_dir.is_dir()
+
+
+@mock.patch("ocr_pipelines.image_downloader.buda_api.get_s3_folder_prefix")
+def test_iter_img_group_takes_page_slots_before_fetching(
+    mock_get_s3_folder_prefix, tmp_path
+):
+    # arrange
+    downloader = BDRCImageDownloader(
+        bdrc_scan_id="W1KG12429", output_dir=tmp_path, max_workers=2
+    )
+    img_fns = [f"I00KG09835000{i}.jpg" for i in range(1, 7)]
+    page_slots = PageSlots(n_slots=3)
+    # the slots of the yielded images are never released
+    threading.Timer(0.3, page_slots.stop.set).start()
+
+    # mocks
+    downloader.get_s3_img_list = mock.MagicMock(return_value=img_fns)  # type: ignore
+    downloader.download_img = mock.MagicMock(  # type: ignore
+        side_effect=lambda img_fn, s3_folder_prefix, img_group_dir: img_group_dir
+        / img_fn
+    )
+
+    # act
+    saved_imgs = list(downloader.iter_img_group("I00KG09835", tmp_path, page_slots))
+
+    # assert
+    assert saved_imgs == [(img_fn, tmp_path / img_fn) for img_fn in img_fns[:3]]
+    assert downloader.download_img.call_count == 3
+
+
 @mock.patch("ocr_pipelines.image_downloader.buda_api.get_image_list_s3")
 def test_get_s3_img_list(mock_get_image_list_s3):
     # arrange
@@ -164,6 +337,80 @@ def test_save_img_wang_option(tmp_path):
     downloader.save_img_with_wand.assert_called_once_with(img_fp, saved_img_path)
 
 
+@pytest.mark.parametrize(
+    "img_bytes,expected",
+    [
+        (b"\xff\xd8\xff\xe0\x00\x10JFIF", "jpeg"),
+        (b"\x89PNG\r\n\x1a\n\x00\x00", "png"),
+        (b"GIF89a\x01\x00", "gif"),
+        (b"BM\x8e\x00\x00\x00", "bmp"),
+        (b"RIFF\x24\x00\x00\x00WEBPVP8 ", "webp"),
+        (b"II*\x00\x08\x00\x00\x00", "tiff"),
+        (b"MM\x00*\x00\x00\x00\x08", "tiff"),
+        (b"fake-image-content", None),
+    ],
+)
+def test_detect_img_format(img_bytes, expected):
+    assert detect_img_format(img_bytes) == expected
+
+
+def test_save_img_writes_jpeg_as_is(tmp_path):
+    # arrange
+    img_fn = "I1110001.jpg"
+    img_bytes = b"\xff\xd8\xff\xe0fake-jpeg-content"
+    downloader = BDRCImageDownloader(bdrc_scan_id="W1KG124", output_dir=tmp_path)
+
+    # mocks
+    downloader.save_img_with_pillow = mock.MagicMock()  # type: ignore
+
+    # act
+    saved = downloader.save_img(io.BytesIO(img_bytes), img_fn, tmp_path)
+
+    # assert
+    assert saved is True
+    assert (tmp_path / img_fn).read_bytes() == img_bytes
+    downloader.save_img_with_pillow.assert_not_called()
+
+
+def test_save_img_converts_bilevel_tiff_to_1_bit_png(tmp_path):
+    # arrange
+    img_fp = io.BytesIO(Path("tests/data/images/tiff_image.tif").read_bytes())
+    downloader = BDRCImageDownloader(bdrc_scan_id="W1KG124", output_dir=tmp_path)
+
+    # act
+    saved = downloader.save_img(img_fp, "I1110001.tif", tmp_path)
+
+    # assert
+    assert saved is True
+    with PillowImage.open(tmp_path / "I1110001.png") as img:
+        assert img.format == "PNG"
+        assert img.mode == "1"
+
+
+def test_save_img_converts_in_process(tmp_path):
+    # arrange
+    img_fp = io.BytesIO(Path("tests/data/images/tiff_image.tif").read_bytes())
+    downloader = BDRCImageDownloader(
+        bdrc_scan_id="W1KG124", output_dir=tmp_path, conversion_processes=1
+    )
+
+    # mocks
+    downloader.save_img_with_pillow = mock.MagicMock()  # type: ignore
+
+    # act
+    with mock.patch("tempfile.tempdir", str(tmp_path / "spool")):
+        (tmp_path / "spool").mkdir()
+        saved = downloader.save_img(img_fp, "I1110001.tif", tmp_path)
+    downloader.close()
+
+    # assert
+    assert saved is True
+    downloader.save_img_with_pillow.assert_not_called()
+    with PillowImage.open(tmp_path / "I1110001.png") as img:
+        assert img.mode == "1"
+    assert list((tmp_path / "spool").iterdir()) == []
+
+
 def test_save_img_with_pillow(tmp_path):
     # arrange
     bdrc_scan_id = "W1KG12429"
@@ -0,0 +1,161 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from ocr_pipelines.ledger import (
+    PAGE_CLAIMED,
+    PAGE_DONE,
+    PAGE_FAILED,
+    PAGE_PENDING,
+    STAGE_OCR,
+    JobLedger,
+)
+
+SCAN_ID = "W1KG12345"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = JobLedger(tmp_path / "jobs.sqlite", lease_seconds=10, max_attempts=2)
+    ledger.add_pages(
+        SCAN_ID, STAGE_OCR, [("I1234", f"I1234{i:04}.jpg") for i in range(1, 11)]
+    )
+    return ledger
+
+
+def test_add_pages_keeps_existing_pages(ledger):
+    # act
+    n_added = ledger.add_pages(
+        SCAN_ID,
+        STAGE_OCR,
+        [("I1234", "I12340001.jpg"), ("I1235", "I12350001.jpg")],
+        state=PAGE_DONE,
+    )
+
+    # assert
+    assert n_added == 1
+    assert ledger.has_pages(SCAN_ID, STAGE_OCR)
+    assert not ledger.has_pages("W2", STAGE_OCR)
+    assert ledger.get_counts(SCAN_ID) == {STAGE_OCR: {PAGE_PENDING: 10, PAGE_DONE: 1}}
+
+
+def test_claim_pages_in_order(ledger):
+    # act
+    jobs = ledger.claim(SCAN_ID, STAGE_OCR, "worker-1", limit=3)
+
+    # assert
+    assert [job.page for job in jobs] == [
+        "I12340001.jpg",
+        "I12340002.jpg",
+        "I12340003.jpg",
+    ]
+    assert all(job.attempts == 1 for job in jobs)
+    claimed = ledger.get_pages(SCAN_ID, STAGE_OCR, PAGE_CLAIMED)
+    assert [page["worker"] for page in claimed] == ["worker-1"] * 3
+
+
+def test_claim_is_atomic_across_workers(ledger):
+    # arrange
+    claimed_pages: dict[str, list[str]] = {}
+
+    def work(worker):
+        pages = claimed_pages.setdefault(worker, [])
+        # each thread has its own connection to the ledger
+        while jobs := ledger.claim(SCAN_ID, STAGE_OCR, worker, limit=2):
+            pages.extend(job.page for job in jobs)
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    all_pages = [page for pages in claimed_pages.values() for page in pages]
+    assert sorted(all_pages) == [f"I1234{i:04}.jpg" for i in range(1, 11)]
+
+
+def test_claim_expired_lease(ledger):
+    # arrange
+    ledger.claim(SCAN_ID, STAGE_OCR, "dead-worker", limit=10)
+    assert ledger.claim(SCAN_ID, STAGE_OCR, "worker", limit=10) == []
+
+    # act
+    with mock.patch("ocr_pipelines.ledger.time.time", return_value=time.time() + 11):
+        jobs = ledger.claim(SCAN_ID, STAGE_OCR, "worker", limit=10)
+        # the second lease of the pages expires too, they are failed
+        with mock.patch(
+            "ocr_pipelines.ledger.time.time", return_value=time.time() + 22
+        ):
+            failed_jobs = ledger.claim(SCAN_ID, STAGE_OCR, "worker", limit=10)
+
+    # assert
+    assert len(jobs) == 10
+    assert all(job.attempts == 2 for job in jobs)
+    assert failed_jobs == []
+    assert ledger.get_counts(SCAN_ID) == {STAGE_OCR: {PAGE_FAILED: 10}}
+
+
+def test_release_page(ledger):
+    # arrange
+    (job,) = ledger.claim(SCAN_ID, STAGE_OCR, "worker")
+
+    # act
+    ledger.release(SCAN_ID, STAGE_OCR, job.img_group, job.page, "other-worker")
+    claimed_by_other = ledger.get_pages(SCAN_ID, STAGE_OCR, PAGE_CLAIMED)
+    ledger.release(SCAN_ID, STAGE_OCR, job.img_group, job.page, "worker", "error")
+    (reclaimed_job,) = ledger.claim(SCAN_ID, STAGE_OCR, "worker")
+    ledger.release(SCAN_ID, STAGE_OCR, job.img_group, job.page, "worker", "error")
+
+    # assert
+    assert len(claimed_by_other) == 1
+    assert reclaimed_job == job._replace(attempts=2)
+    (failed_page,) = ledger.get_pages(SCAN_ID, STAGE_OCR, PAGE_FAILED)
+    assert failed_page["page"] == job.page
+    assert failed_page["error"] == "error"
+
+
+def test_complete_page(ledger):
+    # arrange
+    (job,) = ledger.claim(SCAN_ID, STAGE_OCR, "worker")
+
+    # act
+    ledger.complete(SCAN_ID, STAGE_OCR, job.img_group, job.page, n_bytes=1024)
+    ledger.release(SCAN_ID, STAGE_OCR, job.img_group, job.page, "worker")
+
+    # assert
+    (done_page,) = ledger.get_pages(SCAN_ID, state=PAGE_DONE)
+    assert done_page["page"] == job.page
+    assert done_page["n_bytes"] == 1024
+    assert done_page["duration"] >= 0
+    assert ledger.get_counts(SCAN_ID) == {STAGE_OCR: {PAGE_PENDING: 9, PAGE_DONE: 1}}
+
+
+def test_claim_stage_end_once_the_pages_are_finished(ledger):
+    # arrange
+    jobs = ledger.claim(SCAN_ID, STAGE_OCR, "worker", limit=10)
+    for job in jobs[:-1]:
+        ledger.complete(SCAN_ID, STAGE_OCR, job.img_group, job.page)
+
+    # act
+    claimed_with_claimed_page = ledger.claim_stage_end(SCAN_ID, STAGE_OCR, "worker")
+    ledger.release(SCAN_ID, STAGE_OCR, jobs[-1].img_group, jobs[-1].page, "worker")
+    claimed_with_pending_page = ledger.claim_stage_end(SCAN_ID, STAGE_OCR, "worker")
+    ledger.claim(SCAN_ID, STAGE_OCR, "worker")
+    ledger.complete(SCAN_ID, STAGE_OCR, jobs[-1].img_group, jobs[-1].page)
+    claims = [
+        ledger.claim_stage_end(SCAN_ID, STAGE_OCR, worker)
+        for worker in ["worker", "other-worker"]
+    ]
+    ledger.add_pages(SCAN_ID, STAGE_OCR, [("I1234", "I12340011.jpg")], PAGE_DONE)
+    claimed_after_new_page = ledger.claim_stage_end(SCAN_ID, STAGE_OCR, "worker")
+
+    # assert
+    assert not claimed_with_claimed_page
+    assert not claimed_with_pending_page
+    assert claims == [True, False]
+    assert claimed_after_new_page
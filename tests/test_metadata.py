@@ -20,6 +20,7 @@ def test_metadata_to_dict():
         "ocr_engine": config.ocr_engine,
         "ocr_model_type": config.model_type,
         "ocr_lang_hint": config.lang_hint,
+        "ocr_response_profile": config.ocr_response_profile,
         "software_id": f"ocr-pipelines@v{config.version}",
         "sponsor": metadata.sponsor,
         "sponsor_consent": metadata.sponsor_consent,
@@ -41,3 +42,39 @@ def test_metadata_from_dict():
     metadata_dict = metadata.to_dict()
     metadata_from_dict = Metadata.from_dict(metadata_dict)
     assert metadata_from_dict.to_dict() == metadata_dict
+
+
+def test_metadata_update():
+    config = ImportConfig(ocr_engine="tesseract")
+    metadata = Metadata(pipeline_config=config, sponsor="BDRC")
+
+    metadata.update(image_scale_factors={"I1234": {"I12340001.png": 0.5}})
+
+    assert metadata.image_scale_factors == {"I1234": {"I12340001.png": 0.5}}
+    assert metadata.to_dict()["image_scale_factors"] == {
+        "I1234": {"I12340001.png": 0.5}
+    }
+
+
+def test_metadata_from_dict_records_response_profile():
+    config = ImportConfig(ocr_engine="tesseract", ocr_response_profile="word")
+    metadata = Metadata(pipeline_config=config, sponsor="BDRC")
+
+    metadata_dict = metadata.to_dict()
+    metadata_from_dict = Metadata.from_dict(metadata_dict)
+
+    assert metadata_dict["ocr_response_profile"] == "word"
+    assert metadata_from_dict.pipeline_config.ocr_response_profile == "word"
+    assert "ocr_response_profile" not in metadata_from_dict.kwargs
+
+
+def test_metadata_copy():
+    config = ImportConfig(ocr_engine="tesseract")
+    metadata = Metadata(pipeline_config=config, sponsor="BDRC", source="bdrc")
+
+    metadata_copy = metadata.copy()
+    metadata_copy.update(image_scale_factors={"I1234": {}})
+
+    assert metadata_copy.to_dict()["source"] == "bdrc"
+    assert metadata_copy.timestamp == metadata.timestamp
+    assert "image_scale_factors" not in metadata.to_dict()
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+from PIL import Image as PillowImage
+from PIL import ImageDraw
+
+pytest.importorskip("numpy")
+
+from ocr_pipelines.page_filter import (  # noqa: E402
+    PAGE_BLANK,
+    PAGE_DUPLICATE,
+    PageClass,
+    PageFilter,
+)
+
+
+def get_page_bytes(lines=(), speck=False, img_format="PNG", mode="L"):
+    img = PillowImage.new("L", (1200, 400), color=235)
+    draw = ImageDraw.Draw(img)
+    for y, length in lines:
+        # thin strokes, washed out by an averaging downsample
+        for x in range(50, 50 + length, 12):
+            draw.line([(x, y), (x + 6, y + 20)], fill=20, width=2)
+    if speck:
+        draw.point([(600, 200), (601, 200)], fill=0)
+    fp = io.BytesIO()
+    img.convert(mode, dither=PillowImage.NONE).save(fp, format=img_format)
+    return fp.getvalue()
+
+
+@pytest.mark.parametrize("img_format,mode", [("PNG", "L"), ("JPEG", "L"), ("PNG", "1")])
+def test_classify_blank_page(img_format, mode):
+    # arrange
+    page_filter = PageFilter()
+
+    # act
+    page_class = page_filter.classify(
+        "I1234",
+        "I12340001.png",
+        get_page_bytes(speck=True, img_format=img_format, mode=mode),
+    )
+
+    # assert
+    assert page_class == PageClass(PAGE_BLANK)
+
+
+def test_classify_page_with_text():
+    # arrange
+    page_filter = PageFilter()
+
+    # act
+    page_class = page_filter.classify(
+        "I1234", "I12340001.png", get_page_bytes(lines=[(100, 300)])
+    )
+
+    # assert
+    assert page_class is None
+
+
+def test_classify_duplicate_pages():
+    # arrange
+    page_filter = PageFilter()
+    cover = get_page_bytes(lines=[(100, 1000), (200, 1000)])
+    cover_jpeg = get_page_bytes(lines=[(100, 1000), (200, 1000)], img_format="JPEG")
+    other_page = get_page_bytes(lines=[(100, 1000), (250, 400)])
+
+    # act
+    page_classes = [
+        page_filter.classify("I1234", "I12340001.png", cover),
+        page_filter.classify("I1234", "I12340002.png", other_page),
+        page_filter.classify("I1234", "I12340003.jpg", cover_jpeg),
+        page_filter.classify("I1235", "I12350001.png", cover),
+    ]
+
+    # assert
+    assert page_classes == [
+        None,
+        None,
+        PageClass(PAGE_DUPLICATE, "I12340001.png"),
+        None,
+    ]
+
+
+def test_classify_keeps_pages_it_cannot_load():
+    # arrange
+    page_filter = PageFilter()
+
+    # act
+    page_class = page_filter.classify("I1234", "I12340001.png", b"fake-image")
+
+    # assert
+    assert page_class is None
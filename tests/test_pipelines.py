@@ -1,7 +1,20 @@
+from unittest import mock
+
 import pytest
 
+from ocr_pipelines.batch import estimate_page_count
 from ocr_pipelines.config import ImportConfig
-from ocr_pipelines.pipelines import import_pipeline
+from ocr_pipelines.engines.hedging import HedgingPolicy
+from ocr_pipelines.ledger import STAGE_OCR, JobLedger
+from ocr_pipelines.metadata import Metadata
+from ocr_pipelines.pipelines import (
+    LEFT_TO_OTHER_WORKERS,
+    PipelineClients,
+    batch_import_pipeline,
+    get_pipeline_clients,
+    get_scan_config,
+    import_pipeline,
+)
 
 
 def get_credentials():
@@ -23,3 +36,157 @@ def test_import_pipeline():
     bdrc_scan_id = "W1KG12429"
 
     import_pipeline(bdrc_scan_id, config)
+
+
+@mock.patch("ocr_pipelines.pipelines.OCRParser")
+@mock.patch("ocr_pipelines.pipelines.BdrcS3Uploader")
+@mock.patch("ocr_pipelines.pipelines.BDRCImageDownloader")
+def test_import_pipeline_with_job_ledger_publishes_once(
+    mock_downloader, mock_uploader, mock_ocr_parser, tmp_path
+):
+    # arrange
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    for i in range(1, 5):
+        (img_group_dir / f"I1234{i:04}.jpg").write_bytes(b"fake-image")
+    mock_downloader.return_value.download.return_value = img_group_dir.parent
+    pecha = mock_ocr_parser.return_value.parse.return_value
+    pecha.pecha_id = "P000001"
+    config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        images_path=tmp_path / "images",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        job_ledger_path=tmp_path / "jobs.sqlite",
+    )
+    metadata = Metadata(pipeline_config=config, sponsor="BDRC")
+    ocr_engine = mock.MagicMock()
+    ocr_engine.ocr_json.return_value = "{}"
+    clients = PipelineClients(ocr_engine=ocr_engine, s3_client=mock.MagicMock())
+    ledger = JobLedger(config.job_ledger_path)  # type: ignore
+    ledger.add_pages(
+        "W1KG12345", STAGE_OCR, [("I1234", f"I1234{i:04}.jpg") for i in range(1, 5)]
+    )
+    # a page ocred by the other worker
+    (job,) = ledger.claim("W1KG12345", STAGE_OCR, "other-worker")
+
+    def import_scan():
+        return import_pipeline("W1KG12345", config, metadata.copy(), clients=clients)
+
+    # act
+    first_result = import_scan()
+    ledger.complete("W1KG12345", STAGE_OCR, job.img_group, job.page)
+    last_result = import_scan()
+
+    # assert
+    assert first_result["status"] == LEFT_TO_OTHER_WORKERS
+    assert last_result == {
+        "pecha_id": "P000001",
+        "pecha_url": "https://github.com/OpenPecha-Data/P000001",
+    }
+    assert ocr_engine.ocr_json.call_count == 3
+    mock_uploader.return_value.upload.assert_called_once()
+    mock_ocr_parser.return_value.parse.assert_called_once()
+    pecha.publish.assert_called_once()
+
+
+@mock.patch("ocr_pipelines.pipelines.estimate_page_count")
+@mock.patch("ocr_pipelines.pipelines.import_pipeline")
+def test_batch_import_pipeline(mock_import_pipeline, mock_estimate_page_count):
+    # arrange
+    config = ImportConfig(ocr_engine="GoogleVisionEngine", conversion_processes=8)
+    metadata = Metadata(pipeline_config=config, sponsor="BDRC")
+    page_counts = {"W1": 10, "W2": 300, "W3": 50, "W4": 20}
+    mock_estimate_page_count.side_effect = page_counts.get
+    imported = []
+
+    def import_scan(bdrc_scan_id, config, metadata, batch_id_cache, clients):
+        imported.append(bdrc_scan_id)
+        metadata.update(image_scale_factors={bdrc_scan_id: {}})
+        if bdrc_scan_id == "W3":
+            raise ValueError("scan not found")
+        return {"pecha_id": f"P-{bdrc_scan_id}", "pecha_url": "url"}
+
+    mock_import_pipeline.side_effect = import_scan
+    hedging = HedgingPolicy()
+    clients = PipelineClients(
+        ocr_engine=mock.MagicMock(),
+        s3_client=mock.MagicMock(),
+        hedging_policies=[hedging],
+    )
+
+    # act
+    report = batch_import_pipeline(
+        ["W1", "W2", "W3", "W4", "W1"], config, metadata, max_workers=1, clients=clients
+    )
+
+    # assert
+    # the largest and the smallest scans alternate
+    assert imported == ["W2", "W1", "W3", "W4"]
+    assert report.summary() == "imported 3/4 scans, 1 failed"
+    assert report.results["W2"].pecha == {"pecha_id": "P-W2", "pecha_url": "url"}
+    assert report.results["W2"].estimated_pages == 300
+    assert report.failed["W3"].error == "ValueError: scan not found"
+    assert report.hedging_stats == [hedging.get_stats()]
+    assert "image_scale_factors" not in metadata.kwargs
+    for call in mock_import_pipeline.call_args_list:
+        assert call.kwargs["clients"] is clients
+        assert call.args[1].conversion_processes == 8
+        assert call.args[2] is not metadata
+    batch_id_caches = [
+        call.kwargs["batch_id_cache"] for call in mock_import_pipeline.call_args_list
+    ]
+    assert all(cache is batch_id_caches[0] for cache in batch_id_caches)
+
+
+@mock.patch("ocr_pipelines.pipelines.boto3")
+@mock.patch("ocr_pipelines.executor.GoogleVisionEngine", autospec=True)
+def test_pipeline_clients_keep_the_hedging_policies(mock_google_vision_engine, _):
+    # arrange
+    config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        credentials=[{"key": 1}, {"key": 2}],
+        ocr_hedge_percentile=0.95,
+    )
+
+    # act
+    with mock.patch(
+        "ocr_pipelines.executor.ocr_engine_class_register",
+        {"GoogleVisionEngine": mock_google_vision_engine},
+    ):
+        clients = get_pipeline_clients(config)
+
+    # assert
+    hedging_policies = [
+        call.kwargs["hedging"] for call in mock_google_vision_engine.call_args_list
+    ]
+    assert list(clients.hedging_policies) == hedging_policies
+    assert len(hedging_policies) == 2
+
+
+@mock.patch("ocr_pipelines.pipelines.os.cpu_count", return_value=16)
+def test_scan_config_divides_the_conversion_processes(mock_cpu_count):
+    # arrange
+    config = ImportConfig(ocr_engine="GoogleVisionEngine", conversion_processes=None)
+
+    # act
+    scan_config = get_scan_config(config, max_workers=4)
+
+    # assert
+    assert scan_config.conversion_processes == 4
+    assert config.conversion_processes is None
+    assert get_scan_config(config, max_workers=1) is config
+    default_config = ImportConfig(ocr_engine="GoogleVisionEngine")
+    assert get_scan_config(default_config, max_workers=4).conversion_processes == 0
+
+
+@mock.patch("ocr_pipelines.batch.buda_api.get_buda_scan_info")
+def test_estimate_page_count(mock_get_buda_scan_info):
+    # arrange
+    mock_get_buda_scan_info.return_value = {
+        "image_groups": {"I1": {"total_pages": 120}, "I2": {"total_pages": 80}}
+    }
+
+    # act and assert
+    assert estimate_page_count("W1") == 200
+    mock_get_buda_scan_info.return_value = None
+    assert estimate_page_count("W1") == 0
@@ -0,0 +1,124 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from google.api_core import exceptions as gcloud_exceptions
+
+from ocr_pipelines.engines.pool import EnginePool
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+from ocr_pipelines.exceptions import GoogleVisionCredentialsError
+
+
+def get_engine(name, requests_per_minute=None):
+    engine = mock.MagicMock()
+    engine.ocr_json.return_value = name
+    engine.rate_limiter = RateLimiter(requests_per_minute=requests_per_minute)
+    return engine
+
+
+def test_engine_pool_spreads_requests():
+    # arrange
+    pool = EnginePool([get_engine("a"), get_engine("b"), get_engine("c")])
+
+    # act
+    results = [pool.ocr_json(b"image") for _ in range(3)]
+
+    # assert
+    assert sorted(results) == ["a", "b", "c"]
+
+
+def test_engine_pool_prefers_engine_with_quota_left():
+    # arrange
+    exhausted_engine = get_engine("exhausted", requests_per_minute=60)
+    exhausted_engine.rate_limiter.reserve(cost=10)
+    pool = EnginePool([exhausted_engine, get_engine("free", requests_per_minute=60)])
+
+    # act
+    results = [pool.ocr_json(b"image") for _ in range(3)]
+
+    # assert
+    assert results[0] == "free"
+
+
+def test_engine_pool_drops_throttled_engine():
+    # arrange
+    throttled_engine = get_engine("throttled")
+    throttled_engine.ocr_json.side_effect = gcloud_exceptions.ResourceExhausted(
+        "quota exceeded"
+    )
+    pool = EnginePool([throttled_engine, get_engine("b")], cooldown=60)
+
+    # act
+    results = [pool.ocr_json(b"image") for _ in range(4)]
+
+    # assert
+    assert results == ["b"] * 4
+    assert throttled_engine.ocr_json.call_count == 1
+
+
+def test_engine_pool_waits_for_cooldown():
+    # arrange
+    engine = get_engine("a")
+    engine.ocr_json.side_effect = [gcloud_exceptions.TooManyRequests("slow down"), "a"]
+    pool = EnginePool([engine], cooldown=0.01)
+
+    # act
+    result = pool.ocr_json(b"image")
+
+    # assert
+    assert result == "a"
+    assert engine.ocr_json.call_count == 2
+
+
+def test_engine_pool_gives_up_after_max_retries():
+    # arrange
+    engine = get_engine("a")
+    engine.ocr_json.side_effect = gcloud_exceptions.ResourceExhausted("quota")
+    pool = EnginePool([engine], cooldown=0, max_retries=2)
+
+    # act and assert
+    with pytest.raises(gcloud_exceptions.ResourceExhausted):
+        pool.ocr_json(b"image")
+    assert engine.ocr_json.call_count == 3
+
+
+def test_engine_pool_raises_when_all_credentials_are_denied():
+    # arrange
+    engines = [get_engine("a"), get_engine("b")]
+    for engine in engines:
+        engine.ocr_json.side_effect = GoogleVisionCredentialsError("denied")
+    pool = EnginePool(engines, cooldown=0)
+
+    # act and assert
+    with pytest.raises(GoogleVisionCredentialsError):
+        pool.ocr_json(b"image")
+    assert [engine.ocr_json.call_count for engine in engines] == [1, 1]
+
+
+def test_engine_pool_does_not_retry_other_errors():
+    # arrange
+    engine = get_engine("a")
+    engine.ocr_json.side_effect = ValueError("bad image")
+    pool = EnginePool([engine, get_engine("b")])
+
+    # act and assert
+    with pytest.raises(ValueError):
+        pool.ocr_json(b"image")
+    assert pool.engines[0].available_at == 0
+
+
+def test_engine_pool_aocr_json():
+    # arrange
+    throttled_engine = get_engine("throttled")
+    throttled_engine.aocr_json = mock.AsyncMock(
+        side_effect=gcloud_exceptions.ResourceExhausted("quota exceeded")
+    )
+    engine = get_engine("b")
+    engine.aocr_json = mock.AsyncMock(return_value="b")
+    pool = EnginePool([throttled_engine, engine])
+
+    # act
+    result = asyncio.run(pool.aocr_json(b"image"))
+
+    # assert
+    assert result == "b"
@@ -0,0 +1,66 @@
+import io
+
+import pytest
+from PIL import Image as PillowImage
+
+from ocr_pipelines.preprocess import ImagePreprocessor
+
+
+def get_img_bytes(size, mode="RGB", img_format="PNG", noise=False):
+    if noise:
+        img = PillowImage.frombytes(
+            mode, size, bytes(range(256)) * (size[0] * size[1] * 3 // 256 + 1)
+        )
+    else:
+        img = PillowImage.new(mode, size, color=0)
+    fp = io.BytesIO()
+    img.save(fp, format=img_format)
+    return fp.getvalue()
+
+
+def test_preprocess_keeps_images_within_limits():
+    # arrange
+    img_bytes = get_img_bytes((100, 50))
+    preprocessor = ImagePreprocessor(max_pixels=100 * 50, max_bytes=len(img_bytes))
+
+    # act
+    preprocessed, scale = preprocessor.preprocess(img_bytes)
+
+    # assert
+    assert preprocessed is img_bytes
+    assert scale == 1.0
+
+
+@pytest.mark.parametrize(
+    "mode,img_format", [("RGB", "PNG"), ("RGB", "JPEG"), ("1", "PNG")]
+)
+def test_preprocess_downscales_to_max_pixels(mode, img_format):
+    # arrange
+    img_bytes = get_img_bytes((400, 200), mode=mode, img_format=img_format)
+    preprocessor = ImagePreprocessor(max_pixels=200 * 100)
+
+    # act
+    preprocessed, scale = preprocessor.preprocess(img_bytes)
+
+    # assert
+    assert scale == pytest.approx(0.5)
+    with PillowImage.open(io.BytesIO(preprocessed)) as img:
+        assert img.size == (200, 100)
+        assert img.format == img_format
+        assert img.mode == mode
+
+
+def test_preprocess_downscales_to_max_bytes():
+    # arrange
+    img_bytes = get_img_bytes((400, 400), noise=True)
+    max_bytes = len(img_bytes) // 4
+    preprocessor = ImagePreprocessor(max_bytes=max_bytes)
+
+    # act
+    preprocessed, scale = preprocessor.preprocess(img_bytes)
+
+    # assert
+    assert len(preprocessed) <= max_bytes
+    assert scale < 0.5
+    with PillowImage.open(io.BytesIO(preprocessed)) as img:
+        assert img.width == round(400 * scale)
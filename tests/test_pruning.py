@@ -0,0 +1,176 @@
+import json
+from unittest import mock
+
+import pytest
+from google.cloud.vision import AnnotateImageResponse
+from openpecha.formatters.ocr.google_vision import GoogleVisionFormatter
+
+from ocr_pipelines.engines.pruning import (
+    RESPONSE_PROFILE_FULL,
+    RESPONSE_PROFILE_TEXT,
+    RESPONSE_PROFILE_WORD,
+    ResponsePruningEngine,
+    prune_response,
+)
+
+
+def get_box(x, y, width, height):
+    return {
+        "vertices": [
+            {"x": x, "y": y},
+            {"x": x + width, "y": y},
+            {"x": x + width, "y": y + height},
+            {"x": x, "y": y + height},
+        ]
+    }
+
+
+def get_response() -> dict:
+    """Returns a google vision response of two words, serialized like the
+    responses of the engine.
+    """
+    words = []
+    text_annotations = [
+        {
+            "locale": "bo",
+            "description": "བཀྲ་ ཤིས\n",
+            "boundingPoly": get_box(0, 0, 90, 20),
+        }
+    ]
+    for word_idx, (word_text, break_type) in enumerate([("བཀྲ་", 1), ("ཤིས", 5)]):
+        x = word_idx * 50
+        symbols = []
+        for symbol_idx, char in enumerate(word_text):
+            symbol = {
+                "text": char,
+                "boundingBox": get_box(x + 10 * symbol_idx, 0, 10, 20),
+                "confidence": 0.9,
+                "property": {"detectedLanguages": [{"languageCode": "bo"}]},
+            }
+            if symbol_idx == len(word_text) - 1:
+                symbol["property"]["detectedBreak"] = {"type": break_type}
+            symbols.append(symbol)
+        box = get_box(x, 0, 10 * len(word_text), 20)
+        words.append({"boundingBox": box, "symbols": symbols, "confidence": 0.8})
+        text_annotations.append({"description": word_text, "boundingPoly": box})
+    response = {
+        "textAnnotations": text_annotations,
+        "fullTextAnnotation": {
+            "pages": [
+                {
+                    "width": 100,
+                    "height": 20,
+                    "confidence": 0.9,
+                    "blocks": [
+                        {
+                            "boundingBox": get_box(0, 0, 90, 20),
+                            "blockType": "TEXT",
+                            "confidence": 0.9,
+                            "paragraphs": [
+                                {
+                                    "boundingBox": get_box(0, 0, 90, 20),
+                                    "confidence": 0.9,
+                                    "words": words,
+                                }
+                            ],
+                        }
+                    ],
+                }
+            ],
+            "text": "བཀྲ་ ཤིས\n",
+        },
+    }
+    return json.loads(
+        AnnotateImageResponse.to_json(
+            AnnotateImageResponse.from_json(json.dumps(response))
+        )
+    )
+
+
+@pytest.mark.parametrize("profile", [RESPONSE_PROFILE_WORD, RESPONSE_PROFILE_TEXT])
+def test_pruned_response_is_parsed_like_full_response(profile):
+    # arrange
+    response = get_response()
+    formatter = GoogleVisionFormatter()
+
+    # act
+    pruned = prune_response(response, profile)
+
+    # assert
+    assert len(json.dumps(pruned)) < len(json.dumps(response))
+    assert pruned["textAnnotations"][0]["description"] == "བཀྲ་ ཤིས\n"
+    bboxes, avg_width = formatter.get_char_base_bboxes_and_avg_width(response)
+    pruned_bboxes, pruned_avg_width = formatter.get_char_base_bboxes_and_avg_width(
+        pruned
+    )
+    assert pruned_avg_width == avg_width
+    assert [[vars(bbox) for bbox in line] for line in pruned_bboxes] == [
+        [vars(bbox) for bbox in line] for line in bboxes
+    ]
+
+
+def test_prune_response_profiles():
+    # arrange
+    response = get_response()
+
+    # act
+    full = prune_response(response, RESPONSE_PROFILE_FULL)
+    word = prune_response(response, RESPONSE_PROFILE_WORD)
+    text = prune_response(response, RESPONSE_PROFILE_TEXT)
+
+    # assert
+    assert full is response
+    assert len(word["textAnnotations"]) == 1
+    word_block = word["fullTextAnnotation"]["pages"][0]["blocks"][0]
+    text_block = text["fullTextAnnotation"]["pages"][0]["blocks"][0]
+    assert "boundingBox" in word_block
+    assert "boundingBox" not in text_block
+    word_symbols = word_block["paragraphs"][0]["words"][0]["symbols"]
+    text_symbols = text_block["paragraphs"][0]["words"][0]["symbols"]
+    assert word_symbols == text_symbols
+    assert all("confidence" not in symbol for symbol in word_symbols)
+    # the box of the subjoined letter isn't measured by the parser, the others
+    # keep their box as returned by google vision
+    symbols = response["fullTextAnnotation"]["pages"][0]["blocks"][0]["paragraphs"][0][
+        "words"
+    ][0]["symbols"]
+    assert [symbol.get("boundingBox") for symbol in text_symbols] == [
+        {"vertices": symbols[0]["boundingBox"]["vertices"]},
+        {"vertices": symbols[1]["boundingBox"]["vertices"]},
+        None,
+        None,
+    ]
+    assert text_symbols[-1]["property"] == {
+        "detectedBreak": {"type": 1, "isPrefix": False}
+    }
+
+
+def test_prune_response_of_page_without_text():
+    # act
+    pruned = prune_response({"textAnnotations": []}, RESPONSE_PROFILE_TEXT)
+
+    # assert
+    assert pruned == {}
+
+
+def test_prune_response_with_unknown_profile():
+    # act and assert
+    with pytest.raises(ValueError):
+        prune_response({}, "symbols")
+
+
+def test_response_pruning_engine_ocr_batch_json():
+    # arrange
+    engine = mock.MagicMock()
+    error = Exception("failed")
+    engine.ocr_batch.return_value = [get_response(), error]
+    pruning_engine = ResponsePruningEngine(engine, RESPONSE_PROFILE_TEXT)
+
+    # act
+    results = pruning_engine.ocr_batch_json([b"image", b"image"])
+
+    # assert
+    assert json.loads(results[0]) == prune_response(
+        get_response(), RESPONSE_PROFILE_TEXT
+    )
+    assert results[1] is error
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from ocr_pipelines.engines.rate_limiter import RateLimiter
+
+
+class QuotaError(Exception):
+    pass
+
+
+def test_rate_limiter_token_bucket():
+    # arrange
+    rate_limiter = RateLimiter(requests_per_minute=60)
+
+    # action
+    waits = [rate_limiter.reserve() for _ in range(3)]
+
+    # assert
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(1, abs=0.05)
+    assert waits[2] == pytest.approx(2, abs=0.05)
+
+
+def test_rate_limiter_try_reserve_only_takes_available_tokens():
+    # arrange
+    rate_limiter = RateLimiter(requests_per_minute=60)
+
+    # action
+    reserved = [rate_limiter.try_reserve() for _ in range(2)]
+
+    # assert
+    assert reserved == [True, False]
+    assert rate_limiter.get_wait() == pytest.approx(1, abs=0.05)
+
+
+def test_rate_limiter_without_quota_never_waits():
+    # arrange
+    rate_limiter = RateLimiter()
+
+    # action and assert
+    assert all(rate_limiter.reserve(cost=16) == 0 for _ in range(100))
+
+
+def test_rate_limiter_caps_concurrency():
+    # arrange
+    max_concurrency = 3
+    rate_limiter = RateLimiter(max_concurrency=max_concurrency)
+    n_in_flight = 0
+    max_in_flight_seen = 0
+    lock = threading.Lock()
+
+    def request():
+        nonlocal n_in_flight, max_in_flight_seen
+        with lock:
+            n_in_flight += 1
+            max_in_flight_seen = max(max_in_flight_seen, n_in_flight)
+        time.sleep(0.01)
+        with lock:
+            n_in_flight -= 1
+
+    # action
+    threads = [
+        threading.Thread(target=rate_limiter.call, args=(request,)) for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    assert max_in_flight_seen <= max_concurrency
+
+
+def test_rate_limiter_adapts_concurrency_limit():
+    # arrange
+    rate_limiter = RateLimiter(max_concurrency=8, backoff_base=0)
+    rate_limiter._in_flight = 3
+
+    # action and assert
+    rate_limiter.release(throttled=True)
+    assert rate_limiter.concurrency_limit == 4
+    rate_limiter.release(failed=True)
+    assert rate_limiter.concurrency_limit == 4
+    rate_limiter.release()
+    assert rate_limiter.concurrency_limit == 4.25
+    assert rate_limiter.n_throttled == 1
+
+
+def test_rate_limiter_retries_quota_errors():
+    # arrange
+    rate_limiter = RateLimiter(backoff_base=0, retry_on=(QuotaError,))
+    request = mock.MagicMock(side_effect=[QuotaError(), QuotaError(), "response"])
+
+    # action
+    response = rate_limiter.call(request, "fake-request")
+
+    # assert
+    assert response == "response"
+    assert request.call_count == 3
+    request.assert_called_with("fake-request")
+    assert rate_limiter._in_flight == 0
+
+
+def test_rate_limiter_gives_up_after_max_retries():
+    # arrange
+    rate_limiter = RateLimiter(max_retries=2, backoff_base=0, retry_on=(QuotaError,))
+    request = mock.MagicMock(side_effect=QuotaError())
+
+    # action and assert
+    with pytest.raises(QuotaError):
+        rate_limiter.call(request)
+    assert request.call_count == 3
+    assert rate_limiter._in_flight == 0
+
+
+def test_rate_limiter_does_not_retry_other_errors():
+    # arrange
+    rate_limiter = RateLimiter(backoff_base=0, retry_on=(QuotaError,))
+    request = mock.MagicMock(side_effect=ValueError())
+
+    # action and assert
+    with pytest.raises(ValueError):
+        rate_limiter.call(request)
+    assert request.call_count == 1
+    assert rate_limiter._in_flight == 0
+
+
+def test_rate_limiter_acall_retries_quota_errors():
+    # arrange
+    rate_limiter = RateLimiter(backoff_base=0, retry_on=(QuotaError,))
+    request = mock.AsyncMock(side_effect=[QuotaError(), "response"])
+
+    # action
+    response = asyncio.run(rate_limiter.acall(request, cost=2))
+
+    # assert
+    assert response == "response"
+    assert request.await_count == 2
+    assert rate_limiter.n_throttled == 1
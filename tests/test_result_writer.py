@@ -0,0 +1,84 @@
+import gzip
+import json
+import threading
+
+import pytest
+
+from ocr_pipelines.result_writer import (
+    ResultWriter,
+    get_tmp_fn,
+    is_tmp_fn,
+    write_gzip_json,
+)
+
+
+def test_write_gzip_json(tmp_path, monkeypatch):
+    # arrange
+    monkeypatch.setattr("ocr_pipelines.result_writer.WRITE_CHUNK_SIZE", 7)
+    result_json = json.dumps({"text": "བཀྲ་ཤིས་བདེ་ལེགས།", "pages": list(range(100))})
+    result_fn = tmp_path / "I12340001.json.gz"
+
+    # act
+    write_gzip_json(result_json, result_fn, compresslevel=1)
+
+    # assert
+    assert json.loads(gzip.decompress(result_fn.read_bytes())) == json.loads(
+        result_json
+    )
+    assert not get_tmp_fn(result_fn).exists()
+    # the gzip header has no original file name
+    assert result_fn.read_bytes()[3] & gzip.FNAME == 0
+
+
+def test_result_writer_writes_in_background(tmp_path):
+    # arrange
+    result_writer = ResultWriter(compresslevel=1, max_pending=2)
+    written = []
+    writer_threads = set()
+
+    def on_written(result_fn):
+        written.append(result_fn)
+        writer_threads.add(threading.get_ident())
+
+    result_fns = [tmp_path / f"I1234000{i}.json.gz" for i in range(5)]
+
+    # act
+    for i, result_fn in enumerate(result_fns):
+        result_writer.submit(json.dumps({"page": i}), result_fn, on_written)
+    result_writer.wait(result_fns[0])
+    assert result_fns[0].is_file()
+    result_writer.join()
+
+    # assert
+    assert written == result_fns
+    assert threading.get_ident() not in writer_threads
+    for i, result_fn in enumerate(result_fns):
+        assert json.loads(gzip.decompress(result_fn.read_bytes())) == {"page": i}
+
+
+def test_result_writer_reports_write_errors(tmp_path):
+    # arrange
+    result_writer = ResultWriter()
+    missing_dir_result_fn = tmp_path / "missing-dir" / "I12340001.json.gz"
+    result_fn = tmp_path / "I12340002.json.gz"
+
+    # act
+    result_writer.submit("{}", missing_dir_result_fn)
+    result_writer.submit("{}", result_fn)
+
+    # assert
+    with pytest.raises(FileNotFoundError):
+        result_writer.wait(missing_dir_result_fn)
+    with pytest.raises(FileNotFoundError):
+        result_writer.join()
+    assert result_fn.is_file()
+    assert not missing_dir_result_fn.exists()
+
+
+def test_is_tmp_fn(tmp_path):
+    # arrange
+    result_fn = tmp_path / "I12340001.json.gz"
+
+    # act and assert
+    assert is_tmp_fn(get_tmp_fn(result_fn))
+    assert not is_tmp_fn(result_fn)
@@ -0,0 +1,208 @@
+import gzip
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from ocr_pipelines.config import ImportConfig
+from ocr_pipelines.exceptions import GoogleVisionCredentialsError, PipelineError
+from ocr_pipelines.executor import OCRExecutor
+from ocr_pipelines.streaming import StreamingImportRunner
+
+
+@pytest.fixture
+def scan_images(tmp_path):
+    img_group_dir = tmp_path / "images" / "W1KG12345" / "I1234"
+    img_group_dir.mkdir(parents=True)
+    img_paths = []
+    for i in range(1, 6):
+        img_path = img_group_dir / f"I12340{i}.jpg"
+        img_path.write_bytes(b"fake-image-content")
+        img_paths.append(img_path)
+    return img_paths
+
+
+def get_runner(tmp_path, img_paths, max_pages_in_flight=32, **config_kwargs):
+    config = ImportConfig(
+        ocr_engine="GoogleVisionEngine",
+        images_path=tmp_path / "images",
+        ocr_outputs_path=tmp_path / "ocr_outputs",
+        **config_kwargs,
+    )
+    downloader = mock.MagicMock()
+    downloader.bdrc_scan_id = "W1KG12345"
+    downloader.iter_download.side_effect = lambda page_slots: (
+        ("I1234", img_path) for img_path in page_slots.iter_with_slots(img_paths)
+    )
+    # images saved on disk
+    downloader.pop_img_bytes.return_value = None
+    ocr_executor = OCRExecutor(
+        config=config, image_download_dir=config.images_path / "W1KG12345"
+    )
+    ocr_executor.get_ocr_engine = mock.MagicMock()  # type: ignore
+    ocr_executor.get_ocr_engine.return_value.ocr_json.return_value = json.dumps(
+        {"text": "fake"}
+    )
+    uploader = mock.MagicMock()
+    return StreamingImportRunner(
+        downloader=downloader,
+        ocr_executor=ocr_executor,
+        uploader=uploader,
+        max_pages_in_flight=max_pages_in_flight,
+    )
+
+
+def test_streaming_runner(tmp_path, scan_images):
+    # arrange
+    runner = get_runner(tmp_path, scan_images)
+
+    # act
+    ocr_output_path = runner.run(metadata={"fake": "metadata"})
+
+    # assert
+    assert ocr_output_path == tmp_path / "ocr_outputs" / "W1KG12345"
+    runner.uploader.upload_metadata.assert_called_once_with({"fake": "metadata"})
+    uploaded_images = [
+        call.args[0] for call in runner.uploader.upload_ocr_image.call_args_list
+    ]
+    assert uploaded_images == scan_images
+    uploaded_outputs = [
+        call.args[0] for call in runner.uploader.upload_ocr_output.call_args_list
+    ]
+    assert uploaded_outputs == [
+        ocr_output_path / "W1KG12345-1234" / f"{img_path.stem}.json.gz"
+        for img_path in scan_images
+    ]
+    for ocr_output_fn in uploaded_outputs:
+        assert json.loads(gzip.decompress(ocr_output_fn.read_bytes())) == {
+            "text": "fake"
+        }
+
+
+def test_streaming_runner_with_in_memory_images(tmp_path, scan_images):
+    # arrange
+    runner = get_runner(tmp_path, scan_images)
+    img_bytes = {
+        img_path: f"{img_path.stem}-bytes".encode() for img_path in scan_images
+    }
+    runner.downloader.pop_img_bytes.side_effect = img_bytes.pop
+
+    # act
+    runner.run(metadata={})
+
+    # assert
+    ocr_engine = runner.ocr_executor.get_ocr_engine.return_value  # type: ignore
+    ocred_images = [call.args[0] for call in ocr_engine.ocr_json.call_args_list]
+    assert sorted(ocred_images) == [f"{p.stem}-bytes".encode() for p in scan_images]
+    runner.uploader.upload_ocr_image.assert_not_called()
+    uploaded_images = [
+        call.args for call in runner.uploader.upload_ocr_image_bytes.call_args_list
+    ]
+    assert uploaded_images == [
+        (img_path, f"{img_path.stem}-bytes".encode()) for img_path in scan_images
+    ]
+
+
+def test_streaming_runner_caps_pages_in_flight(tmp_path, scan_images):
+    # arrange
+    max_pages_in_flight = 2
+    n_downloaded = 0
+    n_uploaded = 0
+    max_in_flight_seen = 0
+
+    def iter_download(page_slots):
+        nonlocal n_downloaded, max_in_flight_seen
+        for img_path in page_slots.iter_with_slots(scan_images):
+            n_downloaded += 1
+            max_in_flight_seen = max(max_in_flight_seen, n_downloaded - n_uploaded)
+            yield "I1234", img_path
+
+    def slow_upload(img_path):
+        nonlocal n_uploaded
+        time.sleep(0.05)
+        n_uploaded += 1
+
+    runner = get_runner(tmp_path, scan_images, max_pages_in_flight)
+    runner.downloader.iter_download.side_effect = iter_download
+    runner.uploader.upload_ocr_image.side_effect = slow_upload
+
+    # act
+    runner.run(metadata={})
+
+    # assert
+    assert n_uploaded == len(scan_images)
+    assert max_in_flight_seen <= max_pages_in_flight
+
+
+def test_streaming_runner_stops_on_stage_failure(tmp_path, scan_images):
+    # arrange
+    runner = get_runner(tmp_path, scan_images)
+    ocr_engine = runner.ocr_executor.get_ocr_engine.return_value  # type: ignore
+    ocr_engine.ocr_json.side_effect = GoogleVisionCredentialsError(
+        "invalid credentials"
+    )
+
+    result_writer = runner.ocr_executor.result_writer
+    result_writer.close = mock.MagicMock(wraps=result_writer.close)  # type: ignore
+
+    # act and assert
+    with pytest.raises(PipelineError):
+        runner.run(metadata={})
+    assert runner.uploader.upload_ocr_output.call_count == 0
+    result_writer.close.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "config_kwargs",
+    [
+        {"ocr_batch_size": 16},
+        {"ocr_async": True},
+        {"ocr_tiles_per_request": 4},
+        {"job_ledger_path": "jobs.sqlite"},
+        {"skip_blank_pages": True},
+        {"skip_duplicate_pages": True},
+    ],
+)
+def test_streaming_runner_rejects_non_streaming_options(
+    tmp_path, scan_images, config_kwargs
+):
+    # arrange
+    if "job_ledger_path" in config_kwargs:
+        # the ledger is opened before the options are checked
+        config_kwargs = {"job_ledger_path": tmp_path / config_kwargs["job_ledger_path"]}
+
+    # act and assert
+    with pytest.raises(ValueError, match=next(iter(config_kwargs))):
+        get_runner(tmp_path, scan_images, **config_kwargs)
+
+
+def test_streaming_runner_skips_existing_ocr_outputs(tmp_path, scan_images):
+    # arrange
+    runner = get_runner(tmp_path, scan_images)
+    existing_result_fn = runner.ocr_executor.get_result_fn(scan_images[0])
+    existing_result_fn.parent.mkdir(parents=True)
+    existing_result_fn.write_bytes(b"existing")
+
+    # act
+    runner.run(metadata={})
+
+    # assert
+    ocr_engine = runner.ocr_executor.get_ocr_engine.return_value  # type: ignore
+    assert ocr_engine.ocr_json.call_count == len(scan_images) - 1
+    assert existing_result_fn.read_bytes() == b"existing"
+    assert runner.uploader.upload_ocr_output.call_count == len(scan_images)
+
+
+def test_streaming_runner_with_zip_output_format(tmp_path, scan_images):
+    # arrange
+    runner = get_runner(tmp_path, scan_images, ocr_output_format="zip")
+
+    # act
+    ocr_output_path = runner.run(metadata={})
+
+    # assert
+    assert runner.uploader.upload_ocr_output.call_count == 0
+    assert runner.uploader.upload_ocr_image.call_count == len(scan_images)
+    runner.uploader.upload_ocr_outputs.assert_called_once_with(ocr_output_path)
+    assert [fn.name for fn in ocr_output_path.iterdir()] == ["W1KG12345-1234.zip"]
@@ -0,0 +1,236 @@
+import io
+import json
+from unittest import mock
+
+from PIL import Image as PillowImage
+
+from ocr_pipelines.engines.tiling import (
+    MIN_TILE_GAP,
+    Tile,
+    TilingEngine,
+    compose_mosaic,
+    get_mosaic_layout,
+    split_response,
+)
+
+
+def get_img_bytes(size, mode="L", img_format="PNG"):
+    fp = io.BytesIO()
+    PillowImage.new(mode, size, color=0).save(fp, format=img_format)
+    return fp.getvalue()
+
+
+def get_box(x, y, width, height):
+    return {
+        "vertices": [
+            {"x": x, "y": y},
+            {"x": x + width, "y": y},
+            {"x": x + width, "y": y + height},
+            {"x": x, "y": y + height},
+        ],
+        "normalizedVertices": [],
+    }
+
+
+def get_word(text, x, y, break_type=1):
+    return {
+        "property": {"detectedLanguages": [], "detectedBreak": None},
+        "boundingBox": get_box(x, y, 10 * len(text), 10),
+        "symbols": [
+            {
+                "property": {
+                    "detectedLanguages": [],
+                    "detectedBreak": (
+                        {"type": break_type, "isPrefix": False}
+                        if idx == len(text) - 1
+                        else None
+                    ),
+                },
+                "boundingBox": get_box(x + 10 * idx, y, 10, 10),
+                "text": char,
+                "confidence": 0.9,
+            }
+            for idx, char in enumerate(text)
+        ],
+        "confidence": 0.9,
+    }
+
+
+def get_response(words, width, height):
+    """Returns a google vision response of a single block of `words`."""
+    paragraph = {
+        "property": None,
+        "boundingBox": get_box(0, 0, width, height),
+        "words": words,
+        "confidence": 0.9,
+    }
+    text_annotations = [
+        {"locale": "bo", "description": "", "boundingPoly": get_box(0, 0, 1, 1)}
+    ]
+    for word in words:
+        text_annotations.append(
+            {
+                "locale": "",
+                "description": "".join(symbol["text"] for symbol in word["symbols"]),
+                "boundingPoly": word["boundingBox"],
+            }
+        )
+    return {
+        "faceAnnotations": [],
+        "textAnnotations": text_annotations,
+        "fullTextAnnotation": {
+            "pages": [
+                {
+                    "property": None,
+                    "width": width,
+                    "height": height,
+                    "blocks": [
+                        {
+                            "property": None,
+                            "boundingBox": get_box(0, 0, width, height),
+                            "paragraphs": [paragraph],
+                            "blockType": 1,
+                            "confidence": 0.9,
+                        }
+                    ],
+                    "confidence": 0.0,
+                }
+            ],
+            "text": "",
+        },
+    }
+
+
+def test_get_mosaic_layout():
+    # act
+    size, tiles = get_mosaic_layout([(100, 50), (80, 40)])
+
+    # assert
+    assert tiles == [
+        Tile(0, 0, 100, 50),
+        Tile(0, 50 + MIN_TILE_GAP, 80, 40),
+    ]
+    assert size == (100, 50 + MIN_TILE_GAP + 40)
+
+
+def test_compose_mosaic():
+    # arrange
+    imgs = [
+        PillowImage.open(io.BytesIO(get_img_bytes((100, 50), mode="1"))),
+        PillowImage.open(io.BytesIO(get_img_bytes((80, 40), mode="L"))),
+    ]
+
+    # act
+    mosaic, tiles = compose_mosaic(imgs)
+
+    # assert
+    with PillowImage.open(io.BytesIO(mosaic)) as img:
+        assert img.format == "PNG"
+        assert img.mode == "L"
+        assert img.size == (100, tiles[1].y + 40)
+        # pages are black on the white background
+        assert img.getpixel((50, 25)) == 0
+        assert img.getpixel((50, 50 + MIN_TILE_GAP // 2)) == 255
+        assert img.getpixel((90, tiles[1].y + 20)) == 255
+
+
+def test_split_response_rebases_words_to_their_tile():
+    # arrange
+    tiles = [Tile(0, 0, 100, 50), Tile(0, 100, 80, 40)]
+    words = [
+        get_word("ab", 0, 10, break_type=1),
+        get_word("c", 30, 10, break_type=5),
+        get_word("de", 5, 110, break_type=3),
+    ]
+    response = get_response(words, width=100, height=140)
+
+    # act
+    tile_responses = split_response(response, tiles)
+
+    # assert
+    first, second = tile_responses
+    assert first["fullTextAnnotation"]["text"] == "ab c\n"
+    assert second["fullTextAnnotation"]["text"] == "de\n"
+    second_page = second["fullTextAnnotation"]["pages"][0]
+    assert (second_page["width"], second_page["height"]) == (80, 40)
+    second_word = second_page["blocks"][0]["paragraphs"][0]["words"][0]
+    assert second_word["boundingBox"]["vertices"][0] == {"x": 5, "y": 10}
+    assert second_word["symbols"][1]["boundingBox"]["vertices"][0] == {
+        "x": 15,
+        "y": 10,
+    }
+    assert second_page["blocks"][0]["boundingBox"]["vertices"][0] == {
+        "x": 5,
+        "y": 10,
+    }
+    assert [ann["description"] for ann in first["textAnnotations"]] == [
+        "ab c\n",
+        "ab",
+        "c",
+    ]
+    assert second["textAnnotations"][0]["locale"] == "bo"
+    assert second["textAnnotations"][1]["boundingPoly"]["vertices"][0] == {
+        "x": 5,
+        "y": 10,
+    }
+    assert second["faceAnnotations"] == []
+    # the mosaic response is left unchanged
+    assert response["fullTextAnnotation"]["pages"][0]["height"] == 140
+
+
+def test_split_response_of_page_without_text():
+    # arrange
+    tiles = [Tile(0, 0, 100, 50), Tile(0, 100, 80, 40)]
+    response = get_response([get_word("ab", 0, 10)], width=100, height=140)
+
+    # act
+    _, second = split_response(response, tiles)
+
+    # assert
+    assert second == {"faceAnnotations": [], "textAnnotations": []}
+
+
+def test_tiling_engine_ocr_batch():
+    # arrange
+    images = [get_img_bytes((100, 50)) for _ in range(3)]
+    images.append(b"not an image")
+    engine = mock.MagicMock()
+    _, tiles = get_mosaic_layout([(100, 50), (100, 50)])
+    mosaic_response = get_response(
+        [get_word("ab", 0, 10), get_word("cd", 0, tiles[1].y + 10)],
+        width=100,
+        height=tiles[1].y + 50,
+    )
+    error = Exception("quota exceeded")
+    engine.ocr_batch.return_value = [mosaic_response, {"single": True}, error]
+    tiling_engine = TilingEngine(engine, max_tiles=2)
+
+    # act
+    results = tiling_engine.ocr_batch_json(images)
+
+    # assert
+    sent_images = engine.ocr_batch.call_args.args[0]
+    assert len(sent_images) == 3
+    with PillowImage.open(io.BytesIO(sent_images[0])) as img:
+        assert img.size == (100, tiles[1].y + 50)
+    assert sent_images[1] is images[2]
+    assert sent_images[2] is images[3]
+    first, second = json.loads(results[0]), json.loads(results[1])
+    assert first["fullTextAnnotation"]["text"] == "ab "
+    assert second["fullTextAnnotation"]["text"] == "cd "
+    assert json.loads(results[2]) == {"single": True}
+    assert results[3] is error
+
+
+def test_tiling_engine_halves_mosaics_above_max_bytes():
+    # arrange
+    images = [get_img_bytes((100, 50)) for _ in range(2)]
+    engine = mock.MagicMock()
+    engine.ocr_batch.return_value = [{}, {}]
+    tiling_engine = TilingEngine(engine, max_tiles=2, max_mosaic_bytes=1)
+
+    # act
+    tiling_engine.ocr_batch(images)
+
+    # assert
+    assert engine.ocr_batch.call_args.args[0] == images
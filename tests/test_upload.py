@@ -1,10 +1,14 @@
+import hashlib
 from pathlib import Path
 from unittest import mock
 
 import pytest
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 
-from ocr_pipelines.exceptions import FailedToAssignBatchError
-from ocr_pipelines.upload import BdrcS3Uploader
+from ocr_pipelines.exceptions import FailedToAssignBatchError, UploadFailedError
+from ocr_pipelines.image_downloader import SourceImage
+from ocr_pipelines.upload import BdrcS3Uploader, UploadReport
 
 
 @pytest.fixture(scope="module")
@@ -41,39 +45,22 @@ def test_get_s3_suffix_for_imagegroup(uploader, imagegroup, expected):
     assert s3_suffix == expected
 
 
-def test_s3_dir_exists_False(uploader):
-    # arrange
-    uploader.client.list_objects_v2 = mock.MagicMock(return_value={"KeyCount": 0})
-
-    # act
-    dir_exits = uploader._BdrcS3Uploader__s3_dir_exists(Path("fake-path"))
-
-    # assert
-    assert not dir_exits
-    assert uploader.client.list_objects_v2.call_count == 1
-    assert uploader.client.list_objects_v2.call_args == mock.call(
-        Bucket=uploader.bucket_name, Prefix="fake-path", MaxKeys=1
-    )
-
-
-def test_s3_dir_exists_True(uploader):
-    # arrange
-    uploader.client.list_objects_v2 = mock.MagicMock(return_value={"KeyCount": 1})
-
-    # act
-    dir_exits = uploader._BdrcS3Uploader__s3_dir_exists(Path("fake-path"))
-
-    # assert
-    assert dir_exits
-    assert uploader.client.list_objects_v2.call_count == 1
-    assert uploader.client.list_objects_v2.call_args == mock.call(
-        Bucket=uploader.bucket_name, Prefix="fake-path", MaxKeys=1
-    )
+def get_batch_listing(*batch_ids):
+    return [
+        {
+            "CommonPrefixes": [
+                {"Prefix": f"Works/67/W1KG12345/google-vision/{batch_id}/"}
+                for batch_id in batch_ids
+            ]
+        }
+    ]
 
 
 def test_get_available_batch_id(uploader):
     # arrange
-    uploader._BdrcS3Uploader__s3_dir_exists = mock.MagicMock(return_value=False)
+    uploader.client = mock.MagicMock()
+    paginator = uploader.client.get_paginator.return_value
+    paginator.paginate.return_value = get_batch_listing("batch-0000", "batch-0001")
 
     # act
     batch_id = uploader._BdrcS3Uploader__get_available_batch_id()
@@ -82,21 +69,59 @@ def test_get_available_batch_id(uploader):
     assert batch_id
     assert batch_id.startswith("batch-")
     assert len(batch_id) == 10
-    assert uploader._BdrcS3Uploader__s3_dir_exists.call_count == 1
-    assert uploader._BdrcS3Uploader__s3_dir_exists.call_args == mock.call(
-        Path(f"Works/67/W1KG12345/google-vision/{batch_id}")
+    assert batch_id not in ["batch-0000", "batch-0001"]
+    paginator.paginate.assert_called_once_with(
+        Bucket=uploader.bucket_name,
+        Prefix="Works/67/W1KG12345/google-vision/batch-",
+        Delimiter="/",
     )
 
 
-def test_get_available_batch_id_cannot_find_id(uploader):
+@mock.patch("ocr_pipelines.upload.uuid")
+def test_get_available_batch_id_cannot_find_id(mock_uuid, uploader):
     # arrange
-    uploader._BdrcS3Uploader__s3_dir_exists = mock.MagicMock(return_value=True)
+    mock_uuid.uuid4.return_value.hex = "0000ffff"
+    uploader.client = mock.MagicMock()
+    paginator = uploader.client.get_paginator.return_value
+    paginator.paginate.return_value = get_batch_listing("batch-0000")
 
     # act
     with pytest.raises(FailedToAssignBatchError):
         uploader._BdrcS3Uploader__get_available_batch_id(n_iter=1)
 
 
+def test_batch_is_reserved_and_cached():
+    # arrange
+    batch_id_cache: dict = {}
+    uploaders = [
+        BdrcS3Uploader(
+            "W1KG12345",
+            "google-vision",
+            reserve_batch=True,
+            batch_id_cache=batch_id_cache,
+        )
+        for _ in range(2)
+    ]
+    for uploader in uploaders:
+        uploader.client = mock.MagicMock()
+        paginator = uploader.client.get_paginator.return_value
+        paginator.paginate.return_value = get_batch_listing("batch-0000")
+
+    # act
+    batch_ids = [uploader.batch for uploader in uploaders]
+
+    # assert
+    assert batch_ids[0] == batch_ids[1]
+    assert batch_id_cache == {"W1KG12345/google-vision": batch_ids[0]}
+    uploaders[0].client.put_object.assert_called_once_with(
+        Bucket="ocr.bdrc.io",
+        Key=f"Works/67/W1KG12345/google-vision/{batch_ids[0]}/.reserved",
+        Body=b"",
+    )
+    assert uploaders[1].client.get_paginator.call_count == 0
+    assert uploaders[1].client.put_object.call_count == 0
+
+
 def test_base_dir():
     # arrange
     bdrc_scan_id = "W1KG12345"
@@ -186,14 +211,15 @@ def test_upload_ocr_images(uploader, ocr_images_or_outputs_dir):
     # arrange
     ocr_images_dir = ocr_images_or_outputs_dir
     uploader._batch = "batch-1"
-    uploader.bucket.put_object = mock.MagicMock()
+    uploader.client = mock.MagicMock()
 
     # act
     uploader.upload_ocr_images(ocr_images_dir)
 
     # assert
-    assert uploader.bucket.put_object.call_count == 1
-    assert uploader.bucket.put_object.call_args == mock.call(
+    assert uploader.client.put_object.call_count == 1
+    assert uploader.client.put_object.call_args == mock.call(
+        Bucket="ocr.bdrc.io",
         Key="Works/67/W1KG12345/google-vision/batch-1/images/W1KG12345-1234/ocr_output.json",
         Body=b"{}",
     )
@@ -202,26 +228,313 @@ def test_upload_ocr_images(uploader, ocr_images_or_outputs_dir):
 def test_upload_ocr_outputs(uploader, ocr_images_or_outputs_dir):
     # arrange
     ocr_outputs_dir = ocr_images_or_outputs_dir
-    uploader.bucket = mock.MagicMock()
+    uploader.client = mock.MagicMock()
 
     # act
     uploader.upload_ocr_outputs(ocr_outputs_dir)
 
     # assert
-    assert uploader.bucket.put_object.call_count == 1
+    assert uploader.client.put_object.call_count == 1
+
+
+def test_upload_ocr_outputs_skips_partial_writes(uploader, ocr_images_or_outputs_dir):
+    # arrange
+    ocr_outputs_dir = ocr_images_or_outputs_dir
+    (ocr_outputs_dir / "I1234" / ".ocr_output_2.json.gz.tmp").write_bytes(b"{")
+    uploader.client = mock.MagicMock()
+
+    # act
+    uploader.upload_ocr_outputs(ocr_outputs_dir)
+
+    # assert
+    assert uploader.client.put_object.call_count == 1
+
+
+def test_upload_ocr_outputs_archives(uploader, tmp_path):
+    # arrange
+    ocr_outputs_dir = tmp_path / "W1KG12345"
+    ocr_outputs_dir.mkdir()
+    (ocr_outputs_dir / "I1234.zip").write_bytes(b"fake-archive")
+    uploader._batch = "batch-1"
+    uploader.client = mock.MagicMock()
+
+    # act
+    uploader.upload_ocr_outputs(ocr_outputs_dir)
+
+    # assert
+    assert uploader.client.put_object.call_args_list == [
+        mock.call(
+            Bucket="ocr.bdrc.io",
+            Key="Works/67/W1KG12345/google-vision/batch-1/output/W1KG12345-1234.zip",
+            Body=b"fake-archive",
+        )
+    ]
+
+
+@pytest.fixture
+def ocr_images_dir(tmp_path):
+    ocr_images_dir = tmp_path / "W1KG12345"
+    for imagegroup in ["I1234", "I1235"]:
+        local_imagegroup_dir = ocr_images_dir / imagegroup
+        local_imagegroup_dir.mkdir(parents=True)
+        for i in range(1, 6):
+            (local_imagegroup_dir / f"{imagegroup}000{i}.jpg").write_bytes(b"image")
+    return ocr_images_dir
+
+
+def test_upload_ocr_images_concurrently(ocr_images_dir):
+    # arrange
+    transfer_config = TransferConfig(multipart_threshold=1024)
+    uploader = BdrcS3Uploader(
+        "W1KG12345", "google-vision", max_workers=4, transfer_config=transfer_config
+    )
+    uploader._batch = "batch-1"
+    uploader.client = mock.MagicMock()
+
+    def fake_upload_file(filename, bucket, key, Config, Callback):
+        Callback(len(b"image"))
+
+    uploader.client.upload_file.side_effect = fake_upload_file
+
+    # act
+    uploader.upload_ocr_images(ocr_images_dir)
+
+    # assert
+    assert uploader.client.put_object.call_count == 0
+    assert uploader.client.upload_file.call_count == 10
+    assert (
+        mock.call(
+            str(ocr_images_dir / "I1234" / "I12340001.jpg"),
+            "ocr.bdrc.io",
+            "Works/67/W1KG12345/google-vision/batch-1/images/W1KG12345-1234/I12340001.jpg",
+            Config=transfer_config,
+            Callback=mock.ANY,
+        )
+        in uploader.client.upload_file.call_args_list
+    )
+
+
+def test_upload_files_reports_failures(ocr_images_dir):
+    # arrange
+    uploader = BdrcS3Uploader("W1KG12345", "google-vision", max_workers=4)
+    uploader.client = mock.MagicMock()
+    failed_image = ocr_images_dir / "I1235" / "I12350003.jpg"
+
+    def fake_upload_file(filename, bucket, key, Config, Callback):
+        if filename == str(failed_image):
+            raise ValueError("fake error")
+        Callback(len(b"image"))
+
+    uploader.client.upload_file.side_effect = fake_upload_file
+    files = [(image, image.name) for image in sorted(ocr_images_dir.glob("*/*"))]
+
+    # act and assert
+    with pytest.raises(UploadFailedError, match="1 of 10 files failed to upload"):
+        uploader.upload_files(files)
+    assert uploader.client.upload_file.call_count == 10
+
+
+def test_upload_report():
+    # arrange
+    report = UploadReport([])
+
+    # act
+    report.add_bytes(5)
+    report.add_uploaded(Path("I12340001.jpg"))
+    report.add_failure(Path("I12340002.jpg"), ValueError("fake error"))
+
+    # assert
+    assert report.uploaded_files == 1
+    assert report.uploaded_bytes == 5
+    assert list(report.failed) == [Path("I12340002.jpg")]
+    assert report.summary() == (
+        "uploaded 1/0 files (5/0 bytes), skipped 0 files (0 bytes), "
+        "copied 0 files (0 bytes), 1 failed"
+    )
+
+
+def test_upload_ocr_images_sync_skips_uploaded_images(ocr_images_dir):
+    # arrange
+    uploader = BdrcS3Uploader(
+        "W1KG12345",
+        "google-vision",
+        batch="batch-1",
+        transfer_config=TransferConfig(multipart_chunksize=2),
+        sync=True,
+    )
+    images_dir = "Works/67/W1KG12345/google-vision/batch-1/images"
+    uploaded_image = f"{images_dir}/W1KG12345-1234/I12340001.jpg"
+    multipart_uploaded_image = f"{images_dir}/W1KG12345-1234/I12340002.jpg"
+    changed_image = f"{images_dir}/W1KG12345-1234/I12340003.jpg"
+    part_md5s = [hashlib.md5(part).digest() for part in [b"im", b"ag", b"e"]]
+    multipart_etag = f"{hashlib.md5(b''.join(part_md5s)).hexdigest()}-3"
+    uploader.client = mock.MagicMock()
+    paginator = uploader.client.get_paginator.return_value
+    paginator.paginate.return_value = [
+        {
+            "Contents": [
+                {
+                    "Key": uploaded_image,
+                    "Size": 5,
+                    "ETag": f'"{hashlib.md5(b"image").hexdigest()}"',
+                },
+            ]
+        },
+        {
+            "Contents": [
+                {
+                    "Key": multipart_uploaded_image,
+                    "Size": 5,
+                    "ETag": f'"{multipart_etag}"',
+                },
+                {"Key": changed_image, "Size": 5, "ETag": '"changed"'},
+            ]
+        },
+    ]
+
+    # act
+    report = uploader.upload_files(
+        [
+            (image, uploader.get_ocr_image_key(image))
+            for image in sorted(ocr_images_dir.glob("*/*"))
+        ]
+    )
+
+    # assert
+    paginator.paginate.assert_called_once_with(
+        Bucket="ocr.bdrc.io", Prefix="Works/67/W1KG12345/google-vision/batch-1/"
+    )
+    uploaded_keys = [
+        call.args[2] for call in uploader.client.upload_file.call_args_list
+    ]
+    assert len(uploaded_keys) == 8
+    assert changed_image in uploaded_keys
+    assert uploaded_image not in uploaded_keys
+    assert multipart_uploaded_image not in uploaded_keys
+    assert report.skipped_files == 2
+    assert report.skipped_bytes == 10
+
+
+def test_upload_ocr_images_copies_unchanged_source_images(ocr_images_dir):
+    # arrange
+    unchanged_image = ocr_images_dir / "I1234" / "I12340001.jpg"
+    converted_image = ocr_images_dir / "I1234" / "I12340002.jpg"
+    source_images = {
+        unchanged_image: SourceImage(
+            key="Works/67/W1KG12345/images/W1KG12345-1234/I12340001.jpg",
+            md5=hashlib.md5(b"image").hexdigest(),
+        ),
+        converted_image: SourceImage(
+            key="Works/67/W1KG12345/images/W1KG12345-1234/I12340002.tif",
+            md5=hashlib.md5(b"tiff-image").hexdigest(),
+        ),
+    }
+    uploader = BdrcS3Uploader(
+        "W1KG12345", "google-vision", batch="batch-1", source_images=source_images
+    )
+    uploader.client = mock.MagicMock()
+
+    # act
+    report = uploader.upload_files(
+        [
+            (image, uploader.get_ocr_image_key(image))
+            for image in sorted(ocr_images_dir.glob("*/*"))
+        ]
+    )
+
+    # assert
+    uploader.client.copy_object.assert_called_once_with(
+        Bucket="ocr.bdrc.io",
+        Key="Works/67/W1KG12345/google-vision/batch-1/images/W1KG12345-1234/I12340001.jpg",
+        CopySource={
+            "Bucket": "archive.tbrc.org",
+            "Key": "Works/67/W1KG12345/images/W1KG12345-1234/I12340001.jpg",
+        },
+    )
+    uploaded_keys = [
+        call.kwargs["Key"] for call in uploader.client.put_object.call_args_list
+    ]
+    assert len(uploaded_keys) == 9
+    assert (
+        "Works/67/W1KG12345/google-vision/batch-1/images/W1KG12345-1234/I12340002.jpg"
+        in uploaded_keys
+    )
+    assert report.copied_files == 1
+    assert report.copied_bytes == 5
+
+
+def test_copy_source_image_falls_back_to_upload(ocr_images_dir):
+    # arrange
+    image = ocr_images_dir / "I1234" / "I12340001.jpg"
+    source_images = {
+        image: SourceImage(
+            key="Works/67/W1KG12345/images/W1KG12345-1234/I12340001.jpg",
+            md5=hashlib.md5(b"image").hexdigest(),
+        )
+    }
+    uploader = BdrcS3Uploader(
+        "W1KG12345", "google-vision", batch="batch-1", source_images=source_images
+    )
+    uploader.client = mock.MagicMock()
+    uploader.client.copy_object.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "CopyObject"
+    )
+
+    # act
+    uploader.upload_ocr_image(image)
+
+    # assert
+    uploader.client.copy_object.assert_called_once()
+    uploader.client.put_object.assert_called_once()
+
+
+def test_upload_ocr_image_bytes(tmp_path):
+    # arrange
+    img_group_dir = tmp_path / "I1234"
+    img_group_dir.mkdir()
+    unchanged_image = img_group_dir / "I12340001.jpg"
+    converted_image = img_group_dir / "I12340002.png"
+    source_images = {
+        unchanged_image: SourceImage(
+            key="Works/67/W1KG12345/images/W1KG12345-1234/I12340001.jpg",
+            md5=hashlib.md5(b"image").hexdigest(),
+        ),
+        converted_image: SourceImage(
+            key="Works/67/W1KG12345/images/W1KG12345-1234/I12340002.tif",
+            md5=hashlib.md5(b"tiff-image").hexdigest(),
+        ),
+    }
+    uploader = BdrcS3Uploader(
+        "W1KG12345", "google-vision", batch="batch-1", source_images=source_images
+    )
+    uploader.client = mock.MagicMock()
+
+    # act
+    uploader.upload_ocr_image_bytes(unchanged_image, b"image")
+    uploader.upload_ocr_image_bytes(converted_image, b"png-image")
+
+    # assert
+    uploader.client.copy_object.assert_called_once()
+    assert not unchanged_image.exists()
+    assert converted_image.read_bytes() == b"png-image"
+    uploader.client.put_object.assert_called_once_with(
+        Bucket="ocr.bdrc.io",
+        Key="Works/67/W1KG12345/google-vision/batch-1/images/W1KG12345-1234/I12340002.png",
+        Body=b"png-image",
+    )
 
 
 def test_upload_metadata(uploader):
     # arrange
     uploader._batch = "batch-1"
-    uploader.bucket = mock.MagicMock()
+    uploader.client = mock.MagicMock()
     fake_metadata = {"fake": "metadata"}
 
     # act
     uploader.upload_metadata(fake_metadata)
 
     # assert
-    assert uploader.bucket.put_object.call_count == 1
+    assert uploader.client.put_object.call_count == 1
 
 
 def test_upload(uploader, ocr_images_or_outputs_dir):